@@ -0,0 +1,76 @@
+"""
+Tile decode throughput: dask-task-at-a-time decode versus the decode pool
+
+    python benchmarks/bench_decode.py [--size 4096] [--compression zlib lzw] [--workers 4] [--batch 1 4]
+
+Caching is disabled so every run decodes every tile.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import dask
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from synthetic import write_synthetic_ome_tiff
+from daskrw.cache import TileCache
+from daskrw.reader import TiledImageReader
+
+
+def tiles_per_second(file_path, n_tiles, **reader_kwargs):
+    reader = TiledImageReader(file_path, cache=TileCache(max_size=0), **reader_kwargs)
+    data = reader.read_tiled(series=0)
+    start = time.perf_counter()
+    data.compute()
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return n_tiles / elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--tile", type=int, default=256)
+    parser.add_argument("--compression", nargs="+", default=["zlib", "lzw"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--scheduler", default="threads", help="dask scheduler for the compute")
+    args = parser.parse_args(argv)
+
+    n_tiles = args.channels * (-(-args.size // args.tile)) ** 2
+    print(f"{n_tiles} tiles per run, {args.workers} decode workers")
+    print(f"{'compression':>12} {'mode':>24} {'tiles/s':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir, dask.config.set(scheduler=args.scheduler):
+        for compression in args.compression:
+            file_path = os.path.join(tmpdir, f"{compression}.ome.tiff")
+            write_synthetic_ome_tiff(
+                file_path,
+                shape=(1, args.channels, 1, args.size, args.size),
+                tile=args.tile,
+                levels=1,
+                dtype="uint16",
+                compression=compression,
+            )
+
+            rate = tiles_per_second(file_path, n_tiles)
+            print(f"{compression:>12} {'per-task decode':>24} {rate:>10.0f}")
+            for kind in ("thread", "process"):
+                for batch in args.batch:
+                    rate = tiles_per_second(
+                        file_path,
+                        n_tiles,
+                        decode_workers=args.workers,
+                        decode_executor=kind,
+                        decode_batch=batch,
+                    )
+                    print(f"{compression:>12} {f'{kind} pool, batch {batch}':>24} {rate:>10.0f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Open-to-first-metadata latency versus number of TIFF pages
+
+    python benchmarks/bench_metadata.py [--pages 2 16 256 1024] [--repeat 5]
+
+Compares `get_series_metadata()` on a fresh reader (reads only the first IFD,
+its SubIFDs and the OME XML) against the full page walk it used to do.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from synthetic import write_synthetic_ome_tiff
+from daskrw.reader import TiledImageReader
+
+
+def time_it(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return median(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 16, 256, 1024])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'pages':>8} {'fast (ms)':>12} {'full walk (ms)':>16} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_pages in args.pages:
+            file_path = os.path.join(tmpdir, f"pages{n_pages}.ome.tiff")
+            # spread pages over channels and z, keep planes small
+            size_c = max(2, min(n_pages, 8))
+            size_z = max(1, n_pages // size_c)
+            write_synthetic_ome_tiff(
+                file_path, shape=(1, size_c, size_z, 256, 256), tile=128, levels=2
+            )
+
+            fast = time_it(lambda: TiledImageReader(file_path).get_series_metadata(), args.repeat)
+            full = time_it(
+                lambda: TiledImageReader(file_path).get_full_metadata(include_tags=False),
+                args.repeat,
+            )
+            print(f"{size_c * size_z:>8} {fast * 1e3:>12.2f} {full * 1e3:>16.2f} {full / fast:>8.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
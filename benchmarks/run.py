@@ -0,0 +1,272 @@
+"""
+Reader/writer benchmark suite, results are written as json to compare across commits
+
+    python benchmarks/run.py [--size 2048] [--tile 256 512] [--channels 3] [--dtype uint8 uint16]
+                             [--compression none zlib] [--interleaved no yes]
+                             [--compressors blosc zstd none] [--write-chunks 256 1024]
+                             [--output results.json]
+
+For every combination of the source options a synthetic ome-tiff is generated
+and measured for:
+  metadata-open latency, full-level read throughput, random 512x512 ROI
+  latency, channel-batched versus per-channel reads, and `write_tiled`
+  throughput per compressor and chunk shape.
+Every measurement runs in a fresh process, which reports its own peak RSS.
+Caching is disabled, so reads always decode.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import platform
+import argparse
+import itertools
+import subprocess
+import tempfile
+import multiprocessing
+from statistics import median
+
+import numpy
+import dask
+import dask.array
+import zarr
+import tifffile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from synthetic import write_synthetic_ome_tiff
+from daskrw.cache import TileCache
+from daskrw.reader import TiledImageReader
+from daskrw.writer import TiledImageWriter
+
+try:
+    import resource
+except ImportError:
+    # not on windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def uncached_reader(file_path):
+    return TiledImageReader(file_path, cache=TileCache(max_size=0))
+
+
+def level_nbytes(reader):
+    res = reader._res[0]
+    meta = reader._meta
+    return res["height"] * res["width"] * res["channels"] * meta["z_size"] * meta["t_size"] \
+        * numpy.dtype(meta["dtype"]).itemsize
+
+
+def bench_metadata_open(file_path, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        TiledImageReader(file_path).get_series_metadata()
+        timings.append(time.perf_counter() - start)
+    return {"median_ms": median(timings) * 1e3}
+
+
+def bench_read_level(file_path):
+    reader = uncached_reader(file_path)
+    data = reader.read_tiled(series=0, z=slice(None), t=slice(None))
+    start = time.perf_counter()
+    data.compute()
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "mb_per_s": level_nbytes(reader) / elapsed / 2**20}
+
+
+def bench_random_roi(file_path, n=50, size=512, seed=0):
+    reader = uncached_reader(file_path)
+    res = reader._res[0]
+    rng = numpy.random.default_rng(seed)
+    # open the levels before timing
+    reader.read_region(0, 0, 1, 1)
+    timings = []
+    for _ in range(n):
+        x = int(rng.integers(0, max(1, res["width"] - size)))
+        y = int(rng.integers(0, max(1, res["height"] - size)))
+        start = time.perf_counter()
+        reader.read_region(x, y, size, size)
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_ms": median(timings) * 1e3,
+        "p95_ms": float(numpy.percentile(timings, 95)) * 1e3,
+    }
+
+
+def bench_channel_batch(file_path):
+    reader = uncached_reader(file_path)
+    channels = list(range(min(4, reader._res[0]["channels"])))
+
+    start = time.perf_counter()
+    reader.read_tiled(series=0, c=channels).compute()
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dask.compute(*[reader.read_tiled(series=0, c=c) for c in channels])
+    separate = time.perf_counter() - start
+    return {"channels": len(channels), "batched_s": batched, "separate_s": separate}
+
+
+def bench_write_tiled(file_path, compressor, chunk, tmpdir):
+    reader = TiledImageReader(file_path)
+    meta = reader.get_series_metadata()
+    # level 0 only, read into memory first so only the write is timed
+    data = reader.read_tiled(series=0, z=slice(None), t=slice(None))
+    if data.ndim == 4:
+        data = data[..., None]
+    data = dask.array.from_array(data.transpose(0, 4, 1, 2, 3).compute(), chunks=(1, 1, 1, chunk, chunk))
+    img_shapes = [(meta["SizeT"][0], meta["SizeC"][0], meta["SizeZ"][0], meta["SizeY"][0], meta["SizeX"][0])]
+
+    writer = TiledImageWriter(
+        os.path.join(tmpdir, f"write-{compressor}-{chunk}.ome.zarr"),
+        img_shapes,
+        compressor=None if compressor == "none" else compressor,
+        chunks=(1, 1, 1, chunk, chunk),
+    )
+    start = time.perf_counter()
+    writer.write_tiled(data, series=0)
+    elapsed = time.perf_counter() - start
+    stored = zarr.open(writer.file_path)["0"].nbytes_stored
+    writer.delete()
+    return {
+        "seconds": elapsed,
+        "mb_per_s": data.nbytes / elapsed / 2**20,
+        "ratio": data.nbytes / max(stored, 1),
+    }
+
+
+BENCHMARKS = {
+    "metadata_open": bench_metadata_open,
+    "read_level": bench_read_level,
+    "random_roi": bench_random_roi,
+    "channel_batch": bench_channel_batch,
+    "write_tiled": bench_write_tiled,
+}
+
+
+def _run_child(name, args, results):
+    baseline = peak_rss_mb()
+    result = BENCHMARKS[name](*args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["baseline_rss_mb"] = baseline
+    results.put(result)
+
+
+def run_isolated(name, *args):
+    """Run one benchmark in a fresh process, so its peak RSS is its own"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_child, args=(name, args, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            # e.g. crashed or OOM-killed, never putting a result
+            if not process.is_alive() and results.empty():
+                process.join()
+                raise RuntimeError(f"benchmark {name} failed, exit code {process.exitcode}")
+    process.join()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, nargs="+", default=[2048])
+    parser.add_argument("--tile", type=int, nargs="+", default=[256])
+    parser.add_argument("--channels", type=int, nargs="+", default=[3])
+    parser.add_argument("--dtype", nargs="+", default=["uint8", "uint16"])
+    parser.add_argument("--compression", nargs="+", default=["none", "zlib"])
+    parser.add_argument("--interleaved", nargs="+", choices=["no", "yes"], default=["no", "yes"])
+    parser.add_argument("--compressors", nargs="+", default=["blosc", "zstd", "none"],
+                        help="writer compressors, see daskrw.writer.make_codecs")
+    parser.add_argument("--write-chunks", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "versions": {
+            "dask": dask.__version__,
+            "zarr": zarr.__version__,
+            "tifffile": tifffile.__version__,
+            "numpy": numpy.__version__,
+        },
+        "cpus": os.cpu_count(),
+        "results": [],
+    }
+
+    print(f"{'source':>44} {'benchmark':>24} {'result':>24} {'peak RSS':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size, tile, channels, dtype, compression, interleaved in itertools.product(
+            args.size, args.tile, args.channels, args.dtype, args.compression, args.interleaved
+        ):
+            source = {
+                "size": size,
+                "tile": tile,
+                "channels": channels,
+                "dtype": dtype,
+                "compression": compression,
+                "interleaved": interleaved == "yes",
+            }
+            label = f"{size}px t{tile} c{channels} {dtype} {compression}{' interleaved' if interleaved == 'yes' else ''}"
+            file_path = os.path.join(tmpdir, "source.ome.tiff")
+            write_synthetic_ome_tiff(
+                file_path,
+                shape=(1, channels, 1, size, size),
+                tile=tile,
+                levels=3,
+                dtype=dtype,
+                compression=None if compression == "none" else compression,
+                interleaved=interleaved == "yes",
+            )
+
+            cases = [(name, (file_path,), {}) for name in ("metadata_open", "read_level", "random_roi", "channel_batch")]
+            cases += [
+                ("write_tiled", (file_path, compressor, chunk, tmpdir), {"compressor": compressor, "chunk": chunk})
+                for compressor in args.compressors
+                for chunk in args.write_chunks
+            ]
+            for name, bench_args, params in cases:
+                result = run_isolated(name, *bench_args)
+                report["results"].append({"benchmark": name, "source": source, "params": params, "result": result})
+
+                summary = ", ".join(
+                    f"{k}={v:.1f}" for k, v in result.items()
+                    if k in ("median_ms", "mb_per_s", "batched_s") and v is not None
+                )
+                name_params = name + "".join(f" {v}" for v in params.values())
+                rss = result["peak_rss_mb"]
+                print(f"{label:>44} {name_params:>24} {summary:>24} {'' if rss is None else f'{rss:.0f} MB':>10}")
+
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Generate synthetic tiled/pyramidal ome-tiffs to benchmark against
+"""
+import numpy
+import tifffile
+
+
+def write_synthetic_ome_tiff(file_path,
+                             shape=(1, 1, 1, 1024, 1024),
+                             tile=256,
+                             levels=2,
+                             dtype="uint8",
+                             compression=None,
+                             interleaved=False,
+                             seed=0,
+                             ):
+    """Write a tiled ome-tiff, with `levels - 1` factor-2 SubIFD pyramid levels.
+    :param shape: t, c, z, y, x sizes (in that order)
+    :param tile: tile height and width
+    :param compression: tifffile compression, e.g. None, "zlib", "lzw", "jpeg"
+    :param interleaved: store channels as samples of one (chunky) page,
+           instead of one page per channel
+    """
+    size_t, size_c, size_z, size_y, size_x = shape
+    rng = numpy.random.default_rng(seed)
+
+    # smooth-ish content, so compressed sizes are realistic rather than noise
+    yy, xx = numpy.mgrid[0:size_y, 0:size_x]
+    base = ((numpy.sin(yy / 37.0) + numpy.cos(xx / 23.0) + 2) * 0.25)
+    if numpy.issubdtype(numpy.dtype(dtype), numpy.integer):
+        base = base * numpy.iinfo(dtype).max
+    plane = base.astype(dtype)
+
+    data = numpy.empty(shape, dtype=dtype)
+    for t in range(size_t):
+        for c in range(size_c):
+            for z in range(size_z):
+                noise = rng.integers(0, 8, size=(size_y, size_x)).astype(dtype)
+                data[t, c, z] = plane + noise
+
+    if interleaved:
+        data = numpy.moveaxis(data, 1, -1)
+        axes = "TZYXC"
+        photometric = "rgb" if size_c == 3 else "minisblack"
+    else:
+        axes = "TCZYX"
+        photometric = "minisblack"
+
+    options = dict(
+        tile=(tile, tile),
+        compression=compression,
+        photometric=photometric,
+    )
+    if interleaved:
+        options["planarconfig"] = "contig"
+
+    with tifffile.TiffWriter(file_path, bigtiff=True, ome=True) as tif:
+        tif.write(data, subifds=levels - 1, metadata={"axes": axes}, **options)
+        for level in range(1, levels):
+            step = 2 ** level
+            if interleaved:
+                level_data = data[:, :, ::step, ::step]
+            else:
+                level_data = data[..., ::step, ::step]
+            tif.write(level_data, subfiletype=1, **options)
+
+    return file_path
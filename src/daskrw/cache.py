@@ -0,0 +1,582 @@
+import os
+import sys
+import json
+import mmap
+import heapq
+import threading
+from itertools import count
+from concurrent.futures import Future
+from collections import OrderedDict
+from typing import TypedDict, Literal, Optional, Any, Hashable, Sequence, Mapping
+
+import numpy
+from zarr.storage import BaseStore
+
+from .decode import TileDecoder, coalesce_ranges
+from .stats import Stats, timed
+
+ZARR_META_KEYS = ('.zarray', '.zattrs', '.zgroup')
+
+# private attributes of tifffile's ZarrTiffStore that the direct tile reads
+# (raw bytes, coalesced reads, memory map) rely on, they vary between versions
+STORE_INTERNALS = ('_parse_key', '_filecache', '_transform', '_chunkmode')
+
+CachePolicy = Literal["lru", "size"]
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    evictions: int
+    nbytes: int
+    entries: int
+    max_size: int
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, numpy.ndarray):
+        return value.nbytes
+    return len(value)
+
+
+class TileCache:
+    """
+    Thread-safe, byte-bounded cache of image tiles
+
+    Entries are evicted once the total size exceeds `max_size` bytes, either
+    least recently used first (`"lru"`), or with a size-aware GreedyDual-Size
+    policy (`"size"`) which prefers to evict large, rarely hit tiles over small
+    hot ones.
+    """
+
+    def __init__(self, max_size: int = 2**29, policy: CachePolicy = "lru"):
+        """
+        @param max_size: byte budget of the cache
+        @param policy: eviction policy, "lru" or "size"
+        """
+        if policy not in ("lru", "size"):
+            raise ValueError(f"Unsupported cache policy: {policy}")
+
+        self.max_size = max_size
+        self.policy = policy
+
+        self.__lock = threading.RLock()
+        self.__entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.__nbytes = 0
+        # GreedyDual-Size state
+        self.__inflation = 0.0
+        # order of the live heap entry of each key, older entries are stale
+        self.__heap_orders: dict[Hashable, int] = dict()
+        self.__heap: list[tuple[float, int, Hashable]] = []
+        self.__counter = count()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __touch(self, key, nbytes: int):
+        if self.policy == "lru":
+            self.__entries.move_to_end(key)
+        else:
+            priority = self.__inflation + 1.0 / max(nbytes, 1)
+            order = next(self.__counter)
+            self.__heap_orders[key] = order
+            heapq.heappush(self.__heap, (priority, order, key))
+            self.__compact_heap()
+
+    def __compact_heap(self):
+        """Drop the heap entries made stale by hits and removals, once they
+        outnumber the live ones, so a cache that never evicts stays bounded
+        """
+        if len(self.__heap) <= 2 * len(self.__entries):
+            return
+        self.__heap = [entry for entry in self.__heap if self.__heap_orders.get(entry[2]) == entry[1]]
+        heapq.heapify(self.__heap)
+
+    def __pop_victim(self):
+        if self.policy == "lru":
+            return self.__entries.popitem(last=False)
+
+        while self.__heap:
+            priority, order, key = heapq.heappop(self.__heap)
+            # skip heap entries made stale by a later hit or removal
+            if self.__heap_orders.get(key) != order:
+                continue
+            del self.__heap_orders[key]
+            self.__inflation = priority
+            return key, self.__entries.pop(key)
+
+        return self.__entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return default
+            self.__hits += 1
+            self.__touch(key, entry[1])
+            return entry[0]
+
+    def put(self, key, value) -> int:
+        """Cache a value, returns the number of entries evicted to make room"""
+        nbytes = _nbytes(value)
+        if nbytes > self.max_size:
+            return 0
+
+        evicted = 0
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            while self.__entries and self.__nbytes + nbytes > self.max_size:
+                _, (_, victim_nbytes) = self.__pop_victim()
+                self.__nbytes -= victim_nbytes
+                evicted += 1
+            self.__evictions += evicted
+            self.__entries[key] = (value, nbytes)
+            self.__nbytes += nbytes
+            self.__touch(key, nbytes)
+        return evicted
+
+    def __remove(self, key):
+        _, nbytes = self.__entries.pop(key)
+        self.__heap_orders.pop(key, None)
+        self.__nbytes -= nbytes
+        self.__compact_heap()
+
+    def invalidate(self, file_key: Optional[Hashable] = None):
+        """Drop all entries, or only those of one file
+        @param file_key: as returned by `file_cache_key`
+        """
+        with self.__lock:
+            if file_key is None:
+                self.__entries.clear()
+                self.__heap_orders.clear()
+                self.__heap.clear()
+                self.__nbytes = 0
+                return
+            for key in [k for k in self.__entries if k[0] == file_key]:
+                self.__remove(key)
+
+    def stats(self) -> CacheStats:
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "nbytes": self.__nbytes,
+                "entries": len(self.__entries),
+                "max_size": self.max_size,
+            }
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__hits = 0
+            self.__misses = 0
+            self.__evictions = 0
+
+
+_shared_cache: Optional[TileCache] = None
+_shared_cache_lock = threading.Lock()
+
+def shared_tile_cache() -> TileCache:
+    """The process-wide cache used by readers not given one explicitly"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TileCache()
+        return _shared_cache
+
+def set_shared_tile_cache(cache: TileCache):
+    """Replace the process-wide cache, e.g. to change its budget or policy"""
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = cache
+
+def file_cache_key(file_path) -> tuple[str, int, int]:
+    """Identify a file by path, size and mtime, so a rewritten file never hits stale tiles"""
+    stat = os.stat(file_path)
+    return (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+class CachedTiffStore(BaseStore):
+    """
+    Read-only zarr store caching the chunks of a tifffile ZarrTiffStore
+
+    With `cache_decoded`, decoded tiles are cached, so repeat reads skip both
+    I/O and decompression; otherwise only the raw (compressed) tile bytes are
+    cached, which is more compact but decodes on every read.
+
+    With a `decoder`, the chunks requested together by zarr (all tiles of one
+    dask chunk) are fetched with coalesced reads and decoded concurrently.
+
+    Concurrent requests for the same chunk are single-flight: the first one
+    reads and decodes it, the others wait for its result.
+
+    With `use_mmap`, tiles of levels stored uncompressed are served as
+    read-only numpy views over a memory map of the file, bypassing both the
+    read into fresh bytes and the cache.
+
+    If the tifffile store lacks any of `STORE_INTERNALS`, tiles are only read
+    through the store itself, and cached decoded: there is no raw bytes
+    cache, decode pool or memory map.
+    """
+
+    _writeable = False
+    _erasable = False
+
+    def __init__(self,
+                 store,
+                 file_path,
+                 cache: TileCache,
+                 cache_decoded: bool = True,
+                 decoder: Optional[TileDecoder] = None,
+                 use_mmap: bool = True,
+                 stats: Optional[Stats] = None,
+                 ):
+        self.__store = store
+        self.__file_path = file_path
+        self.__cache = cache
+        self.__cache_decoded = cache_decoded
+        self.__decoder = decoder
+        self.__file_key = file_cache_key(file_path)
+        self.__stats = stats
+        self.__inflight: dict[str, Future] = dict()
+        self.__inflight_lock = threading.Lock()
+        self.__direct = all(hasattr(store, name) for name in STORE_INTERNALS)
+
+        self.__use_mmap = use_mmap
+        self.__mmap: Optional[mmap.mmap] = None
+        # per level, (chunk shape, dtype) if its tiles can be mapped, else None
+        self.__mmap_levels: dict[int, Optional[tuple[tuple[int, ...], numpy.dtype]]] = dict()
+
+    @property
+    def cache(self) -> TileCache:
+        return self.__cache
+
+    def __cache_get(self, cache_key):
+        value = self.__cache.get(cache_key)
+        if self.__stats is not None:
+            self.__stats.add("cache_misses" if value is None else "cache_hits")
+        return value
+
+    def __cache_put(self, cache_key, value):
+        evicted = self.__cache.put(cache_key, value)
+        if self.__stats is not None and evicted:
+            self.__stats.add("cache_evictions", evicted)
+
+    def __count_read(self, nbytes: int, tiles: int = 1):
+        if self.__stats is not None:
+            self.__stats.add("tiles_read", tiles)
+            self.__stats.add("bytes_read", nbytes)
+
+    def __count_decoded(self, tiles: int = 1):
+        if self.__stats is not None:
+            self.__stats.add("tiles_decoded", tiles)
+
+    def __parse_key(self, key: str):
+        keyframe, page, chunkindex, offset, bytecount = self.__store._parse_key(key)
+        if page is None or offset == 0 or bytecount == 0:
+            raise KeyError(key)
+        return keyframe, page, chunkindex, offset, bytecount
+
+    @staticmethod
+    def __decodeargs(keyframe, page) -> dict[str, Any]:
+        decodeargs: dict[str, Any] = {'_fullsize': True}
+        if page.jpegtables is not None:
+            decodeargs['jpegtables'] = page.jpegtables
+        if keyframe.jpegheader is not None:
+            decodeargs['jpegheader'] = keyframe.jpegheader
+        return decodeargs
+
+    def __mmap_level(self, level: int, keyframe, page):
+        """(chunk shape, dtype) of a level whose tiles are stored as-is, or None"""
+        if level in self.__mmap_levels:
+            return self.__mmap_levels[level]
+
+        mappable = None
+        store = self.__store
+        zarray = json.loads(store[f"{level}/.zarray"] if f"{level}/.zarray" in store else store[".zarray"])
+        dtype = numpy.dtype(zarray["dtype"])
+        chunks = tuple(zarray["chunks"])
+        fh = page.parent.filehandle
+        if (
+            keyframe.is_tiled
+            and keyframe.compression == 1
+            and keyframe.predictor == 1
+            and keyframe.fillorder == 1
+            and keyframe.bitspersample == dtype.itemsize * 8
+            and store._transform is None
+            and not store._chunkmode
+            and dtype.byteorder in ("=", "|", keyframe.parent.byteorder)
+            and (keyframe.parent.byteorder == "<") == (sys.byteorder == "little")
+            # zarr chunks of planes of a series have leading length-1 axes
+            and chunks[len(chunks) - len(keyframe.chunks):] == tuple(keyframe.chunks)
+            and numpy.prod(chunks) == numpy.prod(keyframe.chunks)
+            and fh.path is not None
+            and os.path.realpath(fh.path) == os.path.realpath(self.__file_path)
+        ):
+            mappable = (chunks, dtype.newbyteorder("="))
+            if self.__mmap is None:
+                with open(self.__file_path, "rb") as f:
+                    self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__mmap_levels[level] = mappable
+        return mappable
+
+    def __read_mapped(self, key: str) -> Optional[numpy.ndarray]:
+        """A tile as a view over the memory-mapped file, None if it is not stored as-is"""
+        if not self.__use_mmap or not self.__direct:
+            return None
+        try:
+            keyframe, page, _, offset, bytecount = self.__parse_key(key)
+        except KeyError:
+            return None
+        level = int(key.split("/")[0]) if "/" in key else 0
+        mappable = self.__mmap_level(level, keyframe, page)
+        if mappable is None:
+            return None
+        chunks, dtype = mappable
+        count = int(numpy.prod(chunks))
+        if bytecount != count * dtype.itemsize:
+            return None
+        assert self.__mmap is not None
+        if self.__stats is not None:
+            self.__stats.add("tiles_mapped")
+        return numpy.frombuffer(self.__mmap, dtype=dtype, count=count, offset=offset).reshape(chunks)
+
+    def __transform(self, chunk):
+        if self.__store._transform is not None:
+            chunk = self.__store._transform(chunk)
+        return chunk
+
+    def __read_raw(self, key: str):
+        store = self.__store
+        keyframe, page, chunkindex, offset, bytecount = self.__parse_key(key)
+
+        cache_key = (self.__file_key, key, "raw")
+        chunk_bytes = self.__cache_get(cache_key)
+        if chunk_bytes is None:
+            with timed(self.__stats, "read_seconds"):
+                chunk_bytes = store._filecache.read(page.parent.filehandle, offset, bytecount)
+            self.__count_read(bytecount)
+            self.__cache_put(cache_key, chunk_bytes)
+
+        with timed(self.__stats, "decode_seconds"):
+            chunk = keyframe.decode(chunk_bytes, chunkindex, **self.__decodeargs(keyframe, page))[0]
+        self.__count_decoded()
+        return self.__transform(chunk)
+
+    def __read_ranges(self, fh, offsets: list[int], bytecounts: list[int]) -> list[bytes]:
+        filecache = self.__store._filecache
+        chunks: list[bytes] = [b""] * len(offsets)
+        nbytes = 0
+        with filecache.lock, timed(self.__stats, "read_seconds"):
+            filecache.open(fh)
+            try:
+                for start, stop, idxs in coalesce_ranges(offsets, bytecounts):
+                    fh.seek(start)
+                    buffer = fh.read(stop - start)
+                    nbytes += len(buffer)
+                    for i in idxs:
+                        chunks[i] = buffer[offsets[i] - start:offsets[i] - start + bytecounts[i]]
+            finally:
+                filecache.close(fh)
+        # coalesced reads include the gaps between tiles
+        self.__count_read(nbytes, len(offsets))
+        return chunks
+
+    def __claim(self, keys: Sequence[str]) -> tuple[list[str], dict[str, Future]]:
+        """Split keys into those this thread loads, and those already being loaded"""
+        mine: list[str] = []
+        theirs: dict[str, Future] = dict()
+        with self.__inflight_lock:
+            for key in keys:
+                future = self.__inflight.get(key)
+                if future is None:
+                    self.__inflight[key] = Future()
+                    mine.append(key)
+                else:
+                    theirs[key] = future
+        return mine, theirs
+
+    def __release(self, keys: Sequence[str], results: Mapping[str, Any], error: Optional[BaseException] = None):
+        with self.__inflight_lock:
+            futures = [self.__inflight.pop(key) for key in keys]
+        for key, future in zip(keys, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                # missing tiles have no result
+                future.set_result(results.get(key))
+
+    def getitems(self, keys: Sequence[str], *, contexts: Mapping[str, Any]) -> Mapping[str, Any]:
+        if self.__decoder is None or not self.__direct or self.__store._chunkmode:
+            return super().getitems(keys, contexts=contexts)
+
+        results: dict[str, Any] = dict()
+        to_load: list[str] = []
+        for key in keys:
+            if key.endswith(ZARR_META_KEYS):
+                results[key] = self.__store[key]
+                continue
+            chunk = self.__read_mapped(key)
+            if chunk is not None:
+                results[key] = chunk
+                continue
+            if self.__cache_decoded:
+                chunk = self.__cache_get((self.__file_key, key, "decoded"))
+                if chunk is not None:
+                    results[key] = chunk
+                    continue
+            to_load.append(key)
+
+        mine, theirs = self.__claim(to_load)
+        try:
+            loaded = self.__load(mine)
+        except BaseException as e:
+            self.__release(mine, {}, e)
+            raise
+        self.__release(mine, loaded)
+        results.update(loaded)
+
+        for key, future in theirs.items():
+            chunk = future.result()
+            if chunk is not None:
+                results[key] = chunk
+        return results
+
+    def __load(self, keys: Sequence[str]) -> dict[str, Any]:
+        """Read and decode tiles with coalesced reads and the decoder"""
+        assert self.__decoder is not None
+
+        results: dict[str, Any] = dict()
+        # (key, keyframe, page, chunkindex, level, offset, bytecount), and their raw bytes
+        pending = []
+        pending_bytes: list[Optional[bytes]] = []
+        for key in keys:
+            try:
+                keyframe, page, chunkindex, offset, bytecount = self.__parse_key(key)
+            except KeyError:
+                # missing tile, zarr fills it in
+                continue
+            level = int(key.split("/")[0]) if "/" in key else 0
+            pending.append((key, keyframe, page, chunkindex, level, offset, bytecount))
+            pending_bytes.append(
+                None if self.__cache_decoded else self.__cache_get((self.__file_key, key, "raw"))
+            )
+
+        to_read = [i for i, chunk_bytes in enumerate(pending_bytes) if chunk_bytes is None]
+        # multi-file series have tiles in several files
+        for fh in set(pending[i][2].parent.filehandle for i in to_read):
+            fh_to_read = [i for i in to_read if pending[i][2].parent.filehandle is fh]
+            read = self.__read_ranges(
+                fh,
+                [pending[i][5] for i in fh_to_read],
+                [pending[i][6] for i in fh_to_read],
+            )
+            for i, chunk_bytes in zip(fh_to_read, read):
+                pending_bytes[i] = chunk_bytes
+                if not self.__cache_decoded:
+                    self.__cache_put((self.__file_key, pending[i][0], "raw"), chunk_bytes)
+
+        # decode level by level, tiles of a level share a keyframe
+        for level in sorted(set(p[4] for p in pending)):
+            idxs = [i for i, p in enumerate(pending) if p[4] == level]
+            keyframe = pending[idxs[0]][1]
+            with timed(self.__stats, "decode_seconds"):
+                decoded = self.__decoder.decode(
+                    self.__file_path,
+                    level,
+                    keyframe,
+                    [
+                        (pending_bytes[i], pending[i][3], self.__decodeargs(keyframe, pending[i][2]))
+                        for i in idxs
+                    ],
+                )
+            self.__count_decoded(len(idxs))
+            for i, chunk in zip(idxs, decoded):
+                key = pending[i][0]
+                chunk = self.__transform(chunk)
+                if self.__cache_decoded:
+                    self.__cache_put((self.__file_key, key, "decoded"), chunk)
+                results[key] = chunk
+
+        return results
+
+    def __getitem__(self, key: str):
+        if key.endswith(ZARR_META_KEYS):
+            return self.__store[key]
+
+        chunk = self.__read_mapped(key)
+        if chunk is not None:
+            return chunk
+
+        # tifffile's store decodes tiles itself, only raw bytes need our decode
+        if not self.__cache_decoded and self.__direct and not self.__store._chunkmode:
+            return self.__single_flight(key, lambda: self.__read_raw(key))
+
+        cache_key = (self.__file_key, key, "decoded")
+        chunk = self.__cache_get(cache_key)
+        if chunk is not None:
+            return chunk
+        return self.__single_flight(key, lambda: self.__load_decoded(cache_key, key))
+
+    def __load_decoded(self, cache_key, key: str):
+        # tifffile reads and decodes in one go
+        with timed(self.__stats, "decode_seconds"):
+            chunk = self.__store[key]
+        if self.__stats is not None:
+            self.__count_read(self.__store._parse_key(key)[4] or 0 if self.__direct else 0)
+            self.__count_decoded()
+        self.__cache_put(cache_key, chunk)
+        return chunk
+
+    def __single_flight(self, key: str, load):
+        mine, theirs = self.__claim([key])
+        if theirs:
+            chunk = theirs[key].result()
+            if chunk is None:
+                raise KeyError(key)
+            return chunk
+
+        try:
+            chunk = load()
+        except KeyError:
+            self.__release(mine, {})
+            raise
+        except BaseException as e:
+            self.__release(mine, {}, e)
+            raise
+        self.__release(mine, {key: chunk})
+        return chunk
+
+    def __contains__(self, key):
+        return key in self.__store
+
+    def __iter__(self):
+        return iter(self.__store)
+
+    def __len__(self):
+        return len(self.__store)
+
+    def __setitem__(self, key, value):
+        raise PermissionError("CachedTiffStore is read-only")
+
+    def __delitem__(self, key):
+        raise PermissionError("CachedTiffStore is read-only")
+
+    def close(self):
+        self.__store.close()
+        self.__mmap_levels.clear()
+        if self.__mmap is not None:
+            try:
+                self.__mmap.close()
+            except BufferError:
+                # tiles still reference the map, it is closed once they are freed
+                pass
+            self.__mmap = None
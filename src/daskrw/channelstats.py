@@ -0,0 +1,206 @@
+from typing import TypedDict, Optional
+
+import numpy
+import dask
+
+# percentiles kept for each channel
+PERCENTILES = (0.1, 1.0, 50.0, 99.0, 99.9)
+# bins of the stored histograms, finer counts are summed into them
+STORED_BINS = 256
+# bins of every partial histogram, spanning the values seen so far
+HISTOGRAM_BINS = 2048
+
+
+class ChannelStats(TypedDict):
+    min: float
+    max: float
+    mean: float
+    std: float
+    # by percentile, e.g. "99.9", binned, exact while a channel spans at most
+    # HISTOGRAM_BINS integer values
+    percentiles: dict[str, float]
+    # up to STORED_BINS counts, evenly spanning histogram_range
+    histogram: list[int]
+    histogram_range: tuple[float, float]
+
+
+class ChannelPartial(TypedDict):
+    # running statistics of a channel over some blocks
+    count: int
+    mean: float
+    m2: float
+    min: float
+    max: float
+    # HISTOGRAM_BINS counts of bins 2**bin_exponent wide, the first starting
+    # at bin_start * 2**bin_exponent; bins of any two partials line up
+    histogram: numpy.ndarray
+    bin_exponent: int
+    bin_start: int
+
+
+def _bin_index(value: float, exponent: int) -> int:
+    return int(numpy.floor(numpy.ldexp(value, -exponent)))
+
+
+def bin_grid(lo: float, hi: float, exponent: int) -> tuple[int, int]:
+    """(exponent, start) of the finest bins, at least 2**`exponent` wide, that hold `lo` to `hi`"""
+    while _bin_index(hi, exponent) - _bin_index(lo, exponent) >= HISTOGRAM_BINS:
+        exponent += 1
+    return exponent, _bin_index(lo, exponent)
+
+
+def _min_exponent(lo: float, hi: float, integer: bool) -> int:
+    """narrowest bins for values in `lo` to `hi`: one per integer, or
+    fine enough to tell floats apart while bin indexes fit in int64
+    """
+    if integer:
+        return 0
+    magnitude = max(abs(lo), abs(hi), numpy.finfo(numpy.float64).tiny)
+    span = hi - lo
+    exponent = int(numpy.frexp(magnitude)[1]) - 52
+    if span > 0:
+        exponent = max(exponent, int(numpy.ceil(numpy.log2(span / HISTOGRAM_BINS))))
+    return exponent
+
+
+def rebin(partial: ChannelPartial, exponent: int, start: int) -> numpy.ndarray:
+    """the histogram of a partial on the coarser (or equal) bins from `start` at `exponent`"""
+    histogram = partial["histogram"]
+    shift = exponent - partial["bin_exponent"]
+    assert shift >= 0
+    nonzero = numpy.flatnonzero(histogram)
+    idxs = ((partial["bin_start"] + nonzero) >> shift) - start
+    return numpy.bincount(idxs, weights=histogram[nonzero], minlength=HISTOGRAM_BINS).astype(numpy.int64)
+
+
+def _nonzero_bins(partial: ChannelPartial) -> Optional[tuple[int, int]]:
+    """first and last bins (on the grid) with counts"""
+    nonzero = numpy.flatnonzero(partial["histogram"])
+    if nonzero.size == 0:
+        return None
+    return partial["bin_start"] + int(nonzero[0]), partial["bin_start"] + int(nonzero[-1])
+
+
+def block_partials(block: numpy.ndarray, c_start: int) -> dict[int, ChannelPartial]:
+    """Statistics of each channel of a t,c,z,y,x block, by channel index"""
+    integer = numpy.issubdtype(block.dtype, numpy.integer)
+    partials: dict[int, ChannelPartial] = dict()
+    for i in range(block.shape[1]):
+        values = block[:, i].ravel()
+        if values.size == 0:
+            continue
+        binned = values if integer else values[numpy.isfinite(values)]
+        if binned.size:
+            lo, hi = float(binned.min()), float(binned.max())
+            exponent, start = bin_grid(lo, hi, _min_exponent(lo, hi, integer))
+            if integer and exponent == 0:
+                histogram = numpy.bincount(binned.astype(numpy.int64) - start, minlength=HISTOGRAM_BINS)
+            else:
+                idxs = numpy.floor(numpy.ldexp(binned.astype(numpy.float64), -exponent)).astype(numpy.int64)
+                histogram = numpy.bincount(idxs - start, minlength=HISTOGRAM_BINS)
+        else:
+            exponent, start = 0, 0
+            histogram = numpy.zeros(HISTOGRAM_BINS, dtype=numpy.int64)
+        as_float = values.astype(numpy.float64)
+        mean = float(as_float.mean())
+        partials[c_start + i] = {
+            "count": int(values.size),
+            "mean": mean,
+            "m2": float(numpy.square(as_float - mean).sum()),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "histogram": histogram.astype(numpy.int64),
+            "bin_exponent": exponent,
+            "bin_start": start,
+        }
+    return partials
+
+
+def merge_bins(a: ChannelPartial, b: ChannelPartial) -> tuple[int, int]:
+    """(exponent, start) of the finest bins holding the counts of both partials"""
+    exponent = max(a["bin_exponent"], b["bin_exponent"])
+    # the first and last bins with counts, at the coarser of the two widths
+    firsts, lasts = [], []
+    for partial in (a, b):
+        extent = _nonzero_bins(partial)
+        if extent is not None:
+            shift = exponent - partial["bin_exponent"]
+            firsts.append(extent[0] >> shift)
+            lasts.append(extent[1] >> shift)
+    if not firsts:
+        return exponent, 0
+    first, last = min(firsts), max(lasts)
+    while last - first >= HISTOGRAM_BINS:
+        exponent += 1
+        first >>= 1
+        last >>= 1
+    return exponent, first
+
+
+def merge_partials(*partials: dict[int, ChannelPartial]) -> dict[int, ChannelPartial]:
+    """Combine the statistics of disjoint sets of blocks"""
+    merged: dict[int, ChannelPartial] = dict()
+    for partial in partials:
+        for c, b in partial.items():
+            a = merged.get(c)
+            if a is None:
+                merged[c] = b
+                continue
+            count = a["count"] + b["count"]
+            delta = b["mean"] - a["mean"]
+            exponent, start = merge_bins(a, b)
+            merged[c] = {
+                "count": count,
+                "mean": a["mean"] + delta * b["count"] / count,
+                "m2": a["m2"] + b["m2"] + delta * delta * a["count"] * b["count"] / count,
+                "min": min(a["min"], b["min"]),
+                "max": max(a["max"], b["max"]),
+                "histogram": rebin(a, exponent, start) + rebin(b, exponent, start),
+                "bin_exponent": exponent,
+                "bin_start": start,
+            }
+    return merged
+
+
+def tree_merge(partials: list, split_every: int = 8):
+    """Delayed merge of delayed partials, `split_every` at a time, level by level"""
+    if not partials:
+        return dask.delayed(dict)()
+    while len(partials) > 1:
+        partials = [
+            dask.delayed(merge_partials)(*partials[i:i + split_every])
+            for i in range(0, len(partials), split_every)
+        ]
+    return partials[0]
+
+
+def finalize(partial: ChannelPartial) -> ChannelStats:
+    histogram = partial["histogram"]
+    width = 2.0 ** partial["bin_exponent"]
+    nonzero = numpy.flatnonzero(histogram)
+    first, last = (int(nonzero[0]), int(nonzero[-1]) + 1) if nonzero.size else (0, 1)
+    start = (partial["bin_start"] + first) * width
+
+    # lower edges of the bins holding the percentiles, within the values' range
+    cumulative = numpy.cumsum(histogram[first:last])
+    percentiles = {
+        f"{p:g}": float(numpy.clip(
+            start + width * numpy.searchsorted(cumulative, max(1.0, p / 100 * cumulative[-1])),
+            partial["min"], partial["max"],
+        ))
+        for p in PERCENTILES
+    }
+
+    # the bins with counts, summed into at most STORED_BINS
+    histogram = histogram[first:last]
+    group = -(-len(histogram) // STORED_BINS)
+    histogram = numpy.pad(histogram, (0, -len(histogram) % group)).reshape(-1, group).sum(axis=1)
+    return {
+        "min": partial["min"],
+        "max": partial["max"],
+        "mean": partial["mean"],
+        "std": float(numpy.sqrt(partial["m2"] / partial["count"])),
+        "percentiles": percentiles,
+        "histogram": [int(n) for n in histogram],
+        "histogram_range": (start, start + width * group * len(histogram)),
+    }
@@ -0,0 +1,115 @@
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Literal, Optional, Any, Sequence
+
+import numpy
+import tifffile
+
+ExecutorKind = Literal["thread", "process"]
+
+
+def coalesce_ranges(offsets: Sequence[int],
+                    bytecounts: Sequence[int],
+                    max_gap: int = 2**16,
+                    max_size: int = 2**26,
+                    ) -> list[tuple[int, int, list[int]]]:
+    """Merge byte ranges that are adjacent (or nearly so) in the file.
+    :param max_gap: largest hole between two ranges that is read through
+    :param max_size: largest merged read
+    Returns (start, stop, idxs) per merged read, where idxs index into the inputs
+    """
+    order = sorted(range(len(offsets)), key=lambda i: offsets[i])
+
+    merged: list[tuple[int, int, list[int]]] = []
+    for i in order:
+        start = int(offsets[i])
+        stop = start + int(bytecounts[i])
+        if merged:
+            m_start, m_stop, m_idxs = merged[-1]
+            if start - m_stop <= max_gap and max(stop, m_stop) - m_start <= max_size:
+                merged[-1] = (m_start, max(stop, m_stop), m_idxs + [i])
+                continue
+        merged.append((start, stop, [i]))
+    return merged
+
+
+# tiffs opened by the worker processes of a process pool, by path
+_worker_files: dict[str, tifffile.TiffFile] = dict()
+_worker_files_lock = threading.Lock()
+
+def _decode_in_worker(file_path: str,
+                      level: int,
+                      chunk_bytes: bytes,
+                      chunkindex: int,
+                      decodeargs: dict[str, Any],
+                      ) -> numpy.ndarray:
+    # decode functions are closures over the keyframe, they can't be pickled,
+    # so each worker process opens the file once and finds the keyframe itself
+    with _worker_files_lock:
+        tif = _worker_files.get(file_path)
+        if tif is None:
+            tif = _worker_files[file_path] = tifffile.TiffFile(file_path)
+    keyframe = tif.series[0].levels[level].keyframe
+    return keyframe.decode(chunk_bytes, chunkindex, **decodeargs)[0]
+
+
+class TileDecoder:
+    """
+    Decodes batches of tiles concurrently
+
+    A thread pool suits codecs that release the GIL (imagecodecs' LZW, deflate,
+    zstd, JPEG...); a process pool sidesteps the GIL for the rest, at the cost
+    of pickling tile bytes and decoded tiles between processes.
+    """
+
+    def __init__(self, workers: Optional[int] = None, kind: ExecutorKind = "thread"):
+        """
+        :param workers: size of the pool, `None` = number of CPUs
+        :param kind: "thread" or "process" pool
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported executor kind: {kind}")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.kind = kind
+        self.__executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self.__executor is None:
+            if self.kind == "thread":
+                self.__executor = ThreadPoolExecutor(self.workers, thread_name_prefix="daskrw-decode")
+            else:
+                self.__executor = ProcessPoolExecutor(self.workers)
+        return self.__executor
+
+    def decode(self,
+               file_path: str,
+               level: int,
+               keyframe: tifffile.TiffPage,
+               chunks: list[tuple[bytes, int, dict[str, Any]]],
+               ) -> list[numpy.ndarray]:
+        """Decode (chunk_bytes, chunkindex, decodeargs) of one pyramid level"""
+        if len(chunks) == 1 and self.kind == "thread":
+            chunk_bytes, chunkindex, decodeargs = chunks[0]
+            return [keyframe.decode(chunk_bytes, chunkindex, **decodeargs)[0]]
+
+        if self.kind == "thread":
+            futures = [
+                self.executor.submit(
+                    lambda c: keyframe.decode(c[0], c[1], **c[2])[0], chunk
+                ) for chunk in chunks
+            ]
+        else:
+            futures = [
+                self.executor.submit(
+                    _decode_in_worker, str(file_path), level, bytes(chunk_bytes), chunkindex, decodeargs
+                ) for chunk_bytes, chunkindex, decodeargs in chunks
+            ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
@@ -0,0 +1,65 @@
+from typing import Literal
+
+import numpy
+import dask.array
+from dask.array.core import Array as daskArray
+
+DownsampleMethod = Literal["mean", "nearest", "mode"]
+
+# n.b. dask calls the reductions once without `axis` to infer the output type,
+# they return the block unchanged then
+
+
+def _mean(block: numpy.ndarray, axis=None) -> numpy.ndarray:
+    if axis is None:
+        return block
+    mean = numpy.mean(block, axis=axis)
+    if numpy.issubdtype(block.dtype, numpy.integer):
+        mean = numpy.rint(mean)
+    return mean.astype(block.dtype)
+
+
+def _nearest(block: numpy.ndarray, axis=None) -> numpy.ndarray:
+    if axis is None:
+        return block
+    # top-left pixel of each window
+    index = tuple(0 if i in axis else slice(None) for i in range(block.ndim))
+    return block[index]
+
+
+def _mode(block: numpy.ndarray, axis=None) -> numpy.ndarray:
+    if axis is None:
+        return block
+    # most frequent value of each window (ties go to the first), e.g. for label images
+    kept = [i for i in range(block.ndim) if i not in axis]
+    windows = block.transpose(kept + list(axis))
+    windows = windows.reshape(windows.shape[:len(kept)] + (-1,))
+    counts = (windows[..., :, None] == windows[..., None, :]).sum(axis=-1)
+    winner = counts.argmax(axis=-1)
+    return numpy.take_along_axis(windows, winner[..., None], axis=-1)[..., 0]
+
+
+REDUCTIONS = {
+    "mean": _mean,
+    "nearest": _nearest,
+    "mode": _mode,
+}
+
+
+def downsample(data: daskArray, factor: int = 2, method: DownsampleMethod = "mean") -> daskArray:
+    """Downsample the last two (y, x) axes of `data` by an integer factor.
+    Edge rows/columns that don't fill a whole window are dropped, and the result
+    keeps the chunk shape of `data`, so deep levels don't end up as tiny chunks.
+    """
+    if method not in REDUCTIONS:
+        raise ValueError(f"Unsupported downsample method: {method}")
+
+    y_axis = data.ndim - 2
+    x_axis = data.ndim - 1
+    coarse = dask.array.coarsen(
+        REDUCTIONS[method],
+        data,
+        {y_axis: factor, x_axis: factor},
+        trim_excess=True,
+    )
+    return coarse.rechunk(data.chunksize)
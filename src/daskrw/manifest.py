@@ -0,0 +1,89 @@
+import os
+import json
+import zlib
+import threading
+from typing import Optional
+
+import numpy
+
+SIDECAR_SUFFIX = ".daskrw-manifest.jsonl"
+
+
+def block_checksum(block: numpy.ndarray) -> int:
+    return zlib.crc32(numpy.ascontiguousarray(block).data)
+
+
+class WriteManifest:
+    """
+    Append-only log of the blocks written to a zarr store
+
+    Each completed block is appended as one json line once its chunks are
+    stored, so a block interrupted mid-write is never recorded, and a
+    truncated last line (from a crash during the append) is ignored.
+    Appends are single small writes to a file opened in append mode, so
+    tasks in several threads or processes may record concurrently.
+    """
+
+    def __init__(self, path: str):
+        """
+        @param path: path of the log, see `path_for`
+        """
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__done: Optional[dict[str, int]] = None
+
+    @staticmethod
+    def path_for(file_path) -> str:
+        return f"{os.path.normpath(file_path)}{SIDECAR_SUFFIX}"
+
+    def __getstate__(self):
+        # only the path travels to worker processes, they append to the same log
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __load(self) -> dict[str, int]:
+        done: dict[str, int] = dict()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                    done[entry["block"]] = int(entry["crc32"])
+                except (ValueError, KeyError, TypeError):
+                    # partially written line
+                    continue
+        return done
+
+    @property
+    def done(self) -> dict[str, int]:
+        """checksum of every recorded block, by block key"""
+        with self.__lock:
+            if self.__done is None:
+                self.__done = self.__load()
+            return self.__done
+
+    def __contains__(self, block_key: str):
+        return block_key in self.done
+
+    def record(self, block_key: str, checksum: int):
+        line = json.dumps({"block": block_key, "crc32": checksum}) + "\n"
+        with self.__lock:
+            with open(self.path, "a") as fh:
+                fh.write(line)
+                fh.flush()
+            if self.__done is not None:
+                self.__done[block_key] = checksum
+
+    def verify(self, block_key: str, stored: numpy.ndarray) -> bool:
+        """`True` if a recorded block still holds the data it was written with"""
+        checksum = self.done.get(block_key)
+        return checksum is not None and checksum == block_checksum(stored)
+
+    def clear(self):
+        with self.__lock:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.__done = None
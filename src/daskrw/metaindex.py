@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import zipfile
+import tempfile
+from typing import TypedDict, Optional
+
+import numpy
+
+from .cache import file_cache_key
+
+INDEX_VERSION = 2
+SIDECAR_SUFFIX = ".daskrw-index.npz"
+
+class TileLayout(TypedDict):
+    # one row per page (plane) of the level, in series order,
+    # one column per tile (chunk) of the page, in row-major order
+    offsets: numpy.ndarray
+    bytecounts: numpy.ndarray
+
+
+class IndexEntry(TypedDict):
+    # StandardMetadata, see reader.py
+    metadata: dict
+    tiles: dict[int, TileLayout]
+
+
+def _metadata_to_json(metadata) -> str:
+    return json.dumps(metadata)
+
+def _metadata_from_json(metadata_json: str) -> dict:
+    metadata = json.loads(metadata_json)
+    # json has no tuples, and only string keys
+    metadata["shape"] = tuple(metadata["shape"])
+    metadata["channel_names"] = tuple(metadata["channel_names"])
+    resolutions = dict()
+    for level, resolution in metadata["resolutions"].items():
+        resolution["shape"] = tuple(resolution["shape"])
+        resolution["dims"] = tuple(resolution["dims"])
+        resolutions[int(level)] = resolution
+    metadata["resolutions"] = resolutions
+    return metadata
+
+
+class MetadataIndex:
+    """
+    Persistent index of the metadata and tile layout of ome-tiffs
+
+    Entries are stored as compact `.npz` files, either as a sidecar next to
+    each image, or in a central `cache_dir`. An entry is keyed by the image's
+    path, size and mtime, and is ignored (and rebuilt) once the image changes.
+    Reopening an unchanged image then answers metadata and tile layout queries
+    without walking IFDs or parsing the OME-XML. Reading pixels (`read_tiled`,
+    `read_region`, ...) still opens the file with tifffile, which does both.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        @param cache_dir: directory holding the index entries,
+                          if None, entries are sidecars of the images
+        """
+        self.cache_dir = cache_dir
+
+    def path_for(self, file_path) -> str:
+        if self.cache_dir is None:
+            return f"{file_path}{SIDECAR_SUFFIX}"
+        digest = hashlib.sha1(os.path.realpath(file_path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{SIDECAR_SUFFIX}")
+
+    def load(self, file_path) -> Optional[IndexEntry]:
+        """The index entry of an image, `None` if missing or stale"""
+        index_path = self.path_for(file_path)
+        if not os.path.exists(index_path):
+            return None
+
+        try:
+            with numpy.load(index_path, allow_pickle=False) as npz:
+                header = json.loads(str(npz["header"]))
+                if header["version"] != INDEX_VERSION:
+                    return None
+                if tuple(header["key"]) != file_cache_key(file_path):
+                    return None
+
+                tiles: dict[int, TileLayout] = {
+                    level: {
+                        "offsets": npz[f"offsets_{level}"],
+                        "bytecounts": npz[f"bytecounts_{level}"],
+                    }
+                    for level in range(header["levels"])
+                }
+                return {
+                    "metadata": _metadata_from_json(str(npz["metadata"])),
+                    "tiles": tiles,
+                }
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # unreadable or partially written index, rebuild it
+            return None
+
+    def save(self, file_path, metadata, tiles: dict[int, TileLayout]) -> bool:
+        """Write the index entry of an image, returns `False` if it could not be written"""
+        index_path = self.path_for(file_path)
+        header = {
+            "version": INDEX_VERSION,
+            "key": file_cache_key(file_path),
+            "levels": len(tiles),
+        }
+        arrays = dict()
+        for level, layout in tiles.items():
+            arrays[f"offsets_{level}"] = layout["offsets"]
+            arrays[f"bytecounts_{level}"] = layout["bytecounts"]
+
+        index_dir = os.path.dirname(os.path.abspath(index_path))
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            # write to a temp file and rename, so readers never see a partial index
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                numpy.savez(
+                    fh,
+                    header=numpy.array(json.dumps(header)),
+                    metadata=numpy.array(_metadata_to_json(metadata)),
+                    **arrays,
+                )
+            os.replace(tmp_path, index_path)
+        except OSError:
+            os.unlink(tmp_path)
+            return False
+        return True
+
+    def invalidate(self, file_path):
+        index_path = self.path_for(file_path)
+        if os.path.exists(index_path):
+            os.unlink(index_path)
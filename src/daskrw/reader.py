@@ -1,5 +1,11 @@
+import os
+import queue
+import asyncio
+import threading
 from math import ceil
-from typing import TypedDict, Literal, Optional, Union, Tuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, Literal, Optional, Union, Tuple, Iterator, AsyncIterator
 from collections import defaultdict
 
 import numpy
@@ -7,8 +13,14 @@ import zarr
 import tifffile
 import xmltodict
 import dask.array
-from dask.array.core import Array as daskArray
-
+from dask.base import tokenize
+from dask.array.core import Array as daskArray, getter
+
+from .cache import TileCache, CacheStats, CachedTiffStore, shared_tile_cache
+from .metaindex import MetadataIndex, TileLayout
+from .tileindex import TileIndex
+from .decode import TileDecoder, ExecutorKind
+from .stats import Stats
 from .constants import (
     MD_SIZE_S,
     MD_SIZE_C,
@@ -69,6 +81,81 @@ class StandardMetadata(TypedDict):
     tile_width: int
     resolutions: dict[int, Resolution]
 
+class TileEncoding(TypedDict):
+    # TIFF tags of the keyframe of a level, enough to decode its raw tiles
+    compression: int
+    predictor: int
+    fillorder: int
+    bitspersample: int
+    samplesperpixel: int
+    photometric: int
+    byteorder: Literal["<", ">"]
+    dtype: str
+    is_tiled: bool
+    # tile shape, with samples last if interleaved
+    tile_shape: tuple[int, ...]
+    jpegtables: Optional[bytes]
+
+# dims read as channels, in order of preference
+CHANNEL_DIMS = ("channel", "sequence", "sample")
+
+TileOrder = Literal["row-major", "hilbert"]
+
+# (x, y, w, h) in pixels of the level
+BBox = Tuple[int, int, int, int]
+
+# channel index or name, or a list or slice of channels
+ChannelSelection = Union[int, str, slice, list[Union[int, str]]]
+
+def _channel_idx(dims: tuple[str, ...]) -> Optional[int]:
+    for channel_dim in CHANNEL_DIMS:
+        if channel_dim in dims:
+            return dims.index(channel_dim)
+    if len(dims) == 3:
+        # unnamed third dim of a 2D image
+        return {0,1,2}.difference((dims.index("height"), dims.index("width"))).pop()
+    return None
+
+def _hilbert_d(n: int, x: int, y: int) -> int:
+    """distance of (x, y) along the hilbert curve filling an n x n grid, n a power of 2"""
+    d = 0
+    s = n // 2
+    while s > 0:
+        rx = int(x & s > 0)
+        ry = int(y & s > 0)
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s //= 2
+    return d
+
+def _get_unless_empty(a, b, asarray=True, lock=None, empty: Optional[numpy.ndarray] = None, fill=0):
+    """dask getter returning a (zero-stride) fill-value block without reading, if all of its tiles are missing"""
+    if empty is not None:
+        chunk_idxs = tuple(
+            slice(s.start // chunk, -(-s.stop // chunk)) for s, chunk in zip(b, a.chunks)
+        )
+        if empty[chunk_idxs].all():
+            shape = tuple(s.stop - s.start for s in b)
+            return numpy.broadcast_to(numpy.asarray(fill, dtype=a.dtype), shape)
+    return getter(a, b, asarray=asarray, lock=lock)
+
+def _level_tile_layout(level: tifffile.TiffPageSeries) -> TileLayout:
+    """Offsets and bytecounts of the tiles of every page of a level"""
+    n_tiles = len(level.keyframe.dataoffsets)
+    offsets = numpy.zeros((len(level.pages), n_tiles), dtype=numpy.uint64)
+    bytecounts = numpy.zeros((len(level.pages), n_tiles), dtype=numpy.uint64)
+    for i, page in enumerate(level.pages):
+        # missing pages are left as zero-length tiles
+        if page is None:
+            continue
+        offsets[i] = page.dataoffsets
+        bytecounts[i] = page.databytecounts
+    return {"offsets": offsets, "bytecounts": bytecounts}
+
 SUPPORTED_EXTENSIONS = {'.ome.tif', '.ome.tiff'}
 SUPPORTED_SCHEMES = {'file'}
 
@@ -77,17 +164,83 @@ class TiledImageReader:
     Reads tiled/pyramidal ome-tiff images
     """
 
-    def __init__(self, image_file_path):
+    def __init__(self,
+                 image_file_path,
+                 cache: Optional[TileCache] = None,
+                 cache_decoded=True,
+                 metadata_index: Optional[MetadataIndex] = None,
+                 decode_workers: Optional[int] = None,
+                 decode_executor: ExecutorKind = "thread",
+                 decode_batch: int = 1,
+                 async_workers: Optional[int] = None,
+                 async_max_pending: int = 1024,
+                 use_mmap: bool = True,
+                 stats: Optional[Stats] = None,
+                 rescale_source=None,
+                 skip_empty_tiles: bool = True,
+                 ):
+        """
+        :param image_file_path: path to the ome-tiff
+        :param cache: tile cache, shared with other readers; `None` uses the
+               process-wide cache from `shared_tile_cache()`
+        :param cache_decoded: if `True`, cache decoded tiles, so repeat reads
+               skip decompression; if `False`, cache only the raw tile bytes
+        :param metadata_index: persistent index of metadata and tile layout;
+               the first open builds the file's entry, later opens (from any
+               process) answer metadata and tile layout queries from it instead
+               of walking IFDs and parsing OME XML; pixel reads still do both
+        :param decode_workers: if set, tiles are decoded on a dedicated pool of
+               this many workers, with coalesced reads of their byte ranges;
+               `None` = decode one tile at a time in the dask task
+        :param decode_executor: "thread" pool for GIL-releasing codecs, or
+               "process" pool for the rest
+        :param decode_batch: tiles per side of each dask chunk of `read_tiled`,
+               i.e. `decode_batch**2` tiles are fetched and decoded together
+        :param async_workers: threads reading and decoding for the async API,
+               `None` = 4 per CPU, up to 32
+        :param async_max_pending: async requests admitted at once, later ones
+               wait their turn instead of queueing unbounded work
+        :param use_mmap: serve tiles of uncompressed levels as views over a
+               memory map of the file, skipping reads, copies and the cache
+        :param stats: counters of bytes read, tiles decoded or memory-mapped,
+               decode time and cache hits, misses and evictions; `None` = no
+               bookkeeping
+        :param rescale_source: ome-zarr converted from this image with channel
+               statistics (see `TiledImageWriter`), whose channel min/max
+               `read_tiled` returns as the rescale range instead of the dtype's
+        :param skip_empty_tiles: chunks of `read_tiled` whose tiles are all
+               missing from the file (zero bytecount) are fill values, without
+               reads or allocation; needs the tile layout, see `get_tile_index`
+        """
         self.file_path = image_file_path
+        self.cache = shared_tile_cache() if cache is None else cache
+        self.cache_decoded = cache_decoded
+        self.metadata_index = metadata_index
+        self.decoder = None if decode_workers is None else TileDecoder(decode_workers, decode_executor)
+        self.decode_batch = decode_batch
+        self.async_workers = async_workers or min(32, 4 * (os.cpu_count() or 1))
+        self.async_max_pending = async_max_pending
+        self.use_mmap = use_mmap
+        self.stats = stats
+        self.rescale_source = rescale_source
+        self.skip_empty_tiles = skip_empty_tiles
+        self.__channel_ranges: Optional[dict[int, Tuple[float, float]]] = None
+        self.__async_executor: Optional[ThreadPoolExecutor] = None
+        self.__async_limit: Optional[asyncio.Semaphore] = None
+        self.__async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__open_lock = threading.RLock()
 
         self.__data = []
         self.__zarr_data = []
+        self.__tif: Optional[tifffile.TiffFile] = None
         self.__store = None
-        self.__lru_cache = None
+        self.__cached_store = None
         self.__reader = None
         self.__path = None
         self.__cached_meta = None
         self.__cached_full_meta = None
+        self.__cached_tiles = None
+        self.__tile_indexes: dict[int, TileIndex] = dict()
         self.__dim_idxs = {
             "channel_idx": 0,
             "row_idx": 1,
@@ -111,19 +264,33 @@ class TiledImageReader:
             del self.nth
             del self.channel
             del self.plane
+            del self.frame
 
             self.__path = self.file_path 
             self.__cached_meta = None
             self.__cached_full_meta = None
+            self.__cached_tiles = None
+            self.__tile_indexes = dict()
             self.__dim_idxs = {
                 "channel_idx": 0,
                 "row_idx": 1,
                 "col_idx": 2,
             }
 
-            self.__store = tifffile.imread(self.__path, aszarr=True)
-            self.__lru_cache = zarr.LRUStoreCache(self.__store, max_size=2**29)
-            self.__reader = zarr.open(self.__lru_cache, mode='r')
+            # kept open, its parsed pages also give the tile layout
+            self.__tif = tifffile.TiffFile(self.__path)
+            # always a multiscales group, also for non-pyramidal images
+            self.__store = self.__tif.aszarr(multiscales=True)
+            self.__cached_store = CachedTiffStore(
+                self.__store,
+                self.__path,
+                self.cache,
+                cache_decoded=self.cache_decoded,
+                decoder=self.decoder,
+                use_mmap=self.use_mmap,
+                stats=self.stats,
+            )
+            self.__reader = zarr.open(self.__cached_store, mode='r')
 
         return self.__reader
 
@@ -132,61 +299,84 @@ class TiledImageReader:
                    series=None,
                    c=None,
                    channel_names=None,
+                   z: Optional[Union[int, slice]] = None,
+                   t: Optional[Union[int, slice]] = None,
                    ) -> Union[daskArray, Tuple[daskArray, Tuple[float, float]]]:
         """Read from a tiled, pyramdial image file.
         :param wants_metadata_rescale: if `True`, return a tuple of image and a
-               tuple of (min, max) for range values of image dtype gathered from
-               file metadata; if `False`, returns only the image
+               tuple of (min, max) for range values of the selected channels,
+               from the channel statistics of the `rescale_source` if it has
+               them, else from the image dtype; if `False`, returns only the image
         :param series: series (pyramid level)
         :param c: read from this channel. `None` = read color image if multichannel
-            or interleaved RGB.
-        n.b. either z or t should be "None" to specify which channel to read across.
+            or interleaved RGB. A list or slice of channels (or channel names)
+            reads them all in one array, each tile is still decoded only once.
         :param channel_names: provide the channel names for the OME metadata
+        :param z: z-stack index (axis dropped), or slice of planes (axis kept);
+            `None` = all planes, the axis is dropped if there is only one
+        :param t: time index or slice of frames, as for `z`
 
-        Should return a data array with channel order [Z, ]Y, X[, C]
+        Should return a data array with channel order [T, ][Z, ]Y, X[, C]
+        Slicing is lazy, only the tiles of the selected planes are ever read.
         """
         def order_dims(dask_array: daskArray, level: int):
             dims = self._res[level]["dims"]
             row_idx = dims.index("height")
             col_idx = dims.index("width")
-            if "channel" in dims:
-                channel_idx = dims.index("channel")
-            elif "sequence" in dims:
-                channel_idx = dims.index("sequence")
-            else:
-                channel_idx = {0,1,2}.difference((row_idx, col_idx)).pop()
+            channel_idx = _channel_idx(dims)
+            depth_idx = dims.index("depth") if "depth" in dims else None
+            time_idx = dims.index("time") if "time" in dims else None
 
-            standard_idxs = (0, 1, 2)
-            assert row_idx != col_idx
-            assert row_idx != channel_idx
-            assert col_idx != channel_idx
-            assert row_idx in standard_idxs
-            assert col_idx in standard_idxs
-            assert channel_idx in standard_idxs
+            known_idxs = [i for i in (time_idx, depth_idx, row_idx, col_idx, channel_idx) if i is not None]
+            assert len(set(known_idxs)) == len(known_idxs)
+            if len(known_idxs) != dask_array.ndim:
+                unknown = [d for i, d in enumerate(dims) if i not in known_idxs]
+                raise NotImplementedError(f"Unsupported dimensions: {unknown}")
 
             self.__dim_idxs["row_idx"] = row_idx
             self.__dim_idxs["col_idx"] = col_idx
             self.__dim_idxs["channel_idx"] = channel_idx
 
-            if dask_array.ndim == 3:
-                return dask_array.transpose([row_idx, col_idx, channel_idx])
-            if dask_array.ndim == 4:
-                # TODO: LIS - implement volumetric
-                raise NotImplementedError("Not yet implemented")
-            return dask_array
-
-        path = self.file_path
-        if not self.__data or path is None or path != self.__path:
-            reader = self.__get_reader()
-            self.__zarr_data: list[zarr.Array] = [ # type: ignore
-                reader[int(dataset["path"])]
-                for dataset in reader.attrs["multiscales"][0]["datasets"]
-            ]
+            # T, Z, Y, X, C, with length-1 axes for the ones the file doesn't have
+            ordered = dask_array.transpose(known_idxs)
+            expand = tuple(
+                slice(None) if idx is not None else None
+                for idx in (time_idx, depth_idx, row_idx, col_idx, channel_idx)
+            )
+            return ordered[expand]
+
+        def select(selection: Optional[Union[int, slice]], size: int):
+            # ints drop the axis, slices keep it, None keeps it unless length-1
+            if selection is None:
+                return slice(None) if size > 1 else 0
+            return selection
+
+        def batch_chunks(zarray: zarr.Array, level: int):
+            # group decode_batch x decode_batch tiles in each dask chunk
+            dims = self._res[level]["dims"]
+            batched_idxs = (dims.index("height"), dims.index("width"))
+            return tuple(
+                chunk * self.decode_batch if i in batched_idxs else chunk
+                for i, chunk in enumerate(zarray.chunks)
+            )
+
+        def level_array(zarray: zarr.Array, level: int):
+            chunks = batch_chunks(zarray, level)
+            empty = self.__empty_tiles(zarray, level) if self.skip_empty_tiles else None
+            if empty is None or not empty.any():
+                return dask.array.from_zarr(zarray, chunks=chunks)
+            return dask.array.from_array(
+                zarray,
+                chunks=chunks,
+                name="from-zarr-" + tokenize(zarray, chunks, "skip-empty"),
+                getitem=partial(_get_unless_empty, empty=empty, fill=zarray.fill_value or 0),
+            )
+
+        zarr_data = self.__get_levels()
+        if not self.__data:
             self.__data: list[daskArray] = [
-                order_dims(
-                    dask.array.from_zarr(zd), # type: ignore
-                    len(self.__zarr_data)-1
-                ) for zd in self.__zarr_data
+                order_dims(level_array(zd, level), level) # type: ignore
+                for level, zd in enumerate(zarr_data)
             ]
 
         if channel_names is not None:
@@ -196,14 +386,38 @@ class TiledImageReader:
         self.channel = self._set_channel(start=0, stop=3, lvl=self.level)
         self.nth = 0
 
+        # T, Z, Y, X, C
         level_data = self.__data[self.level]
-        if c is not None and level_data.ndim == 3:
-            level_data = level_data[:,:,c]
-        if c is not None and level_data.ndim == 4:
-            # TODO: LIS - implement volumetric
-            raise NotImplementedError("Not yet implemented")
+        size_t, size_z, _, _, size_c = level_data.shape
+        t_sel = select(t, size_t)
+        z_sel = select(z, size_z)
+        c_sel = select(self.__resolve_channels(c), size_c)
+        if isinstance(c_sel, (int, slice)):
+            level_data = level_data[t_sel, z_sel, :, :, c_sel]
+        else:
+            level_data = level_data[t_sel, z_sel]
+            if len(level_data.chunks[-1]) == 1:
+                # interleaved, pick the channels in the task decoding the tile
+                idxs = numpy.asarray(c_sel)
+                level_data = level_data.map_blocks(
+                    lambda block: block[..., idxs],
+                    chunks=level_data.chunks[:-1] + ((len(idxs),),),
+                    dtype=level_data.dtype,
+                )
+            else:
+                # planar, each channel is its own chunk, only pick those
+                level_data = dask.array.concatenate(
+                    [level_data[..., i:i+1] for i in c_sel], axis=-1
+                )
+
+        self.frame = t_sel if isinstance(t_sel, int) else list(range(size_t)[t_sel])
+        self.plane = z_sel if isinstance(z_sel, int) else list(range(size_z)[z_sel])
 
         if wants_metadata_rescale:
+            channel_range = self.__channel_range(c_sel, size_c)
+            if channel_range is not None:
+                return level_data, channel_range
+
             dtype = self._meta["dtype"]
             if numpy.issubdtype(dtype, numpy.integer):
                 info = numpy.iinfo(dtype)
@@ -216,99 +430,397 @@ class TiledImageReader:
 
         return level_data
 
-    # def current_tile(self, all_channels=False):
-    #     nth = self.nth
-    #     level = self.level
-    #     if all_channels:
-    #         num_channels = self._res[level]["channels"]
-    #         channel = slice(0,num_channels,1)
-    #     else:
-    #         channel = self.channel
-
-    #     assert nth >= 0
-    #     assert nth <= self._nn(level), f"only {self._nn(level)} tiles at level {level}, got {nth}"
-
-    #     return self._tile_n(nth=nth, channel=channel, level=level)
-
-    # def go_tile_left(self):
-    #     nth = self.nth
-    #     level = self.level
-    #     curr_x = nth % self._nx(level)
-    #     if curr_x > 0:
-    #         self.nth = nth - 1
-    #     return self.current_tile()
-
-    # def go_tile_right(self):
-    #     nth = self.nth
-    #     level = self.level
-    #     curr_x = nth % self._nx(level)
-    #     if curr_x < (self._nx(level) - 1):
-    #         self.nth = nth + 1
-    #     return self.current_tile()
-
-    # def go_tile_up(self):
-    #     nth = self.nth
-    #     level = self.level
-    #     new_nth = nth - self._nx(level)
-    #     if new_nth >= 0:
-    #         self.nth = new_nth
-    #     return self.current_tile()
-
-    # def go_tile_down(self):
-    #     nth = self.nth
-    #     level = self.level
-    #     new_nth = nth + self._nx(level)
-    #     if new_nth < self._nn(level):
-    #         self.nth = new_nth
-    #     return self.current_tile()
-
-    # #  down the inverted pyramid (downscale)
-    # def go_level_up(self):
-    #     level = self.level
-    #     nth = self.nth
-    #     if level < (len(self._res) - 1):
-    #         new_iy = self._iy(level, nth) // 2
-    #         new_ix = self._ix(level, nth) // 2
-
-    #         level += 1
-
-    #         new_nx = self._nx(level)
-
-    #         self.level = level
-    #         self.nth = new_iy * new_nx + new_ix
-    #     return self.current_tile()
-
-    # # up the inverted pyramid (upscale)
-    # def go_level_down(self):
-    #     level = self.level
-    #     nth = self.nth
-    #     if level > 0:
-    #         new_iy = self._iy(level, nth) * 2
-    #         new_ix = self._ix(level, nth) * 2
-
-    #         level = max(0, level - 1)
-
-    #         new_nx = self._nx(level)
-
-    #         self.level = level
-    #         self.nth = new_iy * new_nx + new_ix
-    #     return self.current_tile()
+    def __channel_range(self, c_sel, size_c: int) -> Optional[Tuple[float, float]]:
+        """(min, max) over the selected channels from the `rescale_source`, `None` if unknown"""
+        if self.rescale_source is None:
+            return None
+        if self.__channel_ranges is None:
+            self.__channel_ranges = dict()
+            try:
+                omero = zarr.open_group(self.rescale_source, mode="r").attrs.get("omero", {})
+            except (ValueError, KeyError, zarr.errors.GroupNotFoundError):
+                omero = {}
+            for i, channel in enumerate(omero.get("channels", [])):
+                if "window" in channel:
+                    self.__channel_ranges[i] = (float(channel["window"]["min"]), float(channel["window"]["max"]))
+
+        if isinstance(c_sel, int):
+            channels = [c_sel]
+        elif isinstance(c_sel, slice):
+            channels = list(range(size_c)[c_sel])
+        else:
+            channels = list(c_sel)
+        ranges = [self.__channel_ranges.get(c) for c in channels]
+        if not ranges or any(r is None for r in ranges):
+            return None
+        return min(r[0] for r in ranges), max(r[1] for r in ranges) # type: ignore
+
+    def __resolve_channels(self, c: Optional[ChannelSelection]) -> Optional[Union[int, slice, list[int]]]:
+        """Channel names to indices, via the OME channel names"""
+        if isinstance(c, str):
+            c = [c]
+            single = True
+        else:
+            single = False
+        if isinstance(c, (list, tuple)):
+            names = self._meta["channel_names"]
+            resolved = []
+            for channel in c:
+                if isinstance(channel, str):
+                    if channel not in names:
+                        raise ValueError(f"Unknown channel {channel!r}, expected one of {names}")
+                    channel = names.index(channel)
+                resolved.append(int(channel))
+            return resolved[0] if single else resolved
+        return c
+
+    def __get_levels(self) -> list[zarr.Array]:
+        path = self.file_path
+        with self.__open_lock:
+            if not self.__zarr_data or path is None or path != self.__path:
+                reader = self.__get_reader()
+                self.__zarr_data: list[zarr.Array] = [ # type: ignore
+                    reader[int(dataset["path"])]
+                    for dataset in reader.attrs["multiscales"][0]["datasets"]
+                ]
+                self.__data = []
+            return self.__zarr_data
+
+    def __empty_tiles(self, zarray: zarr.Array, level: int) -> Optional[numpy.ndarray]:
+        """Missing tiles of a level over its zarr chunk grid, `None` if the tiles don't map onto it"""
+        dims = self._res[level]["dims"]
+        spatial = ("height", "width", "sample") if dims[-1] == "sample" else ("height", "width")
+        if dims[-len(spatial):] != spatial:
+            return None
+        try:
+            tile_index = self.get_tile_index(level)
+        except ValueError:
+            return None
+        grid = tuple(ceil(size / chunk) for size, chunk in zip(zarray.shape, zarray.chunks))
+        if int(numpy.prod(grid)) != len(tile_index):
+            return None
+        return (tile_index.tiles["bytecount"] == 0).reshape(grid)
+
+    def __read_window(self,
+                      level: int,
+                      rows: slice,
+                      cols: slice,
+                      c: Optional[ChannelSelection] = None,
+                      z: int = 0,
+                      t: int = 0,
+                      out: Optional[numpy.ndarray] = None,
+                      ) -> numpy.ndarray:
+        """Read a window of one plane straight from the zarr store, as Y, X[, C].
+        Only the intersecting tiles are read, no dask graph is built.
+        """
+        zarray = self.__get_levels()[level]
+        dims = self._res[level]["dims"]
+        channel_idx = _channel_idx(dims)
+        c = self.__resolve_channels(c)
+        if c is None:
+            size_c = 1 if channel_idx is None else zarray.shape[channel_idx]
+            c = slice(None) if size_c > 1 else 0
+
+        selection = []
+        # position in Y, X, C of each axis kept by the selection
+        kept = []
+        for i, dim in enumerate(dims):
+            if dim == "height":
+                selection.append(rows)
+                kept.append(0)
+            elif dim == "width":
+                selection.append(cols)
+                kept.append(1)
+            elif i == channel_idx:
+                selection.append(c)
+                if not isinstance(c, int):
+                    kept.append(2)
+            elif dim == "depth":
+                selection.append(z)
+            elif dim == "time":
+                selection.append(t)
+            else:
+                raise NotImplementedError(f"Unsupported dimension: {dim}")
+
+        # zarr writes into `out` in file order, a transposed view of Y, X[, C]
+        order = numpy.argsort(kept)
+        out_view = None if out is None else out.transpose(numpy.argsort(order))
+        window = zarray.get_orthogonal_selection(tuple(selection), out=out_view)
+        if out is not None:
+            return out
+        return window.transpose(order)
+
+    def level_downsamples(self) -> list[float]:
+        """downsample factor of each pyramid level, relative to level 0"""
+        res = self._res
+        return [
+            min(res[0]["width"] / res[level]["width"], res[0]["height"] / res[level]["height"])
+            for level in range(len(res))
+        ]
+
+    def best_level(self, target_downsample: float) -> int:
+        """The smallest (cheapest) level with a downsample of at most `target_downsample`"""
+        downsamples = self.level_downsamples()
+        candidates = [
+            level for level, downsample in enumerate(downsamples)
+            if downsample <= target_downsample * (1 + 1e-6)
+        ]
+        if not candidates:
+            return 0
+        return max(candidates, key=lambda level: downsamples[level])
+
+    def read_region(self,
+                    x: int,
+                    y: int,
+                    w: int,
+                    h: int,
+                    level: Optional[int] = None,
+                    target_downsample: Optional[float] = None,
+                    c: Optional[ChannelSelection] = None,
+                    z: int = 0,
+                    t: int = 0,
+                    out: Optional[numpy.ndarray] = None,
+                    ) -> numpy.ndarray:
+        """Read a region of one plane, decoding only the tiles it intersects.
+        :param x: left of the region, in level 0 pixels
+        :param y: top of the region, in level 0 pixels
+        :param w: width of the region, in level 0 pixels
+        :param h: height of the region, in level 0 pixels
+        :param level: pyramid level to read from, overrides `target_downsample`
+        :param target_downsample: read from the smallest level with at most this
+            downsample, `None` = level 0
+        :param c: channel index or name, or list or slice of channels; `None` = all channels
+        :param z: z-stack index
+        :param t: time index
+        :param out: preallocated Y, X[, C] buffer of the region at the level
+
+        Returns the region at the resolution of the level, as Y, X[, C];
+        parts of the region outside the image are 0.
+        """
+        if level is None:
+            level = 0 if target_downsample is None else self.best_level(target_downsample)
+
+        res = self._res[level]
+        scale_y = self._res[0]["height"] / res["height"]
+        scale_x = self._res[0]["width"] / res["width"]
+
+        # region in pixels of the level
+        y0 = int(y // scale_y)
+        x0 = int(x // scale_x)
+        y1 = max(y0 + 1, ceil((y + h) / scale_y))
+        x1 = max(x0 + 1, ceil((x + w) / scale_x))
+
+        c = self.__resolve_channels(c)
+        if c is None:
+            size_c = res["channels"]
+            c = slice(None) if size_c > 1 else 0
+        if isinstance(c, int):
+            channel_shape = ()
+        elif isinstance(c, slice):
+            channel_shape = (len(range(res["channels"])[c]),)
+        else:
+            channel_shape = (len(c),)
+        shape = (y1 - y0, x1 - x0) + channel_shape
+
+        if out is None:
+            out = numpy.zeros(shape, dtype=self.__get_levels()[level].dtype)
+        elif out.shape != shape:
+            raise ValueError(f"Expected an output buffer of shape {shape}, got {out.shape}")
+
+        # clip to the image, only the intersecting tiles are read
+        read_y0, read_y1 = max(y0, 0), min(y1, res["height"])
+        read_x0, read_x1 = max(x0, 0), min(x1, res["width"])
+        if read_y0 < read_y1 and read_x0 < read_x1:
+            self.__read_window(
+                level,
+                slice(read_y0, read_y1),
+                slice(read_x0, read_x1),
+                c, z, t,
+                out=out[read_y0 - y0:read_y1 - y0, read_x0 - x0:read_x1 - x0],
+            )
+        return out
+
+    def __tile_grid(self, level: int, order: TileOrder) -> list[tuple[int, int]]:
+        n_tiles_y = self._res[level]["n_tiles_y"]
+        n_tiles_x = self._res[level]["n_tiles_x"]
+        grid = [(iy, ix) for iy in range(n_tiles_y) for ix in range(n_tiles_x)]
+        if order == "row-major":
+            return grid
+        if order == "hilbert":
+            n = 1 << max(n_tiles_y - 1, n_tiles_x - 1, 0).bit_length()
+            return sorted(grid, key=lambda tile: _hilbert_d(n, tile[1], tile[0]))
+        raise ValueError(f"Unsupported tile order: {order}")
+
+    def __read_tile(self,
+                    level: int,
+                    tile_idx: tuple[int, int],
+                    channels: Optional[ChannelSelection] = None,
+                    overlap: int = 0,
+                    z: int = 0,
+                    t: int = 0,
+                    ) -> tuple[tuple[int, int], BBox, numpy.ndarray]:
+        res = self._res[level]
+        tile_height = res["max_tile_height"]
+        tile_width = res["max_tile_width"]
+        iy, ix = tile_idx
+        y0 = max(0, iy * tile_height - overlap)
+        x0 = max(0, ix * tile_width - overlap)
+        y1 = min(res["height"], (iy + 1) * tile_height + overlap)
+        x1 = min(res["width"], (ix + 1) * tile_width + overlap)
+        tile = self.__read_window(level, slice(y0, y1), slice(x0, x1), channels, z, t)
+        return tile_idx, (x0, y0, x1 - x0, y1 - y0), tile
+
+    def iter_tiles(self,
+                   level: int = 0,
+                   channels: Optional[ChannelSelection] = None,
+                   overlap: int = 0,
+                   order: TileOrder = "row-major",
+                   z: int = 0,
+                   t: int = 0,
+                   prefetch: int = 4,
+                   ) -> Iterator[tuple[tuple[int, int], BBox, numpy.ndarray]]:
+        """Stream the tiles of one plane of a pyramid level, one at a time.
+        :param level: pyramid level
+        :param channels: channel index or name, or list or slice of channels;
+            `None` = all channels
+        :param overlap: pixels of the neighbouring tiles added on each side,
+            clipped at the image border
+        :param order: "row-major", or "hilbert" to keep consecutive tiles close
+        :param z: z-stack index
+        :param t: time index
+        :param prefetch: tiles read ahead on a background thread; at most about
+            this many tiles are held in memory, whatever the size of the image
+
+        Yields ((tile_y, tile_x), (x, y, w, h), tile) where the bbox is that of
+        the returned, overlapping window, and the tile is Y, X[, C]
+        """
+        read = partial(self.__read_tile, level, channels=channels, overlap=overlap, z=z, t=t)
+
+        grid = self.__tile_grid(level, order)
+        if prefetch < 1:
+            for tile_idx in grid:
+                yield read(tile_idx)
+            return
+
+        tiles: queue.Queue = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for tile_idx in grid:
+                    item = read(tile_idx)
+                    while not stop.is_set():
+                        try:
+                            tiles.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = done
+            except BaseException as e:
+                item = e
+            while not stop.is_set():
+                try:
+                    tiles.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        producer = threading.Thread(target=produce, name="daskrw-prefetch", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = tiles.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # the consumer may stop early, release the producer
+            stop.set()
+            producer.join()
+
+    def __async_run(self, func, *args, **kwargs):
+        """Run a blocking read on the async executor, admitting at most
+        `async_max_pending` requests at once
+        """
+        loop = asyncio.get_running_loop()
+        if self.__async_executor is None:
+            self.__async_executor = ThreadPoolExecutor(self.async_workers, thread_name_prefix="daskrw-async")
+        # semaphores are bound to the loop they are first used in
+        if self.__async_limit is None or self.__async_loop is not loop:
+            self.__async_limit = asyncio.Semaphore(self.async_max_pending)
+            self.__async_loop = loop
+        limit = self.__async_limit
+
+        async def run():
+            async with limit:
+                return await loop.run_in_executor(self.__async_executor, partial(func, *args, **kwargs))
+        return run()
+
+    async def aread_region(self, *args, **kwargs) -> numpy.ndarray:
+        """Async `read_region`, reads and decodes run on a bounded thread pool"""
+        return await self.__async_run(self.read_region, *args, **kwargs)
+
+    async def aiter_tiles(self,
+                          level: int = 0,
+                          channels: Optional[ChannelSelection] = None,
+                          overlap: int = 0,
+                          order: TileOrder = "row-major",
+                          z: int = 0,
+                          t: int = 0,
+                          prefetch: int = 4,
+                          ) -> AsyncIterator[tuple[tuple[int, int], BBox, numpy.ndarray]]:
+        """Async `iter_tiles`, with up to `prefetch` tiles read concurrently ahead"""
+        await self.__async_run(self.__get_levels)
+        grid = self.__tile_grid(level, order)
+        read = partial(self.__read_tile, level, channels=channels, overlap=overlap, z=z, t=t)
+
+        prefetch = max(1, prefetch)
+        pending: list[asyncio.Future] = []
+        next_tile = 0
+        try:
+            while next_tile < len(grid) or pending:
+                while next_tile < len(grid) and len(pending) < prefetch:
+                    pending.append(asyncio.ensure_future(self.__async_run(read, grid[next_tile])))
+                    next_tile += 1
+                yield await pending.pop(0)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def cache_stats(self) -> CacheStats:
+        """hit/miss/eviction counters of the (possibly shared) tile cache"""
+        return self.cache.stats()
 
     def close(self):
-        if self.__lru_cache:
-            self.__lru_cache.invalidate()
-            self.__lru_cache.close()
-        if self.__store:
+        # cached tiles are kept, they may be shared with other readers of this file
+        if self.__cached_store is not None:
+            # closes the tifffile store too, and the store's memory map
+            self.__cached_store.close()
+        elif self.__store:
             self.__store.close()
+        if self.__tif is not None:
+            self.__tif.close()
+        if self.decoder is not None:
+            self.decoder.close()
+        if self.__async_executor is not None:
+            self.__async_executor.shutdown(wait=False)
+            self.__async_executor = None
 
         self.__data = []
         self.__zarr_data = []
+        self.__tif = None
         self.__store = None
-        self.__lru_cache = None
+        self.__cached_store = None
         self.__reader = None
         self.__path = None
         self.__cached_meta = None
         self.__cached_full_meta = None
+        self.__cached_tiles = None
         self.__dim_idxs = {
             "channel_idx": 0,
             "row_idx": 1,
@@ -318,6 +830,7 @@ class TiledImageReader:
         del self.nth
         del self.channel
         del self.plane
+        del self.frame
 
     def get_series_metadata(self):
         """Should return a dictionary with the following keys:
@@ -342,16 +855,17 @@ class TiledImageReader:
 
             meta_dict[MD_SIZE_Z].append(standard_meta["z_size"])
             meta_dict[MD_SIZE_T].append(standard_meta["t_size"])
-            if "channel" in meta_series_dims:
-                series_c_idx = meta_series_dims.index("channel")
-            elif "sequence" in meta_series_dims:
-                series_c_idx = meta_series_dims.index("sequence")
-            else:
-                series_c_idx = None
+            series_c_idx = None
+            for channel_dim in CHANNEL_DIMS:
+                if channel_dim in meta_series_dims:
+                    series_c_idx = meta_series_dims.index(channel_dim)
+                    break
             series_y_idx = meta_series_dims.index("height")
             series_x_idx = meta_series_dims.index("width")
             if series_c_idx is not None:
                 meta_dict[MD_SIZE_C].append(meta_series_shape[series_c_idx])
+            else:
+                meta_dict[MD_SIZE_C].append(1)
             meta_dict[MD_SIZE_Y].append(meta_series_shape[series_y_idx])
             meta_dict[MD_SIZE_X].append(meta_series_shape[series_x_idx])
             #meta_dict[MD_SERIES_NAME].append(meta_series["name"] or "<no_name>")
@@ -359,26 +873,6 @@ class TiledImageReader:
             meta_dict[MD_TILE_SIZE_X].append(standard_meta["tile_width"])
         return meta_dict
 
-    # def _tile_n(self, nth: int, channel: slice = slice(0,1,1), level: int = 0) -> daskArray:
-    #     assert self.__data, "No data read yet (read_tile failed or was never called)"
-    #     assert len(self.__data) > level
-    #     assert level >= 0
-
-    #     # _res = self._res
-    #     row_slice, col_slice = self._n_slices(nth, level)
-
-    #     tile = self.__data[level][row_slice, col_slice, channel]
-
-    #     assert 0 not in tile.shape, f"invalid shape {tile.shape}"
-
-    #     return tile
-
-    # def _decrement_channel(self, curr_channel: slice, level: Optional[int]) -> slice:
-    #     return self._set_channel(start = curr_channel.start - 1, stop = curr_channel.stop - 1, step = curr_channel.step, lvl = level)
-
-    # def _increment_channel(self, curr_channel: slice, level: Optional[int]) -> slice:
-    #     return self._set_channel(start = curr_channel.start + 1, stop = curr_channel.stop + 1, step = curr_channel.step, lvl = level)
-
     def _set_channel(self, start: int, stop: Optional[int] = None, step: Optional[int] = None, lvl: Optional[int] = None) -> slice:
         if lvl:
             max_channel = self._res[lvl]["channels"] - 1
@@ -400,61 +894,6 @@ class TiledImageReader:
 
         return slice(start, stop, step)
 
-    # def _n_slices(self, n: int, lvl: int = 0) -> tuple[slice, slice]:
-    #     """0-indexed, assumes row major"""
-    #     n_tiles_x = self._res[lvl]["n_tiles_x"]
-    #     tile_row = int(n // n_tiles_x)
-    #     tile_col = int(n % n_tiles_x)
-
-    #     assert n_tiles_x > 0
-
-    #     row_start = int(tile_row * self._res[lvl]["max_tile_height"])
-    #     row_end = int(row_start + self._res[lvl]["max_tile_height"])
-
-    #     col_start = int(tile_col * self._res[lvl]["max_tile_width"])
-    #     col_end = int(col_start + self._res[lvl]["max_tile_width"])
-
-    #     assert row_end > row_start
-    #     assert col_end > col_start
-    #     
-    #     return (slice(row_start, row_end, 1), slice(col_start, col_end, 1))
-
-    # def _nn(self, lvl: int):
-    #     """num of nth values"""
-    #     return self._nx(lvl) * self._ny(lvl)
-
-    # def _iy(self, lvl: int, n: int):
-    #     """idx of tile in the y direction"""
-    #     _tile_width = self._tile_width(lvl)
-    #     _img_width = self._res[lvl]["width"]
-
-    #     n_tile_cols = ceil(_img_width / _tile_width)
-
-    #     return n // n_tile_cols
-
-    # def _ny(self, lvl: int):
-    #     """num tiles in y direction"""
-    #     return self._res[lvl]["n_tiles_y"]
-
-    # def _ix(self, lvl: int, n: int):
-    #     """idx of tile in the x direction"""
-    #     _tile_width = self._tile_width(lvl)
-    #     _img_width = self._res[lvl]["width"]
-
-    #     n_tile_cols = ceil(_img_width / _tile_width)
-
-    #     return n % n_tile_cols
-
-    # def _nx(self, lvl: int):
-    #     """num tiles in the x direction"""
-    #     return self._res[lvl]["n_tiles_x"]
-
-    # def _tile_height(self, lvl: int):
-    #     return self._res[lvl]["max_tile_height"]
-
-    # def _tile_width(self, lvl: int):
-    #     return self._res[lvl]["max_tile_width"]
-
     def get_level(self):
         return self._read_tracker["level"]
 
@@ -518,20 +957,103 @@ class TiledImageReader:
     @property
     def _meta(self):
         if not self.__cached_meta:
-            self.__cached_meta = self.__extract_standard_metadata()
+            if self.metadata_index is None:
+                self.__cached_meta = self.__extract_standard_metadata()
+            else:
+                self.__load_index()
         return self.__cached_meta
 
+    def __load_index(self):
+        assert self.metadata_index is not None
+
+        entry = self.metadata_index.load(self.file_path)
+        if entry is None:
+            meta = self.__extract_standard_metadata()
+            tiles = self.__extract_tile_layout()
+            self.metadata_index.save(self.file_path, meta, tiles)
+        else:
+            meta = entry["metadata"]
+            tiles = entry["tiles"]
+        self.__cached_meta = meta
+        self.__cached_tiles = tiles
+
+    def get_tile_layout(self, level: int) -> TileLayout:
+        """File offsets and bytecounts of every tile of a pyramid level.
+        Without a metadata index this walks every page of the file on first call,
+        those of the open file if the image was read already.
+        """
+        if self.__cached_tiles is None:
+            if self.metadata_index is not None:
+                self.__load_index()
+            elif self.__tif is not None:
+                # the pages of the open file's levels are parsed already
+                self.__cached_tiles = {
+                    i: _level_tile_layout(level) for i, level in enumerate(self.__tif.series[0].levels)
+                }
+            else:
+                self.__cached_tiles = self.__extract_tile_layout()
+        assert self.__cached_tiles is not None
+        return self.__cached_tiles[level]
+
+    def get_tile_index(self, level: int) -> TileIndex:
+        """Array-backed index of the tiles of a pyramid level, for vectorized
+        queries of their offsets, bytecounts and bounding boxes; built once per level
+        """
+        index = self.__tile_indexes.get(level)
+        if index is None:
+            res = self._res[level]
+            index = TileIndex.from_layout(
+                self.get_tile_layout(level),
+                res["height"],
+                res["width"],
+                res["max_tile_height"],
+                res["max_tile_width"],
+            )
+            self.__tile_indexes[level] = index
+        return index
+
+    def get_tile_encoding(self, level: int) -> TileEncoding:
+        """Compression and sample layout of the tiles of a pyramid level, as stored"""
+        with tifffile.TiffFile(self.file_path) as tif:
+            keyframe = tif.series[0].levels[level].keyframe
+            return {
+                "compression": int(keyframe.compression),
+                "predictor": int(keyframe.predictor),
+                "fillorder": int(keyframe.fillorder),
+                "bitspersample": int(keyframe.bitspersample),
+                "samplesperpixel": int(keyframe.samplesperpixel),
+                "photometric": int(keyframe.photometric),
+                "byteorder": tif.byteorder, # type: ignore
+                "dtype": str(keyframe.dtype),
+                "is_tiled": bool(keyframe.is_tiled),
+                "tile_shape": tuple(int(n) for n in keyframe.chunks),
+                "jpegtables": keyframe.jpegtables,
+            }
+
     @property
     def _full_meta(self):
+        return self.get_full_metadata()
+
+    def get_full_metadata(self, max_pages: Optional[int] = None, include_tags: bool = True):
+        """Opt-in dump of every series, page and (optionally) tag in the file.
+        Walks every IFD, so it is slow on files with many pages; it is computed
+        on first access only, nothing else in the reader depends on it.
+        :param max_pages: only dump the first `max_pages` pages, `None` = all
+        :param include_tags: include the tags of each dumped page
+        """
+        if max_pages is not None or not include_tags:
+            return self.__extract_metadata(max_pages=max_pages, include_tags=include_tags)
         if not self.__cached_full_meta:
             self.__cached_full_meta = self.__extract_metadata(max_pages=None, include_tags=True)
         return self.__cached_full_meta
 
     def __extract_standard_metadata(self) -> StandardMetadata:
-        full_meta = self.__extract_metadata(max_pages=None, include_tags=False)
+        full_meta = self.__extract_essential_metadata()
+        if full_meta is None:
+            full_meta = self.__extract_metadata(max_pages=1, include_tags=False)
         pixels_meta = full_meta["metadatas"]["ome"]["OME"]["Image"]["Pixels"]
 
-        endiness = "<" if pixels_meta["@BigEndian"] == "false" else ">"
+        endiness = "<" if pixels_meta.get("@BigEndian", "false") == "false" else ">"
         dim_order = str(pixels_meta["@DimensionOrder"])
 
         y_idx = dim_order.index("Y")
@@ -563,9 +1085,13 @@ class TiledImageReader:
 
         dtype = str(pixels_meta["@Type"])
 
+        channels_meta = pixels_meta.get("Channel", [])
+        # a single channel is parsed as a dict rather than a list
+        if isinstance(channels_meta, dict):
+            channels_meta = [channels_meta]
         channel_names = tuple(
-            channel_info.get("Name", channel_info.get("@ID", str(idx)))
-            for idx, channel_info in enumerate(pixels_meta.get("Channel", []))
+            channel_info.get("@Name", channel_info.get("@ID", str(idx)))
+            for idx, channel_info in enumerate(channels_meta)
         )
 
         tile_height = int(full_meta["pages"][0]["tilelength"])
@@ -576,21 +1102,27 @@ class TiledImageReader:
         levels_dim_order = tuple(map(lambda d: str(d), full_meta["series"][0]["dims"]))
         levels_height_idx = levels_dim_order.index("height")
         levels_width_idx = levels_dim_order.index("width")
-        if "channel" in levels_dim_order:
-            levels_ch_idx = levels_dim_order.index("channel")
-        elif "sequence" in levels_dim_order:
-            levels_ch_idx = levels_dim_order.index("sequence")
+        for channel_dim in CHANNEL_DIMS:
+            if channel_dim in levels_dim_order:
+                levels_ch_idx = levels_dim_order.index(channel_dim)
+                break
         else:
-            levels_ch_idx = {0,1,2}.difference((levels_height_idx, levels_width_idx)).pop()
+            if len(levels_dim_order) == 3:
+                levels_ch_idx = {0,1,2}.difference((levels_height_idx, levels_width_idx)).pop()
+            else:
+                levels_ch_idx = None
 
-        levels = full_meta["series"][0]["pyramid"]["levels"]
+        if "pyramid" in full_meta["series"][0]:
+            levels = full_meta["series"][0]["pyramid"]["levels"]
+        else:
+            levels = [full_meta["series"][0]]
         for i, level in enumerate(levels):
             level_shape = tuple(map(lambda v: int(v), level["shape"]))
 
             level_dims = levels_dim_order
             level_height = level_shape[levels_height_idx]
             level_width = level_shape[levels_width_idx]
-            level_channels = level_shape[levels_ch_idx]
+            level_channels = 1 if levels_ch_idx is None else level_shape[levels_ch_idx]
             level_max_tile_height = min(tile_height, level_height)
             level_max_tile_width = min(tile_width, level_width)
             level_n_tiles_y = ceil(level_height / level_max_tile_height)
@@ -635,6 +1167,83 @@ class TiledImageReader:
             "resolutions": resolutions,
         }
 
+    def __extract_essential_metadata(self):
+        """Read only what `StandardMetadata` needs: the first IFD, its SubIFDs
+        (pyramid levels) and the OME XML, parsed once.
+
+        Mirrors how tifffile lays out an OME series, without loading every page
+        of the file the way `tif.series` does.
+        Returns the subset of `__extract_metadata`'s layout that is used, or
+        `None` if the file needs the full page walk to be interpreted.
+        """
+        with tifffile.TiffFile(self.file_path) as tif:
+            page = tif.pages.first
+            if not tif.is_ome:
+                return None
+
+            ome = xmltodict.parse(tif.ome_metadata)
+            image = ome["OME"].get("Image")
+            # multi-image files, modulo annotations, multi-file datasets
+            if not isinstance(image, dict) or "StructuredAnnotations" in ome["OME"]:
+                return None
+            pixels = image["Pixels"]
+            tiff_data = pixels.get("TiffData", [])
+            tiff_data = [tiff_data] if isinstance(tiff_data, dict) else tiff_data
+            if any("UUID" in td for td in tiff_data):
+                return None
+
+            axes = "".join(reversed(pixels["@DimensionOrder"]))
+            shape = [int(pixels[f"@Size{ax}"]) for ax in axes]
+
+            channels = pixels.get("Channel", [])
+            channels = [channels] if isinstance(channels, dict) else channels
+            spp = int(channels[0].get("@SamplesPerPixel", 1)) if channels else 1
+            if spp > 1:
+                shape = [size // spp if ax == "C" else size for size, ax in zip(shape, axes)]
+                if page.planarconfig == 1:
+                    shape += [spp]
+                    axes += "S"
+                else:
+                    shape = shape[:-2] + [spp] + shape[-2:]
+                    axes = axes[:-2] + "S" + axes[-2:]
+            if "S" not in axes:
+                shape += [1]
+                axes += "S"
+
+            # squeeze length-1 dimensions, except Y and X
+            squeezed = [(size, ax) for size, ax in zip(shape, axes) if size > 1 or ax in "YX"]
+            shape = [size for size, _ in squeezed]
+            axes = "".join(ax for _, ax in squeezed)
+            if tuple(page.shape) != tuple(shape[-len(page.shape):]):
+                return None
+
+            levels = [{"shape": tuple(shape)}]
+            for level, offset in enumerate(page.subifds or ()):
+                tif.filehandle.seek(offset)
+                level_page = tifffile.TiffPage(tif, (page.index, level + 1))
+                level_shape = [
+                    level_page.imagelength if ax == "Y" else
+                    level_page.imagewidth if ax == "X" else size
+                    for size, ax in zip(shape, axes)
+                ]
+                levels.append({"shape": tuple(level_shape)})
+
+            return {
+                "metadatas": {"ome": ome},
+                "pages": [{
+                    "tilelength": page.tilelength,
+                    "tilewidth": page.tilewidth,
+                }],
+                "series": [{
+                    "dims": tuple(tifffile.TIFF.AXES_NAMES.get(ax, ax) for ax in axes),
+                    "pyramid": {"levels": levels},
+                }],
+            }
+
+    def __extract_tile_layout(self) -> dict[int, TileLayout]:
+        with tifffile.TiffFile(self.file_path) as tif:
+            return {i: _level_tile_layout(level) for i, level in enumerate(tif.series[0].levels)}
+
     def __extract_metadata(self, max_pages: Optional[int] = None, include_tags: bool = False):
         def sp(val): return f"{val:_}" if type(val) is type(
             1) or type(val) is type(1.1) else val
@@ -753,11 +1362,11 @@ class TiledImageReader:
                     metadata['pages'][i]['resolutionunit_value'] = sp(tif.pages[i].resolutionunit.value)  # type: ignore
                 if hasattr(tif.pages[i], 'software'):
                     metadata['pages'][i]['software'] = tif.pages[i].software  # type: ignore
-                if hasattr(tif.pages[i], 'software'):
-                    metadata['pages'][i]['tile'] = spmap(tif.pages[i].tile)  # type: ignore
                 if hasattr(tif.pages[i], 'tile'):
-                    metadata['pages'][i]['tilewidth'] = sp(tif.pages[i].tilewidth)  # type: ignore
+                    metadata['pages'][i]['tile'] = spmap(tif.pages[i].tile)  # type: ignore
                 if hasattr(tif.pages[i], 'tilewidth'):
+                    metadata['pages'][i]['tilewidth'] = sp(tif.pages[i].tilewidth)  # type: ignore
+                if hasattr(tif.pages[i], 'tilelength'):
                     metadata['pages'][i]['tilelength'] = sp(tif.pages[i].tilelength)  # type: ignore
 
                 if include_tags:
@@ -0,0 +1,172 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from collections.abc import MutableMapping
+from typing import TypedDict, Callable, Optional
+
+from zarr.storage import BaseStore
+
+ZARR_META_KEYS = ('.zarray', '.zattrs', '.zgroup', '.zmetadata')
+
+# called with (counter name, increment) on every update
+StatsCallback = Callable[[str, float], None]
+
+class StatsSnapshot(TypedDict):
+    # reader
+    tiles_read: int
+    bytes_read: int
+    read_seconds: float
+    tiles_decoded: int
+    # tiles of uncompressed levels served as views of a memory map, neither
+    # read nor decoded, so not in the counts above
+    tiles_mapped: int
+    # without a decode pool tifffile reads and decodes in one call,
+    # then its read time is counted here too
+    decode_seconds: float
+    cache_hits: int
+    cache_misses: int
+    cache_evictions: int
+    # writer
+    chunks_written: int
+    bytes_written: int
+    encode_seconds: float
+    write_seconds: float
+
+
+class Stats:
+    """
+    Thread-safe counters and timers of the stages of reads and writes
+
+    Pass one to `TiledImageReader` and/or `TiledImageWriter` (it may be
+    shared), and read it with `snapshot()`, or `subscribe` callbacks to
+    forward every update, e.g. to Prometheus counters or a logger.
+    Readers and writers without stats skip all of the bookkeeping.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters: dict[str, float] = dict.fromkeys(StatsSnapshot.__annotations__, 0)
+        self.__callbacks: list[StatsCallback] = []
+        self.__local = threading.local()
+
+    def subscribe(self, callback: StatsCallback):
+        with self.__lock:
+            self.__callbacks.append(callback)
+
+    def unsubscribe(self, callback: StatsCallback):
+        with self.__lock:
+            self.__callbacks.remove(callback)
+
+    def add(self, name: str, value: float = 1):
+        with self.__lock:
+            self.__counters[name] += value
+            callbacks = self.__callbacks[:] if self.__callbacks else None
+        if callbacks:
+            for callback in callbacks:
+                callback(name, value)
+        if name == "write_seconds":
+            # lets a chunk write tell its encode time from its store time
+            self.__local.write_seconds = getattr(self.__local, "write_seconds", 0.0) + value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def thread_write_seconds(self) -> float:
+        """store write seconds spent so far by the calling thread"""
+        return getattr(self.__local, "write_seconds", 0.0)
+
+    def snapshot(self) -> StatsSnapshot:
+        with self.__lock:
+            return dict(self.__counters) # type: ignore
+
+    def reset(self):
+        with self.__lock:
+            for name in self.__counters:
+                self.__counters[name] = 0
+
+
+def timed(stats: Optional[Stats], name: str):
+    """`stats.timer(name)`, or a no-op without stats"""
+    if stats is None:
+        return nullcontext()
+    return stats.timer(name)
+
+
+class InstrumentedStore(BaseStore):
+    """zarr store counting the chunks and (encoded) bytes written to another store"""
+
+    def __init__(self, store: MutableMapping, stats: Stats):
+        self.__store = store
+        self.__stats = stats
+        # zarr records the wrapped store's chunk key separator in new arrays
+        self._dimension_separator = getattr(store, "_dimension_separator", None)
+
+    @property
+    def store(self) -> MutableMapping:
+        return self.__store
+
+    def __setitem__(self, key, value):
+        with self.__stats.timer("write_seconds"):
+            self.__store[key] = value
+        if not key.endswith(ZARR_META_KEYS):
+            self.__stats.add("chunks_written")
+            self.__stats.add("bytes_written", memoryview(value).nbytes)
+
+    def __getitem__(self, key):
+        return self.__store[key]
+
+    def __delitem__(self, key):
+        del self.__store[key]
+
+    def __contains__(self, key):
+        return key in self.__store
+
+    def __iter__(self):
+        return iter(self.__store)
+
+    def __len__(self):
+        return len(self.__store)
+
+    def listdir(self, path: str = ""):
+        return self.__store.listdir(path) # type: ignore
+
+    def rmdir(self, path: str = ""):
+        self.__store.rmdir(path) # type: ignore
+
+    def flush(self):
+        flush = getattr(self.__store, "flush", None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        close = getattr(self.__store, "close", None)
+        if close is not None:
+            close()
+
+
+class InstrumentedTarget:
+    """`dask.array.store` target timing the encoding of chunks written to a zarr array
+    through an `InstrumentedStore`: the time of each write, less its store time
+    """
+
+    def __init__(self, zarray, stats: Stats):
+        self.zarray = zarray
+        self.stats = stats
+        self.shape = zarray.shape
+        self.dtype = zarray.dtype
+        self.path = zarray.path
+
+    def __setitem__(self, region, value):
+        start = time.perf_counter()
+        stored_before = self.stats.thread_write_seconds()
+        self.zarray[region] = value
+        stored = self.stats.thread_write_seconds() - stored_before
+        self.stats.add("encode_seconds", max(0.0, time.perf_counter() - start - stored))
+
+    def __getitem__(self, region):
+        return self.zarray[region]
@@ -0,0 +1,266 @@
+import os
+import math
+import tempfile
+from typing import Optional, Iterator
+
+import numpy
+import tifffile
+import dask
+from dask.array.core import Array as daskArray
+
+from .reader import TiledImageReader
+from .writer import TiledImageWriter, as_tczyx, data_region, reader_level
+from .downsample import downsample, DownsampleMethod
+
+# (t, c, z, y, x) region of a level and the t,c,z,y,x data written to it
+Piece = tuple[tuple[slice, ...], daskArray]
+
+
+class TiledTiffWriter:
+    """
+    Writes pyramidal OME-TIFF: one BigTIFF with level 0 as the pages of its
+    series, one page per t, c, z plane, and the other levels as SubIFDs
+
+    `write_tiled` only records the (dask) data of each level, `close` then
+    streams the file out level after level, plane after plane, tile row after
+    tile row. Only one band of rows of a level is computed at a time, and its
+    tiles are compressed by a pool of threads as tifffile writes them in order.
+    Planes never written are zeros. OME-Zarr levels can be written with
+    `write_tiled(dask.array.from_zarr(level), series)`.
+
+    Bands are computed plane by plane, so the tiles of an interleaved (RGB)
+    source are decoded again for each of its channels.
+    """
+
+    def __init__(self,
+                 file_path,
+                 img_shapes,
+                 tile: tuple[int, int] = (256, 256),
+                 compression: Optional[str] = "zlib",
+                 clevel: Optional[int] = None,
+                 maxworkers: Optional[int] = None,
+                 channel_names: Optional[list[str]] = None,
+                 ):
+        """
+        @param file_path: path to destination file
+                          if None, a temp file is created automatically
+        @param img_shapes: a list of size equal to the number of series,
+                           with elements of size 5 of dimensions sizes for
+                           t,c,z,y,x (in that order)
+        @param tile: tile height and width, multiples of 16
+        @param compression: tifffile compression of every level, e.g. "zlib",
+                            "zstd", "lzw", "jpeg", or None
+        @param clevel: compression level (quality for jpeg), None = the codec's default
+        @param maxworkers: threads compressing tiles, None = one per CPU
+        @param channel_names: labels of the channels in the OME metadata
+        """
+        if file_path is None:
+            file_path = TiledImageWriter.create_temp_file(suffix=".ome.tiff")
+
+        self.file_path = file_path
+        self.img_shapes = img_shapes
+        self.tile = tuple(tile)
+        self.compression = compression
+        self.clevel = clevel
+        self.maxworkers = maxworkers
+        self.channel_names = channel_names
+        self.__pieces: dict[int, list[Piece]] = dict()
+        # (factor, method) of the levels generated by `write_downsampled`
+        self.__downsampling: Optional[tuple[int, DownsampleMethod]] = None
+
+    def write_tiled(self,
+                    data: daskArray,
+                    series=None,
+                    c=None,
+                    z=None,
+                    t=None,
+                    ):
+        """Write a series of planes to the image file. Mimics the Bioformats API
+        @param data: Y, X plane, or Z, Y, X stack, or T, Z, Y, X, or T, C, Z, Y, X volume
+        @param series: series (pyramid level)
+        @param c: write from this channel. `None` = write color image if multichannel
+            or interleaved RGB.
+        @param z: z-stack index of the first plane of data, or slice of planes
+        @param t: time index of the first frame of data, or slice of frames
+        n.b. nothing is computed until `close`, later writes of a plane win
+        """
+        series = 0 if series is None else int(series)
+        data = as_tczyx(data)
+        region = data_region(data, c, z, t)
+        shape = self.img_shapes[series]
+        if any(r.stop > size for r, size in zip(region, shape)):
+            raise ValueError(f"Region {region} exceeds level {series} of shape {shape}")
+        self.__pieces.setdefault(series, []).append((region, data))
+
+    def write_downsampled(self,
+                          data: daskArray,
+                          levels: int,
+                          method: DownsampleMethod = "mean",
+                          factor: int = 2,
+                          ):
+        """Write `data` as level 0, and generate `levels - 1` downsampled levels from it.
+        @param data: full resolution t,c,z,y,x array
+        @param levels: total number of levels, level 0 included
+        @param method: "mean", "nearest" or "mode" (for label images)
+        @param factor: y and x downsampling factor between consecutive levels
+
+        `img_shapes` is replaced by the generated level shapes. Only `data`
+        is read: as `close` writes a level, each of its bands is downsampled
+        into an uncompressed temporary file next to the output, which the next
+        level is then written from.
+        """
+        assert data.ndim == 5, "data must be t,c,z,y,x"
+        assert levels >= 1
+
+        # lazy, for the shapes only
+        level_data = [data]
+        for _ in range(1, levels):
+            level_data.append(downsample(level_data[-1], factor, method))
+
+        self.img_shapes = [tuple(d.shape) for d in level_data]
+        self.__pieces.clear()
+        self.__downsampling = (factor, method) if levels > 1 else None
+        self.write_tiled(data, series=0)
+
+    def write_pyramid(self,
+                      reader: TiledImageReader,
+                      levels: Optional[int] = None,
+                      method: DownsampleMethod = "mean",
+                      ):
+        """Write every pyramid level and channel of an image.
+        @param reader: reader of the source image, its levels must match `img_shapes`
+        @param levels: if set, only level 0 is read from the source, and this
+                       many levels are generated from it, see `write_downsampled`
+        @param method: downsampling of generated levels, "mean", "nearest" or "mode"
+        """
+        if self.channel_names is None:
+            self.channel_names = list(reader._meta["channel_names"]) or None
+
+        if levels is not None:
+            self.write_downsampled(reader_level(reader, 0), levels, method=method)
+            return
+
+        for series in range(len(self.img_shapes)):
+            self.write_tiled(reader_level(reader, series), series=series)
+
+    def __dtype(self) -> numpy.dtype:
+        dtypes = {numpy.dtype(data.dtype) for pieces in self.__pieces.values() for _, data in pieces}
+        if len(dtypes) != 1:
+            raise ValueError(f"Expected data of one dtype, got {dtypes or 'none'}")
+        return dtypes.pop()
+
+    def __band_height(self, series: int) -> int:
+        """Rows of a band of a level: whole rows of tiles, at least a row of its dask chunks"""
+        tile_height = self.tile[0]
+        chunk_height = max((data.chunksize[-2] for _, data in self.__pieces.get(series, [])), default=tile_height)
+        return tile_height * max(1, -(-chunk_height // tile_height))
+
+    def __band(self, series: int, plane: tuple[int, int, int], rows: slice, dtype: numpy.dtype) -> numpy.ndarray:
+        """Rows of a t, c, z plane of a level, assembled from the data written to it"""
+        width = self.img_shapes[series][-1]
+        band = numpy.zeros((rows.stop - rows.start, width), dtype=dtype)
+        parts = []
+        for region, data in self.__pieces.get(series, []):
+            if not all(r.start <= i < r.stop for r, i in zip(region, plane)):
+                continue
+            y0 = max(rows.start, region[3].start)
+            y1 = min(rows.stop, region[3].stop)
+            if y1 <= y0:
+                continue
+            t, c, z = (i - r.start for r, i in zip(region, plane))
+            parts.append(((slice(y0 - rows.start, y1 - rows.start), region[4]), data[t, c, z, y0:y1]))
+        if parts:
+            values = dask.compute(*(data for _, data in parts))
+            for (where, _), value in zip(parts, values):
+                band[where] = value
+        return band
+
+    def __spill(self, series: int, dtype: numpy.dtype) -> numpy.memmap:
+        """An uncompressed temporary array for a generated level, removed once closed"""
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        return numpy.memmap(tempfile.TemporaryFile(dir=directory), dtype=dtype, mode="w+",
+                            shape=tuple(self.img_shapes[series]))
+
+    def __tiles(self,
+                series: int,
+                dtype: numpy.dtype,
+                below: Optional[numpy.memmap] = None,
+                ) -> Iterator[numpy.ndarray]:
+        """Tiles of a level in file order: planes in t, c, z order, then rows and columns of tiles
+        @param below: the next level, filled with each band downsampled
+        """
+        size_t, size_c, size_z, height, width = self.img_shapes[series]
+        tile_height, tile_width = self.tile
+        band_height = self.__band_height(series)
+        if below is not None:
+            # bands of whole windows, so they downsample like the whole level
+            factor, method = self.__downsampling
+            band_height = math.lcm(band_height, factor)
+        for plane in numpy.ndindex(size_t, size_c, size_z):
+            for band_start in range(0, height, band_height):
+                rows = slice(band_start, min(height, band_start + band_height))
+                band = self.__band(series, plane, rows, dtype)
+                if below is not None:
+                    reduced = downsample(dask.array.from_array(band, chunks=band.shape), factor, method)
+                    y0 = band_start // factor
+                    below[plane][y0:y0 + reduced.shape[0]] = reduced.compute(scheduler="synchronous")
+                for y in range(0, band.shape[0], tile_height):
+                    for x in range(0, width, tile_width):
+                        tile = band[y:y + tile_height, x:x + tile_width]
+                        if tile.shape != (tile_height, tile_width):
+                            # edge tiles are padded
+                            tile = numpy.pad(
+                                tile, ((0, tile_height - tile.shape[0]), (0, tile_width - tile.shape[1]))
+                            )
+                        yield tile
+
+    def close(self):
+        """Write the file"""
+        if not self.__pieces:
+            return
+        dtype = self.__dtype()
+        options = dict(
+            dtype=dtype,
+            tile=self.tile,
+            compression=self.compression,
+            compressionargs=None if self.clevel is None else {"level": self.clevel},
+            photometric="minisblack",
+            maxworkers=self.maxworkers,
+        )
+        metadata = {"axes": "TCZYX"}
+        if self.channel_names is not None and len(self.channel_names) == self.img_shapes[0][1]:
+            # e.g. interleaved sources name their samples as one channel
+            metadata["Channel"] = {"Name": list(self.channel_names)}
+
+        above: Optional[numpy.memmap] = None
+        generated: list[Piece] = []
+        try:
+            with tifffile.TiffWriter(self.file_path, bigtiff=True, ome=True) as tif:
+                for series, shape in enumerate(self.img_shapes):
+                    below = None
+                    if self.__downsampling is not None and series + 1 < len(self.img_shapes):
+                        below = self.__spill(series + 1, dtype)
+                    if above is not None:
+                        # under any later writes to the level
+                        piece = (tuple(slice(0, size) for size in shape),
+                                 dask.array.from_array(above, chunks=(1, 1, 1, self.tile[0], -1)))
+                        generated.append(piece)
+                        self.__pieces.setdefault(series, []).insert(0, piece)
+                    tiles = self.__tiles(series, dtype, below)
+                    if series == 0:
+                        tif.write(tiles, shape=tuple(shape),
+                                  subifds=len(self.img_shapes) - 1, metadata=metadata, **options)
+                    else:
+                        tif.write(tiles, shape=tuple(shape), subfiletype=1, **options)
+                    above = below
+        finally:
+            for pieces in self.__pieces.values():
+                pieces[:] = [piece for piece in pieces if not any(piece is g for g in generated)]
+        self.__pieces.clear()
+        self.__downsampling = None
+
+    def delete(self):
+        self.__pieces.clear()
+        self.__downsampling = None
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
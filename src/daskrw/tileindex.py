@@ -0,0 +1,121 @@
+from math import ceil
+from typing import Optional, Sequence, Union
+
+import numpy
+
+from .metaindex import TileLayout
+
+# one record per tile, bbox in pixels of the level
+TILE_DTYPE = numpy.dtype([
+    ("plane", numpy.uint32),
+    ("row", numpy.uint32),
+    ("col", numpy.uint32),
+    ("offset", numpy.uint64),
+    ("bytecount", numpy.uint64),
+    ("x", numpy.uint32),
+    ("y", numpy.uint32),
+    ("width", numpy.uint32),
+    ("height", numpy.uint32),
+])
+
+Planes = Union[int, slice, Sequence[int], None]
+
+
+class TileIndex:
+    """
+    Tiles of a pyramid level as one structured array, see `TILE_DTYPE`
+
+    Tiles are laid out as (plane, row, col), planes being the pages of the
+    level in series order (and the samples of each page, if stored planar),
+    so region queries are slices of the array rather than loops over tiles.
+    """
+
+    def __init__(self, tiles: numpy.ndarray, height: int, width: int, tile_height: int, tile_width: int):
+        """
+        @param tiles: (planes, rows, cols) array of TILE_DTYPE records
+        """
+        self.tiles = tiles
+        self.height = height
+        self.width = width
+        self.tile_height = tile_height
+        self.tile_width = tile_width
+        self.__nonempty: Optional[numpy.ndarray] = None
+
+    @classmethod
+    def from_layout(cls, layout: TileLayout, height: int, width: int, tile_height: int, tile_width: int):
+        n_rows = ceil(height / tile_height)
+        n_cols = ceil(width / tile_width)
+        offsets = layout["offsets"].reshape(-1)
+        if offsets.size % (n_rows * n_cols):
+            raise ValueError(f"{offsets.size} tiles don't fill a {n_rows} x {n_cols} tile grid")
+        n_planes = offsets.size // (n_rows * n_cols)
+
+        tiles = numpy.empty((n_planes, n_rows, n_cols), dtype=TILE_DTYPE)
+        planes, rows, cols = numpy.indices(tiles.shape, dtype=numpy.uint32)
+        tiles["plane"] = planes
+        tiles["row"] = rows
+        tiles["col"] = cols
+        tiles["offset"] = offsets.reshape(tiles.shape)
+        tiles["bytecount"] = layout["bytecounts"].reshape(tiles.shape)
+        tiles["y"] = rows * tile_height
+        tiles["x"] = cols * tile_width
+        # edge tiles are clipped to the level
+        tiles["height"] = numpy.minimum(tile_height, height - rows * tile_height)
+        tiles["width"] = numpy.minimum(tile_width, width - cols * tile_width)
+        return cls(tiles, height, width, tile_height, tile_width)
+
+    def __len__(self):
+        return self.tiles.size
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """(planes, rows, cols) of the tile grid"""
+        return self.tiles.shape # type: ignore
+
+    def __select_planes(self, planes: Planes) -> numpy.ndarray:
+        if planes is None:
+            return self.tiles
+        if isinstance(planes, int):
+            return self.tiles[planes:planes + 1]
+        if isinstance(planes, slice):
+            return self.tiles[planes]
+        return self.tiles[numpy.asarray(planes)]
+
+    def grid_slices(self, x: int, y: int, w: int, h: int) -> tuple[slice, slice]:
+        """rows and cols of the tiles intersecting the box, clipped to the level"""
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + w), min(self.height, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return slice(0, 0), slice(0, 0)
+        return (
+            slice(y0 // self.tile_height, -(-y1 // self.tile_height)),
+            slice(x0 // self.tile_width, -(-x1 // self.tile_width)),
+        )
+
+    def in_bbox(self, x: int, y: int, w: int, h: int, planes: Planes = None) -> numpy.ndarray:
+        """records of the tiles intersecting the box (in pixels of the level), of the given planes"""
+        rows, cols = self.grid_slices(x, y, w, h)
+        return self.__select_planes(planes)[:, rows, cols].reshape(-1)
+
+    def nonempty(self, planes: Planes = None) -> numpy.ndarray:
+        """records of the tiles stored in the file, missing tiles have no bytes"""
+        if planes is None and self.__nonempty is not None:
+            return self.__nonempty
+        tiles = self.__select_planes(planes).reshape(-1)
+        nonempty = tiles[tiles["bytecount"] > 0]
+        if planes is None:
+            self.__nonempty = nonempty
+        return nonempty
+
+    def bytes_to_read(self, x: int, y: int, w: int, h: int, planes: Planes = None) -> int:
+        """stored bytes of the tiles intersecting the box"""
+        rows, cols = self.grid_slices(x, y, w, h)
+        return int(self.__select_planes(planes)["bytecount"][:, rows, cols].sum())
+
+    def byte_ranges(self, tiles: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """(start, stop) file offsets of the given tile records (default: all), sorted by offset"""
+        tiles = self.tiles.reshape(-1) if tiles is None else tiles
+        tiles = tiles[tiles["bytecount"] > 0]
+        starts = tiles["offset"]
+        ranges = numpy.stack([starts, starts + tiles["bytecount"]], axis=-1)
+        return ranges[numpy.argsort(starts, kind="stable")]
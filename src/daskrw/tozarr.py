@@ -1,11 +1,35 @@
+"""
+Convert tiled ome-tiffs to ome-zarr
+
+    tozarr                                  # converts the bundled sample image to a temp file
+    tozarr slides/ more/*.ome.tiff -o out/ [--workers 16] [--files 4] [--memory-limit 2GB]
+
+All conversions share one pool of dask workers, the largest files are
+started first so small files fill in around them. Outputs that a previous
+run completed from the same (unchanged) input, with the same output
+options, are skipped.
+"""
 import sys
 import os
+import json
+import glob
+import time
+import hashlib
 import pathlib
+import argparse
+from typing import TypedDict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from dask.array.core import Array as daskArray
+import dask
+import zarr
+import numpy
+import tifffile
+from dask.utils import parse_bytes, format_bytes
 
-from .reader import TiledImageReader
+from .reader import TiledImageReader, SUPPORTED_EXTENSIONS
 from .writer import TiledImageWriter
+from .transform import Transform
+from .cache import TileCache, file_cache_key
 from .constants import (
     MD_SIZE_S,
     MD_SIZE_C,
@@ -15,14 +39,87 @@ from .constants import (
     MD_SIZE_X,
 )
 
-def main() -> int:
-    reader = TiledImageReader(pathlib.Path(os.path.dirname(__file__)) / 'data/tiledimg.ome.tiff')
+# group attribute recording the input an output was completely converted
+# from, and the options it was converted with
+COMPLETE_ATTR = "daskrw_source"
+
+class ConversionResult(TypedDict):
+    input: str
+    output: str
+    skipped: bool
+    nbytes: int
+    tiles: int
+    seconds: float
+
+
+def find_inputs(inputs: list[str]) -> list[str]:
+    """ome-tiffs in the given files, directories and glob patterns"""
+    found: list[str] = []
+    for pattern in inputs:
+        paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                found.extend(
+                    os.path.join(path, name) for name in sorted(os.listdir(path))
+                    if name.lower().endswith(tuple(SUPPORTED_EXTENSIONS))
+                )
+            elif os.path.isfile(path):
+                found.append(path)
+    # each input once, in the order given
+    return list(dict.fromkeys(found))
+
+
+def output_path(input_path: str, output_dir: str) -> str:
+    name = os.path.basename(input_path)
+    for extension in sorted(SUPPORTED_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith(extension):
+            name = name[:-len(extension)]
+            break
+    return os.path.join(output_dir, f"{name}.ome.zarr")
+
 
+def conversion_options(passthrough: bool = False,
+                       channel_stats: bool = False,
+                       transform: Optional[Transform] = None,
+                       ) -> dict:
+    """json form of the options that change the output of a conversion"""
+    options: dict = {"passthrough": passthrough, "channel_stats": channel_stats}
+    for name, value in sorted((transform or {}).items()):
+        if isinstance(value, numpy.ndarray):
+            # flat and dark fields by content
+            value = hashlib.sha1(numpy.ascontiguousarray(value).tobytes()).hexdigest() + f":{value.shape}"
+        options[name] = json.loads(json.dumps(value))
+    return options
+
+
+def is_complete(input_path: str, output: str, options: Optional[dict] = None) -> bool:
+    """whether `output` was completely converted from the current `input_path`, with the same options"""
+    if not os.path.exists(output):
+        return False
+    try:
+        source = zarr.open_group(output, mode="r").attrs.get(COMPLETE_ATTR)
+    except (ValueError, KeyError, zarr.errors.GroupNotFoundError):
+        return False
+    if not isinstance(source, dict):
+        return False
+    return (
+        tuple(source.get("key", ())) == file_cache_key(input_path)
+        and source.get("options") == (conversion_options() if options is None else options)
+    )
+
+
+def mark_complete(input_path: str, output: str, options: Optional[dict] = None):
+    """Record the input and options of a closed output, updating its consolidated metadata"""
+    zarr.open_group(output, mode="r+").attrs[COMPLETE_ATTR] = {
+        "key": list(file_cache_key(input_path)),
+        "options": conversion_options() if options is None else options,
+    }
+    if os.path.exists(os.path.join(output, ".zmetadata")):
+        zarr.consolidate_metadata(zarr.storage.FSStore(output, mode="a"))
+
+
+def image_shapes(reader: TiledImageReader) -> list[tuple[int, ...]]:
     metadata = reader.get_series_metadata()
-    # [
-    #     ( 1, 2, 1, 512, 512 ),
-    #     ( 1, 2, 1, 256, 256 ),
-    # ]
     img_shapes = list(zip(
         metadata[MD_SIZE_T],
         metadata[MD_SIZE_C],
@@ -31,27 +128,215 @@ def main() -> int:
         metadata[MD_SIZE_X],
     ))
     assert len(img_shapes) == metadata[MD_SIZE_S]
+    return img_shapes
+
+
+def count_tiles(reader: TiledImageReader, img_shapes: list[tuple[int, ...]]) -> int:
+    return sum(
+        res["n_tiles_y"] * res["n_tiles_x"] * t * c * z
+        for res, (t, c, z, _, _) in zip(reader._res.values(), img_shapes)
+    )
+
+
+def convert(input_path: str,
+            output: Optional[str],
+            pool: Optional[ThreadPoolExecutor] = None,
+            memory_limit: Optional[int] = None,
+            resume: bool = False,
+            passthrough: bool = False,
+            channel_stats: bool = False,
+            transform: Optional[Transform] = None,
+            ) -> ConversionResult:
+    """Convert one ome-tiff, computing on the shared `pool` of dask workers
+    @param output: path of the ome-zarr, if None, a temp file is created
+    @param memory_limit: bytes the conversion may hold: a quarter for the file's tile
+                         cache, the rest for the bands of data in flight, see
+                         `TiledImageWriter`; `None` = shared cache, whole levels at once
+    @param resume: continue an interrupted conversion, see `TiledImageWriter`
+    @param passthrough: copy compatible compressed tiles as-is, see `TiledImageWriter.write_pyramid`
+    @param channel_stats: store the statistics of each channel in the omero metadata
+    @param transform: crop, channels, flat-field, window and dtype applied while converting
+    """
+    start = time.perf_counter()
+    cache = None
+    write_limit = None
+    if memory_limit is not None:
+        cache = TileCache(max_size=memory_limit // 4)
+        write_limit = memory_limit - memory_limit // 4
+    reader = TiledImageReader(input_path, cache=cache)
+    img_shapes = image_shapes(reader)
+    writer = TiledImageWriter(
+        output, img_shapes, resume=resume, channel_stats=channel_stats, memory_limit=write_limit
+    )
+    try:
+        # all levels and channels are written in one dask compute
+        store = writer.write_pyramid(reader, compute=False, passthrough=passthrough, transform=transform)
+        dask.compute(store, scheduler="threads", pool=pool)
+        tiles = count_tiles(reader, img_shapes)
+    finally:
+        writer.close()
+        reader.close()
+    # only once closed, i.e. with its metadata consolidated, is the output complete
+    mark_complete(input_path, writer.file_path, conversion_options(passthrough, channel_stats, transform))
+
+    return {
+        "input": input_path,
+        "output": writer.file_path,
+        "skipped": False,
+        "nbytes": os.path.getsize(input_path),
+        "tiles": tiles,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def format_result(result: ConversionResult) -> str:
+    if result["skipped"]:
+        return f"skipped {result['input']} (complete: {result['output']})"
+    seconds = max(result["seconds"], 1e-9)
+    return (
+        f"{result['input']} -> {result['output']}: {format_bytes(result['nbytes'])} in {seconds:.1f}s, "
+        f"{result['nbytes'] / seconds / 2**20:.1f} MB/s, {result['tiles'] / seconds:.0f} tiles/s"
+    )
+
+
+def convert_all(inputs: list[str],
+                output_dir: str,
+                workers: Optional[int] = None,
+                files: Optional[int] = None,
+                memory_limit: Optional[int] = None,
+                resume: bool = False,
+                passthrough: bool = False,
+                channel_stats: bool = False,
+                transform: Optional[Transform] = None,
+                ) -> list[ConversionResult]:
+    """Convert many ome-tiffs concurrently, on one shared pool of dask workers
+    @param workers: dask worker threads shared by all conversions, `None` = number of CPUs
+    @param files: conversions running at once, `None` = up to 4
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    files = files or min(4, max(1, len(inputs)))
+
+    options = conversion_options(passthrough, channel_stats, transform)
+    results: list[ConversionResult] = []
+    todo = []
+    for input_path in inputs:
+        output = output_path(input_path, output_dir)
+        if is_complete(input_path, output, options):
+            results.append({
+                "input": input_path, "output": output, "skipped": True,
+                "nbytes": 0, "tiles": 0, "seconds": 0.0,
+            })
+            print(format_result(results[-1]))
+        else:
+            todo.append((input_path, output))
+
+    # largest first, so the long conversions don't start last
+    todo.sort(key=lambda io: os.path.getsize(io[0]), reverse=True)
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="daskrw-tozarr") as pool, \
+         ThreadPoolExecutor(files) as conversions:
+        futures = {
+            conversions.submit(
+                convert, input_path, output, pool, memory_limit, resume, passthrough, channel_stats, transform
+            ): input_path
+            for input_path, output in todo
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"failed {futures[future]}: {e!r}", file=sys.stderr)
+                continue
+            results.append(result)
+            print(format_result(result))
+
+    return results
+
+
+def format_summary(results: list[ConversionResult], failed: int, seconds: float) -> str:
+    converted = [r for r in results if not r["skipped"]]
+    nbytes = sum(r["nbytes"] for r in converted)
+    tiles = sum(r["tiles"] for r in converted)
+    seconds = max(seconds, 1e-9)
+    return (
+        f"{len(converted)} converted, {len(results) - len(converted)} skipped, {failed} failed: "
+        f"{format_bytes(nbytes)} in {seconds:.1f}s, "
+        f"{nbytes / seconds / 2**20:.1f} MB/s, {tiles / seconds:.0f} tiles/s"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="ome-tiff files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="directory of the ome-zarr outputs")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="dask worker threads shared by all conversions (default: number of CPUs)")
+    parser.add_argument("-f", "--files", type=int, default=None,
+                        help="conversions running at once (default: up to 4)")
+    parser.add_argument("-m", "--memory-limit", type=parse_bytes, default=None,
+                        help="memory of each conversion, e.g. 2GB, shared by its tile cache and "
+                             "the bands of rows written at a time (default: shared cache, whole levels)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue interrupted conversions instead of restarting them")
+    parser.add_argument("--passthrough", action="store_true",
+                        help="copy compressed tiles zarr can read as-is without decoding them "
+                             "(outputs keep the source's codec)")
+    parser.add_argument("--stats", action="store_true",
+                        help="compute the min, max, mean, std, percentiles and histogram of each "
+                             "channel while converting, stored in the omero metadata")
+    parser.add_argument("--dtype", help="output dtype, e.g. uint8, values are stretched from the window")
+    parser.add_argument("--window", type=float, nargs=2, metavar=("MIN", "MAX"),
+                        help="input range mapped onto the output dtype's (default: the input dtype's)")
+    parser.add_argument("--channels", type=int, nargs="+", help="channels to keep, in output order")
+    parser.add_argument("--crop", type=int, nargs=4, metavar=("X", "Y", "W", "H"),
+                        help="region to keep, in pixels of level 0")
+    parser.add_argument("--flatfield", help="tiff of the illumination to divide by, Y, X or C, Y, X")
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        reader = TiledImageReader(pathlib.Path(os.path.dirname(__file__)) / 'data/tiledimg.ome.tiff')
+        writer = TiledImageWriter(None, image_shapes(reader))
+        print(f"Writing to temp file: {writer.file_path}")
 
-    # dtype: uint8
-    # chunskize: 256, 256, 1
-    # num levels: (series) 2
-    #   level 0 shape: 512, 512, 2
-    high_res_ch0: daskArray = reader.read_tiled(series=0, c=0) # type: ignore
-    high_res_ch1: daskArray = reader.read_tiled(series=0, c=1) # type: ignore
-    #   level 1 shape: 256, 256, 2
-    low_res_ch0: daskArray = reader.read_tiled(series=1, c=0) # type: ignore
-    low_res_ch1: daskArray = reader.read_tiled(series=1, c=1) # type: ignore
+        # all levels and channels are written in one dask compute
+        writer.write_pyramid(reader)
+        return 0
 
+    if args.output_dir is None:
+        parser.error("--output-dir is required when converting inputs")
 
-    writer = TiledImageWriter(None, img_shapes)
-    print(f"Writing to temp file: {writer.file_path}")
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("no ome-tiffs found in the inputs")
 
-    writer.write_tiled(high_res_ch0, series=0, c=0)
-    writer.write_tiled(high_res_ch1, series=0, c=1)
-    writer.write_tiled(low_res_ch0, series=1, c=0)
-    writer.write_tiled(low_res_ch1, series=1, c=1)
+    transform: Transform = dict()
+    if args.dtype is not None:
+        transform["dtype"] = args.dtype
+    if args.window is not None:
+        transform["window"] = tuple(args.window)
+    if args.channels is not None:
+        transform["channels"] = args.channels
+    if args.crop is not None:
+        transform["crop"] = tuple(args.crop)
+    if args.flatfield is not None:
+        transform["flatfield"] = tifffile.imread(args.flatfield)
 
-    return 0
+    start = time.perf_counter()
+    results = convert_all(
+        inputs,
+        args.output_dir,
+        workers=args.workers,
+        files=args.files,
+        memory_limit=args.memory_limit,
+        resume=args.resume,
+        passthrough=args.passthrough,
+        channel_stats=args.stats,
+        transform=transform or None,
+    )
+    failed = len(inputs) - len(results)
+    print(format_summary(results, failed, time.perf_counter() - start))
+    return 1 if failed else 0
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,168 @@
+from typing import TypedDict, Optional, Union
+
+import numpy
+import dask.array
+from dask.array.core import Array as daskArray
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# (x, y, w, h) in pixels of level 0
+Crop = tuple[int, int, int, int]
+# input (min, max) mapped onto the output range, for all channels or per channel
+Window = Union[tuple[float, float], list[tuple[float, float]]]
+
+
+class Transform(TypedDict, total=False):
+    # channels to keep, in output order
+    channels: list[int]
+    crop: Crop
+    # Y, X or C, Y, X illumination reference, at level 0 size (before cropping);
+    # data is divided by it, normalized to a mean of 1 per channel
+    flatfield: numpy.ndarray
+    # Y, X or C, Y, X offset subtracted before the flat-field division
+    darkfield: numpy.ndarray
+    window: Window
+    # output dtype, the window (default: the input dtype's range) is
+    # stretched over its range, or over 0..1 for floats
+    dtype: str
+
+
+def _dtype_range(dtype) -> tuple[float, float]:
+    dtype = numpy.dtype(dtype)
+    if numpy.issubdtype(dtype, numpy.integer):
+        info = numpy.iinfo(dtype)
+        return float(info.min), float(info.max)
+    return 0.0, 1.0
+
+
+def level_crop(transform: Transform, shape0: tuple[int, ...], shape: tuple[int, ...]) -> tuple[slice, slice]:
+    """y and x slices of the crop at a level of y, x `shape`, level 0 being `shape0`"""
+    if "crop" not in transform:
+        return slice(0, shape[-2]), slice(0, shape[-1])
+    x, y, w, h = transform["crop"]
+    fy = shape0[-2] / shape[-2]
+    fx = shape0[-1] / shape[-1]
+    y0, x0 = int(y // fy), int(x // fx)
+    # at least one pixel, and within the level
+    y1 = max(y0 + 1, min(shape[-2], -int(-(y + h) // fy)))
+    x1 = max(x0 + 1, min(shape[-1], -int(-(x + w) // fx)))
+    return slice(y0, y1), slice(x0, x1)
+
+
+def transformed_shape(transform: Transform, shape0: tuple[int, ...], shape: tuple[int, ...]) -> tuple[int, ...]:
+    """t, c, z, y, x shape of a level once transformed"""
+    rows, cols = level_crop(transform, shape0, shape)
+    size_c = len(transform["channels"]) if "channels" in transform else shape[1]
+    return (shape[0], size_c, shape[2], rows.stop - rows.start, cols.stop - cols.start)
+
+
+def _reference(image: numpy.ndarray,
+               channels: list[int],
+               shape: tuple[int, ...],
+               rows: slice,
+               cols: slice,
+               normalize: bool) -> numpy.ndarray:
+    """A flat- or dark-field resampled (nearest) to a level, cropped, as 1, C, 1, Y, X float32"""
+    image = numpy.asarray(image, dtype=numpy.float32)
+    if image.ndim == 2:
+        image = image[None]
+    if image.shape[0] > 1:
+        image = image[channels]
+    if normalize:
+        image = image / image.mean(axis=(1, 2), keepdims=True)
+    y_idxs = (numpy.arange(rows.start, rows.stop) * image.shape[1] // shape[-2]).clip(0, image.shape[1] - 1)
+    x_idxs = (numpy.arange(cols.start, cols.stop) * image.shape[2] // shape[-1]).clip(0, image.shape[2] - 1)
+    return image[:, y_idxs][:, :, x_idxs][None, :, None]
+
+
+def _transform_block(block: numpy.ndarray,
+                     flat: Optional[numpy.ndarray],
+                     dark: Optional[numpy.ndarray],
+                     scale: numpy.ndarray,
+                     offset: numpy.ndarray,
+                     out_range: tuple[float, float],
+                     dtype: numpy.dtype) -> numpy.ndarray:
+    """(block - dark) / flat * scale - offset, clipped to the output range, in one float32 buffer"""
+    if numexpr is not None:
+        expr = "x"
+        local_dict = {"x": block, "s": scale, "o": offset}
+        if dark is not None:
+            expr = f"({expr} - d)"
+            local_dict["d"] = dark
+        if flat is not None:
+            expr = f"{expr} / f"
+            local_dict["f"] = flat
+        values = numexpr.evaluate(f"{expr} * s - o", local_dict=local_dict).astype(numpy.float32, copy=False)
+    else:
+        values = block.astype(numpy.float32)
+        if dark is not None:
+            values -= dark
+        if flat is not None:
+            values /= flat
+        values *= scale
+        values -= offset
+    numpy.clip(values, out_range[0], out_range[1], out=values)
+    if numpy.issubdtype(dtype, numpy.integer):
+        numpy.rint(values, out=values)
+    return values.astype(dtype, copy=False)
+
+
+def apply_transform(data: daskArray, transform: Transform, shape0: Optional[tuple[int, ...]] = None) -> daskArray:
+    """Crop, select channels, and flat-field, rescale and cast a t,c,z,y,x level.
+    @param shape0: shape of level 0, if `data` is a lower level, to scale the
+                   crop and references to it
+    Crop and channels are lazy slices, so only the tiles kept are read; the
+    rest runs as one kernel per block, with numexpr if installed.
+    """
+    assert data.ndim == 5, "data must be t,c,z,y,x"
+    shape0 = data.shape if shape0 is None else shape0
+
+    channels = list(transform.get("channels", range(data.shape[1])))
+    level_shape = data.shape
+    rows, cols = level_crop(transform, shape0, level_shape)
+    data = data[:, channels if "channels" in transform else slice(None), :, rows, cols]
+
+    flatfield = transform.get("flatfield")
+    darkfield = transform.get("darkfield")
+    dtype = numpy.dtype(transform.get("dtype", data.dtype))
+    window = transform.get("window")
+    if flatfield is None and darkfield is None and window is None and dtype == data.dtype:
+        return data
+
+    # per channel window, as 1, C, 1, 1, 1
+    if window is None:
+        window = _dtype_range(data.dtype)
+    windows = numpy.array(window if isinstance(window, list) else [window] * len(channels), dtype=numpy.float32)
+    lo = windows[:, 0].reshape(1, -1, 1, 1, 1)
+    hi = windows[:, 1].reshape(1, -1, 1, 1, 1)
+    out_range = _dtype_range(dtype)
+    scale = (out_range[1] - out_range[0]) / numpy.maximum(hi - lo, numpy.finfo(numpy.float32).eps)
+    offset = lo * scale - out_range[0]
+
+    def along_c(values: numpy.ndarray) -> daskArray:
+        # chunked like the data on c (and y, x for references), so blocks line up
+        chunks = tuple(
+            data.chunks[i] if values.shape[i] > 1 else (1,)
+            for i in range(5)
+        )
+        return dask.array.from_array(values, chunks=chunks)
+
+    def reference(image: Optional[numpy.ndarray], normalize: bool) -> Optional[daskArray]:
+        if image is None:
+            return None
+        return along_c(_reference(image, channels, level_shape, rows, cols, normalize))
+
+    return dask.array.map_blocks(
+        _transform_block,
+        data,
+        reference(flatfield, True),
+        reference(darkfield, False),
+        along_c(scale.astype(numpy.float32)),
+        along_c(offset.astype(numpy.float32)),
+        out_range,
+        dtype,
+        dtype=dtype,
+    )
@@ -1,15 +1,309 @@
 import os
 import tempfile
+import threading
+from math import ceil
 from shutil import rmtree
-from typing import TypedDict, Literal, Optional
+from typing import TypedDict, Literal, Optional, Union
 
 import zarr
-#import dask
-#import numpy
-from dask.array.core import Array as daskArray, to_zarr
+import dask
+import numpy
+import numcodecs
+from numcodecs.abc import Codec
+import dask.array
+from dask.utils import parse_bytes
+from dask.base import collections_to_dsk, tokenize
+from dask.core import get_dependencies
+from dask.delayed import Delayed
+from dask.array.core import Array as daskArray
 from ome_zarr.io import parse_url
 from ome_zarr.writer import write_multiscales_metadata
 
+from .reader import TiledImageReader, TileEncoding, CHANNEL_DIMS
+from .decode import coalesce_ranges
+from .downsample import downsample, DownsampleMethod
+from .manifest import WriteManifest, block_checksum
+from .stats import Stats, InstrumentedStore, InstrumentedTarget
+from .transform import Transform, apply_transform, transformed_shape
+from .channelstats import ChannelStats, ChannelPartial, block_partials, merge_partials, tree_merge, finalize
+
+# root attribute of the full statistics of each channel, see `ChannelStats`
+CHANNEL_STATS_ATTR = "channel_statistics"
+
+Shuffle = Literal["none", "byte", "bit"]
+
+# "directory": a file per chunk, "zip": one uncompressed zip file,
+# "lmdb": one lmdb database (needs the lmdb package; zarr.LMDBStore is deprecated since zarr 2.18)
+Container = Literal["directory", "zip", "lmdb"]
+
+BLOSC_SHUFFLES = {
+    "none": numcodecs.Blosc.NOSHUFFLE,
+    "byte": numcodecs.Blosc.SHUFFLE,
+    "bit": numcodecs.Blosc.BITSHUFFLE,
+}
+
+def make_codecs(compressor: Union[str, Codec, None],
+                dtype,
+                clevel: int = 5,
+                shuffle: Shuffle = "byte",
+                ) -> tuple[Optional[Codec], Optional[list[Codec]]]:
+    """Build the (compressor, filters) of a zarr array.
+    @param compressor: "blosc" or "blosc-<cname>" (e.g. "blosc-zstd"), "zstd",
+                       "lz4", "zlib", a numcodecs codec, or None for no compression
+    @param dtype: dtype of the array, the element size of byte shuffling
+    @param clevel: compression level, ignored by lz4
+    @param shuffle: "none", "byte" or "bit" shuffle; blosc shuffles internally,
+                    other codecs get a byte `Shuffle` filter, bit shuffle is blosc only
+    """
+    if compressor is None or isinstance(compressor, Codec):
+        return compressor, None
+
+    if shuffle not in BLOSC_SHUFFLES:
+        raise ValueError(f"Unsupported shuffle: {shuffle}")
+
+    if compressor == "blosc" or compressor.startswith("blosc-"):
+        cname = compressor[len("blosc-"):] or "lz4"
+        if cname not in numcodecs.blosc.list_compressors():
+            raise ValueError(f"Unsupported blosc compressor: {cname}")
+        return numcodecs.Blosc(cname=cname, clevel=clevel, shuffle=BLOSC_SHUFFLES[shuffle]), None
+
+    if compressor == "zstd":
+        codec = numcodecs.Zstd(level=clevel)
+    elif compressor == "lz4":
+        codec = numcodecs.LZ4()
+    elif compressor == "zlib":
+        codec = numcodecs.Zlib(level=clevel)
+    else:
+        raise ValueError(f"Unsupported compressor: {compressor}")
+
+    if shuffle == "bit":
+        raise ValueError(f"bit shuffle requires a blosc compressor, got {compressor}")
+    itemsize = numpy.dtype(dtype).itemsize
+    if shuffle == "byte" and itemsize > 1:
+        return codec, [numcodecs.Shuffle(elementsize=itemsize)]
+    return codec, None
+
+
+def scale_factor(size0: int, size: int) -> float:
+    """Scale of a level of `size` relative to level 0 of `size0`. Integer factors
+    are recovered from sizes that were floored or ceiled when downsampling.
+    """
+    factor = round(size0 / size)
+    if factor >= 1 and size in (size0 // factor, -(-size0 // factor)):
+        return float(factor)
+    return size0 / size
+
+
+def align_chunks(data: daskArray, zarr_chunks: tuple[int, ...]) -> daskArray:
+    """Rechunk `data` so every dask chunk covers whole zarr chunks, and no two
+    tasks ever write the same zarr chunk. Axes whose dask chunks already are
+    multiples of the zarr chunks are left alone, so nothing is split needlessly.
+    """
+    zarr_chunks = zarr_chunks[-data.ndim:]
+    target = tuple(
+        axis_chunks if all(c % z == 0 for c in axis_chunks[:-1]) else z
+        for axis_chunks, z in zip(data.chunks, zarr_chunks)
+    )
+    return data.rechunk(target)
+
+
+def row_bands(data: daskArray, max_nbytes: int) -> list[slice]:
+    """Consecutive y slices of `data` along its chunk boundaries, each holding
+    as many rows of chunks as fit in `max_nbytes`, and at least one
+    """
+    row_nbytes = data.nbytes // max(1, data.shape[-2])
+    bands = []
+    start = stop = 0
+    for height in data.chunks[-2]:
+        if stop > start and (stop + height - start) * row_nbytes > max_nbytes:
+            bands.append(slice(start, stop))
+            start = stop
+        stop += height
+    if stop > start:
+        bands.append(slice(start, stop))
+    return bands
+
+
+def as_tczyx(data: daskArray) -> daskArray:
+    """Y, X plane, or Z, Y, X stack, or T, Z, Y, X volume as T, C, Z, Y, X,
+    missing axes being length 1
+    """
+    if data.ndim < 2 or data.ndim > 5:
+        raise ValueError(f"Expected 2 to 5 dimensional data, got {data.ndim}")
+    if data.ndim == 2:
+        # Y, X -> Z, Y, X
+        data = data[None]
+    if data.ndim == 3:
+        # Z, Y, X -> T, Z, Y, X
+        data = data[None]
+    if data.ndim == 4:
+        # T, Z, Y, X -> T, C, Z, Y, X
+        data = data[:, None]
+    return data
+
+
+def region_slice(idx, size) -> slice:
+    if isinstance(idx, slice):
+        start = idx.start or 0
+        stop = start + size if idx.stop is None else idx.stop
+        if stop - start != size:
+            raise ValueError(f"Slice {idx} does not match data of length {size}")
+        return slice(start, stop, 1)
+    start = idx or 0
+    return slice(start, start+size, 1)
+
+
+def data_region(data: daskArray, c=None, z=None, t=None) -> tuple[slice, ...]:
+    """t,c,z,y,x region of a level written by a t,c,z,y,x `data` at `c`, `z` and `t`"""
+    size_t, size_c, size_z, size_y, size_x = data.shape
+    return (
+        region_slice(t, size_t),
+        region_slice(c, size_c),
+        region_slice(z, size_z),
+        slice(0, size_y),
+        slice(0, size_x),
+    )
+
+
+def reader_level(reader: TiledImageReader, series: int) -> daskArray:
+    """A level of a reader as t,c,z,y,x"""
+    # T, Z, Y, X[, C]
+    data: daskArray = reader.read_tiled(series=series, z=slice(None), t=slice(None)) # type: ignore
+    if data.ndim == 4:
+        data = data[..., None]
+
+    # T, Z, Y, X, C -> T, C, Z, Y, X
+    return data.transpose(0, 4, 1, 2, 3)
+
+
+def passthrough_codec(encoding: TileEncoding) -> tuple[bool, Optional[Codec]]:
+    """(compatible, compressor) of zarr chunks holding the raw tiles of a level as-is.
+    Tiles must be single-sample, without predictor or bit order tricks, and
+    compressed with a codec numcodecs (or imagecodecs' numcodecs) can decode.
+    """
+    itemsize = numpy.dtype(encoding["dtype"]).itemsize
+    if not (
+        encoding["is_tiled"]
+        and encoding["samplesperpixel"] == 1
+        and encoding["predictor"] == 1
+        and encoding["fillorder"] == 1
+        and encoding["bitspersample"] == itemsize * 8
+    ):
+        return False, None
+
+    compression = encoding["compression"]
+    if compression == 1:
+        return True, None
+    if compression in (8, 32946):
+        # TIFF deflate tiles are zlib streams
+        return True, numcodecs.Zlib()
+    if compression == 50000:
+        return True, numcodecs.Zstd()
+    if compression not in (5, 7):
+        return False, None
+
+    try:
+        import imagecodecs.numcodecs
+    except ImportError:
+        return False, None
+    # readers of the zarr need the imagecodecs codecs registered too
+    imagecodecs.numcodecs.register_codecs(verbose=False)
+    if compression == 5:
+        return True, imagecodecs.numcodecs.Lzw()
+    if itemsize > 1 and encoding["byteorder"] != "<":
+        # decoded jpeg samples are native, not in the file's byte order
+        return False, None
+    return True, imagecodecs.numcodecs.Jpeg(
+        tables=encoding["jpegtables"], bitspersample=encoding["bitspersample"]
+    )
+
+
+def _copy_tiles(file_path, store, keys: list[str], offsets: numpy.ndarray, bytecounts: numpy.ndarray):
+    """Copy raw tiles of a file to zarr chunk keys, missing tiles are left to the fill value"""
+    present = [i for i in range(len(keys)) if bytecounts[i] > 0]
+    offsets = [int(offsets[i]) for i in present]
+    bytecounts = [int(bytecounts[i]) for i in present]
+    keys = [keys[i] for i in present]
+    with open(file_path, "rb") as fh:
+        for start, stop, idxs in coalesce_ranges(offsets, bytecounts):
+            fh.seek(start)
+            buffer = fh.read(stop - start)
+            for i in idxs:
+                store[keys[i]] = buffer[offsets[i] - start:offsets[i] - start + bytecounts[i]]
+
+
+def open_container(file_path, container: Container, mode: str):
+    """zarr store of a zip or lmdb container, "w" mode replaces an existing one"""
+    if container == "zip":
+        return zarr.ZipStore(file_path, mode=mode)
+    if container == "lmdb":
+        if mode == "w" and os.path.exists(file_path):
+            rmtree(file_path)
+        try:
+            return zarr.LMDBStore(file_path)
+        except ImportError as e:
+            raise ImportError("lmdb containers need the lmdb package, pip install daskrw[lmdb]") from e
+    raise ValueError(f"Unknown container {container!r}")
+
+
+def _write_block(block: numpy.ndarray,
+                 zarray: zarr.Array,
+                 region: tuple[slice, ...],
+                 manifest: Optional[WriteManifest],
+                 block_key: str,
+                 channel_stats: bool = False,
+                 write: bool = True,
+                 ) -> Optional[dict[int, ChannelPartial]]:
+    """Store a block, and return its channel statistics if `channel_stats`"""
+    if write:
+        zarray[region] = block
+        if manifest is not None:
+            # recorded only once all of its chunks are stored
+            manifest.record(block_key, block_checksum(block))
+    if not channel_stats:
+        return None
+    return block_partials(block, region[1].start)
+
+
+def _after(_, value):
+    """`value`, computed once the first argument, e.g. the previous store, is"""
+    return value
+
+
+def _run_in_order(stores: list[Delayed], compute=True):
+    """Chain delayed stores in one graph, so each one's tasks, reads included,
+    only start once the previous store is done, and the caller's scheduler
+    runs all of it (no compute inside a task)
+    """
+    graphs = [dict(collections_to_dsk([store], optimize_graph=True)) for store in stores]
+    counts: dict = {}
+    for dsk in graphs:
+        for key in dsk:
+            counts[key] = counts.get(key, 0) + 1
+
+    chained = {}
+    for i, dsk in enumerate(graphs):
+        chained.update(dsk)
+        if i == 0:
+            continue
+        # the first tasks of a store's own, i.e. not shared with another store,
+        # become arguments of a task that also depends on the previous store,
+        # so they only run after it; the rest of its tasks depend on them
+        for key, task in dsk.items():
+            if counts[key] > 1 or any(counts[dep] == 1 for dep in get_dependencies(dsk, key)):
+                continue
+            if hasattr(task, "substitute"):
+                # tasks of newer dask versions carry their key, the nested
+                # task must not be taken for the one wrapping it
+                task = task.substitute({}, key="gated-" + tokenize(key))
+            chained[key] = (_after, stores[i - 1].key, task)
+
+    name = "run-in-order-" + tokenize(*[store.key for store in stores])
+    chained[name] = (_after, [store.key for store in stores], None)
+    if not compute:
+        return Delayed(name, chained)
+    dask.compute(Delayed(name, chained))
+
 
 class TiledImageWriter:
     """
@@ -39,29 +333,99 @@ class TiledImageWriter:
         self.__zarr_location = None
         self.__zarr_store = None
         self.__zarr_root = None
+        self.__manifest = None
 
     def __delete_state(self):
         del self.__zarr_location
         del self.__zarr_store
         del self.__zarr_root
+        del self.__manifest
 
-    def __init__(self, file_path, img_shapes):
+    def __init__(self,
+                 file_path,
+                 img_shapes,
+                 compressor: Union[str, Codec, None] = "blosc",
+                 clevel: int = 5,
+                 shuffle: Shuffle = "byte",
+                 chunks: Optional[tuple[int, ...]] = None,
+                 resume: bool = False,
+                 verify: bool = False,
+                 stats: Optional[Stats] = None,
+                 memory_limit: Union[int, str, None] = None,
+                 container: Container = "directory",
+                 consolidated: bool = True,
+                 channel_stats: bool = False,
+                 channel_names: Optional[list[str]] = None,
+                 ):
         """
         @param file_path: path to destination location, and filename
                           if None, a temp file is created automatically
         @param img_shapes: a list of size equal to the number of series,
                            with elements of size 5 of dimensions sizes for
                            t,c,z,y,x (in that order)
+        @param compressor: codec of every level, see `make_codecs`;
+                           the default matches zarr's own (blosc lz4)
+        @param clevel: compression level
+        @param shuffle: "none", "byte" or "bit" shuffle before compression
+        @param chunks: zarr chunk shape of every level, for t,c,z,y,x;
+                       if None, the chunks of the written dask arrays are used.
+                       Data is rechunked to it before writing.
+        @param resume: record every written block in a manifest next to the
+                       store, and open an existing store to only write the
+                       blocks missing from it, e.g. after an interrupted run
+        @param verify: when resuming, check the stored data of recorded blocks
+                       against their checksums, and rewrite those that differ
+        @param stats: counters of chunks and bytes written, and of encode and
+                      store write time; None = no bookkeeping
+        @param memory_limit: bytes (or e.g. "2GB") of data a write may hold at
+                             once; if set, levels are written in bands of rows
+                             of zarr chunks, top to bottom, one band after
+                             another. None = each write is one dask compute
+        @param container: "directory" (a file per chunk), or a single "zip" file
+                          or "lmdb" database holding every chunk, indexed by key
+        @param consolidated: on `close`, gather the metadata of the group and
+                             its levels into one .zmetadata document
+        @param channel_stats: compute the min, max, mean, std, percentiles and
+                              histogram of each channel from the blocks of
+                              level 0 as they are written, and store them in
+                              the omero metadata, see `channel_statistics`
+        @param channel_names: labels of the channels in the omero metadata
         """
         if file_path is None:
-            file_path = self.create_temp_file()
+            file_path = self.create_temp_file(suffix=".ome.zarr.zip" if container == "zip" else ".ome.zarr")
 
         self.file_path = file_path
         self.__init_values()
         self.img_shapes = img_shapes
+        # y, x factors of generated levels, kept when the store is (re)opened
+        self.__scales: Optional[list[list[float]]] = None
+        self.compressor = compressor
+        self.clevel = clevel
+        self.shuffle: Shuffle = shuffle
+        if chunks is not None:
+            assert len(chunks) == 5, "chunks must be given for t,c,z,y,x"
+        self.chunks = chunks
+        self.resume = resume
+        self.verify = verify
+        self.stats = stats
+        if isinstance(memory_limit, str):
+            memory_limit = parse_bytes(memory_limit)
+        self.memory_limit: Optional[int] = memory_limit
+        self.container: Container = container
+        self.consolidated = consolidated
+        self.channel_stats = channel_stats
+        self.channel_names = channel_names
+        # merged statistics of every level 0 block written so far, by channel
+        self.__channel_partials: dict[int, ChannelPartial] = dict()
+        self.__channel_lock = threading.Lock()
+        # zip files can only be appended to once written
+        self.__opened = False
+        if resume and container == "zip":
+            raise ValueError("Resumed writes can't rewrite chunks of a zip container")
 
     def __del__(self):
-        self.close()
+        # no consolidation, the interpreter may be shutting down
+        self.__close(consolidate=False)
 
     def __write_metadata(self, root):
         paths = [str(i) for i in range(len(self.img_shapes))]
@@ -72,24 +436,228 @@ class TiledImageWriter:
             {"name": "y", "type": "space"},
             {"name": "x", "type": "space"}
         ]
-        transformations = [ [{"type": "scale", "scale": [ 1.0, 1.0, pow(2, float(i)), pow(2, float(i)), pow(2, float(i)), ] }] for i in range(len(self.img_shapes)) ]
+        transformations = [ [{"type": "scale", "scale": scale }] for scale in self.__level_scales() ]
         datasets = []
         for p, t in zip(paths, transformations):
             datasets.append({"path": p, "coordinateTransformations": t})
 
         write_multiscales_metadata(root, datasets, axes=axes)
 
+    def __level_scales(self) -> list[list[float]]:
+        if self.__scales is not None:
+            return self.__scales
+        # source pyramids don't record their factors, derive them from the level shapes
+        shape0 = self.img_shapes[0]
+        return [
+            [1.0, 1.0] + [scale_factor(s0, s) for s0, s in zip(shape0[2:], shape[2:])]
+            for shape in self.img_shapes
+        ]
+
     def __get_root(self):
         if self.__zarr_root is None:
             self.__delete_state()
             self.__init_values()
-            self.__zarr_location = parse_url(self.file_path, mode="w")
-            assert self.__zarr_location is not None, "woops no zarr store"
-            self.__zarr_store = self.__zarr_location.store
+            # resumed writes keep what an earlier run stored, others replace it
+            if self.container == "directory":
+                if not (self.resume or self.__opened) and os.path.isdir(self.file_path):
+                    # ome-zarr's "w" mode would keep the existing arrays and chunks
+                    rmtree(self.file_path)
+                self.__zarr_location = parse_url(self.file_path, mode="a" if self.resume else "w")
+                assert self.__zarr_location is not None, "woops no zarr store"
+                self.__zarr_store = self.__zarr_location.store
+            else:
+                mode = "a" if self.resume or self.__opened else "w"
+                self.__zarr_store = open_container(self.file_path, self.container, mode)
+            self.__opened = True
+            if self.stats is not None:
+                self.__zarr_store = InstrumentedStore(self.__zarr_store, self.stats)
             self.__zarr_root = zarr.group(store=self.__zarr_store)
             self.__write_metadata(self.__zarr_root)
+            self.__manifest = WriteManifest(WriteManifest.path_for(self.file_path))
+            if not self.resume:
+                self.__manifest.clear()
         return self.__zarr_root
 
+    def __store_blocks(self,
+                       sources: list[daskArray],
+                       targets: list[zarr.Array],
+                       regions: list[tuple[slice, ...]],
+                       compute=True):
+        """Store block by block. When resuming, blocks recorded in the manifest
+        are skipped, and with `channel_stats` the statistics of the level 0
+        blocks are merged as a tree of tasks.
+        """
+        self.__get_root()
+        manifest = self.__manifest if self.resume else None
+
+        # (block, target, region, key) of each block of the sources
+        blocks = []
+        for data, zarray, region in zip(sources, targets, regions):
+            delayed_blocks = data.to_delayed()
+            starts = [numpy.cumsum((0,) + axis_chunks) for axis_chunks in data.chunks]
+            for block_idx in numpy.ndindex(*data.numblocks):
+                block_region = tuple(
+                    slice(r.start + int(axis_starts[i]), r.start + int(axis_starts[i + 1]))
+                    for r, axis_starts, i in zip(region, starts, block_idx)
+                )
+                block_key = zarray.path + "/" + ",".join(f"{r.start}:{r.stop}" for r in block_region)
+                blocks.append((delayed_blocks[block_idx], self.__target(zarray), block_region, block_key))
+
+        done = set()
+        if manifest is not None:
+            recorded = [b for b in blocks if b[3] in manifest]
+            if self.verify and recorded:
+                intact = dask.compute(*[
+                    dask.delayed(manifest.verify)(block_key, dask.delayed(zarray.__getitem__)(block_region))
+                    for _, zarray, block_region, block_key in recorded
+                ])
+                done = set(b[3] for b, ok in zip(recorded, intact) if ok)
+            else:
+                done = set(b[3] for b in recorded)
+
+        tasks = []
+        partials = []
+        for block, zarray, block_region, block_key in blocks:
+            wants_stats = self.__wants_stats(zarray)
+            if not wants_stats and block_key in done:
+                continue
+            # skipped blocks of level 0 are still read for their statistics
+            task = dask.delayed(_write_block)(
+                block, zarray, block_region, manifest, block_key, wants_stats, block_key not in done
+            )
+            if wants_stats:
+                partials.append(task)
+            else:
+                tasks.append(task)
+        if partials:
+            tasks.append(dask.delayed(self.__add_channel_partials)(tree_merge(partials)))
+
+        if not compute:
+            return dask.delayed(tasks)
+        dask.compute(*tasks)
+
+    def __add_channel_partials(self, partials: dict[int, ChannelPartial]):
+        with self.__channel_lock:
+            self.__channel_partials = merge_partials(self.__channel_partials, partials)
+            self.__write_channel_stats()
+
+    @property
+    def channel_statistics(self) -> dict[int, ChannelStats]:
+        """statistics of each channel written so far to level 0, by channel index"""
+        return {
+            c: finalize(partial)
+            for c, partial in sorted(self.__channel_partials.items())
+        }
+
+    def __write_channel_stats(self):
+        """omero metadata with the min/max of each channel as its window"""
+        channel_stats = self.channel_statistics
+        size_c = self.img_shapes[0][1]
+        channels = []
+        for c in range(size_c):
+            channel = {
+                "label": self.channel_names[c] if self.channel_names and c < len(self.channel_names) else str(c),
+                "color": "FFFFFF",
+                "active": True,
+            }
+            stats = channel_stats.get(c)
+            if stats is not None:
+                # window shown by default: the 0.1 to 99.9 percentiles
+                channel["window"] = {
+                    "min": stats["min"],
+                    "max": stats["max"],
+                    "start": stats["percentiles"]["0.1"],
+                    "end": stats["percentiles"]["99.9"],
+                }
+            channels.append(channel)
+
+        root = self.__get_root()
+        root.attrs.update({
+            "omero": {
+                "channels": channels,
+                "rdefs": {"model": "greyscale" if size_c == 1 else "color"},
+            },
+            CHANNEL_STATS_ATTR: {str(c): stats for c, stats in channel_stats.items()},
+        })
+
+    def __store_region(self, data: daskArray, zarray: zarr.Array, region: tuple[slice, ...], compute=True):
+        if self.resume or self.__wants_stats(zarray):
+            return self.__store_blocks([data], [zarray], [region], compute=compute)
+        return dask.array.store(data, self.__target(zarray), regions=region, lock=False, compute=compute)
+
+    def __store_bands(self,
+                      sources: list[daskArray],
+                      targets: list[zarr.Array],
+                      regions: list[tuple[slice, ...]],
+                      compute=True):
+        """Store the sources one band of rows at a time, see `memory_limit`.
+        Half of the limit goes to the band's data, the rest is left to the
+        source tiles and encoded chunks of the band in flight.
+        Bands start and end on the sources' chunks, which `align_chunks` lined
+        up with the zarr chunks, so no chunk is written by two bands.
+        """
+        assert self.memory_limit is not None
+
+        stores = []
+        for data, zarray, region in zip(sources, targets, regions):
+            rows = region[-2]
+            for band in row_bands(data, self.memory_limit // 2):
+                band_region = region[:-2] + (
+                    slice(rows.start + band.start, rows.start + band.stop), region[-1]
+                )
+                stores.append(self.__store_region(data[..., band, :], zarray, band_region, compute=False))
+        return _run_in_order(stores, compute)
+
+    def __wants_stats(self, zarray: zarr.Array) -> bool:
+        return self.channel_stats and zarray.path == "0"
+
+    def __target(self, zarray: zarr.Array):
+        """where dask stores to, times chunk encoding when instrumented"""
+        if self.stats is None:
+            return zarray
+        return InstrumentedTarget(zarray, self.stats)
+
+    def __level_chunks(self, series: str, data_chunks: tuple[int, ...]) -> tuple[int, ...]:
+        """zarr chunks of a level: `chunks` if given, else the data's, clipped to the level shape"""
+        if self.chunks is None:
+            chunks = (1,)*max(0, 5 - len(data_chunks)) + tuple(data_chunks)
+        else:
+            chunks = self.chunks
+        img_shape = self.img_shapes[int(series)]
+        return tuple(max(1, min(c, s)) for c, s in zip(chunks, img_shape))
+
+    def __require_level(self,
+                        series: str,
+                        dtype,
+                        chunks: tuple[int, ...],
+                        codecs: Optional[tuple[Optional[Codec], Optional[list[Codec]]]] = None,
+                        ) -> zarr.Array:
+        assert self.img_shapes is not None
+
+        img_shape = self.img_shapes[int(series)]
+
+        assert len(img_shape) == 5
+
+        if codecs is None:
+            codecs = make_codecs(self.compressor, dtype, self.clevel, self.shuffle)
+        compressor, filters = codecs
+
+        root = self.__get_root()
+        # get pyramid level, create if necessary
+        zarray = root.require_dataset(
+            series,
+            shape=img_shape,
+            exact=True,
+            chunks=chunks,
+            dtype=dtype,
+            compressor=compressor,
+            filters=filters,
+        )
+        # chunks of only the fill value (e.g. background) are not stored, but in
+        # zip files, which can't delete the keys zarr then removes;
+        # zarr only takes the option when creating arrays, not opening them
+        return zarr.Array(zarray.store, path=zarray.path, write_empty_chunks=self.container == "zip")
+
     def write_tiled(self,
                     data: daskArray,
                     series=None,
@@ -98,11 +666,12 @@ class TiledImageWriter:
                     t=None,
                     ):
         """Write a series of planes from the image file. Mimics the Bioformats API
+        @param data: Y, X plane, or Z, Y, X stack, or T, Z, Y, X, or T, C, Z, Y, X volume
         @param series: series (pyramid level)
         @param c: write from this channel. `None` = write color image if multichannel
             or interleaved RGB.
-        @param z: z-stack index
-        @param t: time index
+        @param z: z-stack index of the first plane of data, or slice of planes
+        @param t: time index of the first frame of data, or slice of frames
         n.b. either z or t should be "None" to specify which channel to write across.
         """
         if series is None:
@@ -110,59 +679,260 @@ class TiledImageWriter:
         else:
             series = str(series)
 
-        assert self.img_shapes is not None
+        data = as_tczyx(data)
 
-        img_shape = self.img_shapes[int(series)]
+        chunksize = self.__level_chunks(series, data.chunksize)
 
-        assert len(img_shape) == 5
+        zarray = self.__require_level(series, data.dtype, chunksize)
 
-        chunksize = (1,)*max(0, len(img_shape) - len(data.chunksize)) + data.chunksize
+        data = align_chunks(data, chunksize)
 
-        root = self.__get_root()
-        # get pyramid level, create if necessary
-        zarray = root.require_dataset(
-            series,
-            shape=img_shape,
-            exact=True,
-            chunks=chunksize,
-            dtype=data.dtype
-        )
+        region = data_region(data, c, z, t)
+        if self.memory_limit is not None:
+            self.__store_bands([data], [zarray], [region])
+            return
+        self.__store_region(data, zarray, region)
+
+    def __passthrough_level(self, reader: TiledImageReader, series: int):
+        """Tasks copying the raw tiles of a level to its zarr chunks, None if
+        the tiles can't be stored as-is, see `passthrough_codec`
+        """
+        encoding = reader.get_tile_encoding(series)
+        compatible, codec = passthrough_codec(encoding)
+        if not compatible:
+            return None
+
+        tile_height, tile_width = encoding["tile_shape"]
+        chunks = (1, 1, 1, tile_height, tile_width)
+        if self.chunks is not None and tuple(self.chunks) != chunks:
+            return None
+
+        # t, c, z axis of each of the source's non-spatial axes
+        res = reader._res[series]
+        leading_shape = []
+        tcz_axes = []
+        for size, dim in zip(res["shape"], res["dims"]):
+            if dim in ("height", "width"):
+                continue
+            if dim == "time":
+                tcz_axes.append(0)
+            elif dim in CHANNEL_DIMS or len(res["dims"]) == 3:
+                tcz_axes.append(1)
+            elif dim == "depth":
+                tcz_axes.append(2)
+            else:
+                return None
+            leading_shape.append(size)
+        if len(set(tcz_axes)) != len(tcz_axes):
+            return None
+
+        tile_index = reader.get_tile_index(series)
+        n_pages, n_tiles_y, n_tiles_x = tile_index.shape
+        if (n_pages, n_tiles_y, n_tiles_x) != (
+            int(numpy.prod(leading_shape)), ceil(res["height"] / tile_height), ceil(res["width"] / tile_width)
+        ):
+            return None
+
+        # the raw bytes are in the file's byte order
+        dtype = numpy.dtype(encoding["dtype"]).newbyteorder(encoding["byteorder"])
+        zarray = self.__require_level(str(series), dtype, chunks, codecs=(codec, None))
+
+        tasks = []
+        for page in range(n_pages):
+            tcz = [0, 0, 0]
+            for axis, idx in zip(tcz_axes, numpy.unravel_index(page, leading_shape)):
+                tcz[axis] = int(idx)
+            # a task per row of tiles
+            for iy in range(n_tiles_y):
+                row = tile_index.tiles[page, iy]
+                keys = [zarray._chunk_key((*tcz, iy, ix)) for ix in range(n_tiles_x)]
+                tasks.append(dask.delayed(_copy_tiles)(
+                    reader.file_path,
+                    zarray.store,
+                    keys,
+                    row["offset"],
+                    row["bytecount"],
+                ))
+        return tasks
+
+    def __store_levels(self, level_data: list[daskArray], compute=True, series_idxs: Optional[list[int]] = None):
+        sources = []
+        targets = []
+        if series_idxs is None:
+            series_idxs = list(range(len(level_data)))
+        for series, writedata in zip(series_idxs, level_data):
+            chunksize = self.__level_chunks(str(series), (1, 1, 1) + writedata.chunksize[-2:])
+            writedata = align_chunks(writedata, chunksize)
 
-        idx_t = t or 0
-        idx_c = c or 0
-        idx_z = z or 0
-        region = (
-            slice(idx_t, idx_t+1, 1),
-            slice(idx_c, idx_c+1, 1),
-            slice(idx_z, idx_z+1, 1),
+            sources.append(writedata)
+            targets.append(self.__require_level(str(series), writedata.dtype, chunksize))
+
+        regions = [tuple(slice(0, n) for n in source.shape) for source in sources]
+        if self.memory_limit is not None:
+            return self.__store_bands(sources, targets, regions, compute=compute)
+        if self.resume or any(self.__wants_stats(target) for target in targets):
+            return self.__store_blocks(sources, targets, regions, compute=compute)
+        return dask.array.store(
+            sources, [self.__target(target) for target in targets], lock=False, compute=compute
         )
-        size_t = 1
-        size_c = 1
-        size_z = 1
-        size_y = data.shape[0]
-        size_x = data.shape[1]
-
-        writedata = data.reshape(size_t, size_c, size_z, size_y, size_x)
-        to_zarr(writedata, zarray, region=region)
-
-        ## TODO: LIS - I want to be uisng map_blocks -> arr.store
-        ## but write would need the x,y chunk index
-        ## or better yet to_zarr with regions, but that doesn't work
-        ## quite right for an unknown (to me) reason
-        #for (iy, ix), chunk in numpy.ndenumerate(data.to_delayed()):
-        #    arr = dask.compute(chunk)[0] # type: ignore
-        #    y0 = iy * data.chunks[0][0]
-        #    x0 = ix * data.chunks[1][0]
-        #    y1 = y0 + arr.shape[0]
-        #    x1 = x0 + arr.shape[1]
-        #    zarray[t or 0, c or 0, z or 0, y0:y1, x0:x1] = arr
+
+    def write_pyramid(self,
+                      reader: TiledImageReader,
+                      compute=True,
+                      levels: Optional[int] = None,
+                      method: DownsampleMethod = "mean",
+                      passthrough: bool = False,
+                      transform: Optional[Transform] = None,
+                      ):
+        """Write every pyramid level and channel of an image in a single pass.
+        @param reader: reader of the source image, its levels must match `img_shapes`
+        @param compute: if `False`, return the combined delayed store instead
+                        of executing it
+        @param levels: if set, only level 0 is read from the source, and this
+                       many levels are generated from it, see `write_downsampled`
+        @param method: downsampling of generated levels, "mean", "nearest" or "mode"
+        @param passthrough: copy the compressed tiles of levels whose codec and
+                            tiling zarr can read as-is straight into their
+                            chunks, without decoding; other levels are
+                            decoded and re-encoded as usual
+        @param transform: crop, channel selection, flat-field correction,
+                          rescale and dtype cast fused into the blocks of
+                          every level, see `apply_transform`; `img_shapes`
+                          is replaced by the transformed level shapes, and
+                          there is no passthrough
+
+        Unlike calling `write_tiled` once per (series, c), the stores of all
+        levels are merged into one graph, so each source tile is decoded once
+        and all of its channels are scattered to their zarr chunks.
+        """
+        if self.channel_names is None:
+            self.channel_names = list(reader._meta["channel_names"]) or None
+
+        shape0 = (reader._res[0]["height"], reader._res[0]["width"])
+
+        def source_level(series: int) -> daskArray:
+            data = reader_level(reader, series)
+            return apply_transform(data, transform, shape0) if transform else data
+
+        if transform:
+            passthrough = False
+            if self.channel_names is not None and "channels" in transform:
+                self.channel_names = [
+                    self.channel_names[c] if c < len(self.channel_names) else str(c)
+                    for c in transform["channels"]
+                ]
+            if self.img_shapes is not None:
+                self.img_shapes = [transformed_shape(transform, shape0, shape) for shape in self.img_shapes]
+                if self.__zarr_root is not None:
+                    self.__write_metadata(self.__zarr_root)
+
+        if levels is not None:
+            return self.write_downsampled(
+                source_level(0), levels, method=method, compute=compute
+            )
+
+        assert self.img_shapes is not None
+
+        if not passthrough:
+            return self.__store_levels(
+                [source_level(series) for series in range(len(self.img_shapes))],
+                compute=compute,
+            )
+
+        copies = []
+        decoded_series = []
+        for series in range(len(self.img_shapes)):
+            # level 0 is decoded anyway for its channel statistics
+            tasks = None if series == 0 and self.channel_stats else self.__passthrough_level(reader, series)
+            if tasks is None:
+                decoded_series.append(series)
+            else:
+                copies.extend(tasks)
+        stores = copies
+        if decoded_series:
+            stores = stores + [self.__store_levels(
+                [reader_level(reader, series) for series in decoded_series],
+                compute=False,
+                series_idxs=decoded_series,
+            )]
+
+        if not compute:
+            return dask.delayed(stores)
+        dask.compute(*stores)
+
+    def write_downsampled(self,
+                          data: daskArray,
+                          levels: int,
+                          method: DownsampleMethod = "mean",
+                          factor: int = 2,
+                          compute=True,
+                          ):
+        """Write `data` as level 0, and generate `levels - 1` downsampled levels from it.
+        @param data: full resolution t,c,z,y,x array
+        @param levels: total number of levels, level 0 included
+        @param method: "mean", "nearest" or "mode" (for label images)
+        @param factor: y and x downsampling factor between consecutive levels
+        @param compute: if `False`, return the combined delayed store instead
+                        of executing it
+
+        `img_shapes` is replaced by the generated level shapes. Each level is
+        computed from the blocks of the previous one within one graph, so level 0
+        is read only once, and the recorded scales are the factors actually used.
+        With a `memory_limit`, levels are instead written one after another, each
+        downsampled from the stored previous level.
+        """
+        assert data.ndim == 5, "data must be t,c,z,y,x"
+        assert levels >= 1
+
+        level_data = [data]
+        for _ in range(1, levels):
+            level_data.append(downsample(level_data[-1], factor, method))
+
+        self.img_shapes = [tuple(d.shape) for d in level_data]
+        self.__scales = [
+            [1.0, 1.0, 1.0, float(factor**i), float(factor**i)] for i in range(levels)
+        ]
+        if self.__zarr_root is not None:
+            self.__write_metadata(self.__zarr_root)
+
+        if self.memory_limit is not None:
+            # each level is downsampled from the stored previous level, so
+            # level 0 isn't recomputed for every band of every level
+            stores = []
+            for series in range(levels):
+                if series > 0:
+                    previous = self.__get_root()[str(series - 1)]
+                    data = downsample(dask.array.from_zarr(previous), factor, method)
+                stores.append(self.__store_levels([data], compute=False, series_idxs=[series]))
+            return _run_in_order(stores, compute)
+
+        return self.__store_levels(level_data, compute=compute)
 
     def close(self):
+        self.__close(consolidate=self.consolidated)
+
+    def __close(self, consolidate: bool):
+        if self.__zarr_store is not None:
+            if consolidate:
+                metadata_store = self.__zarr_store
+                if self.container == "directory":
+                    # ome-zarr's store, with its "/" key separator, would name it "zmetadata"
+                    metadata_store = zarr.storage.FSStore(self.file_path, mode="a")
+                zarr.consolidate_metadata(metadata_store)
+            flush = getattr(self.__zarr_store, "flush", None)
+            if flush is not None:
+                flush()
+            # zip files are only readable once closed
+            self.__zarr_store.close()
         self.__delete_state()
         self.__init_values()
 
     def delete(self):
         if self.__zarr_root is not None:
             self.close()
-        rmtree(self.file_path)
+        if os.path.isdir(self.file_path):
+            rmtree(self.file_path)
+        elif os.path.exists(self.file_path):
+            os.unlink(self.file_path)
+        WriteManifest(WriteManifest.path_for(self.file_path)).clear()
 
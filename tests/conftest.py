@@ -0,0 +1,52 @@
+import numpy
+import pytest
+import tifffile
+
+
+@pytest.fixture
+def ome_tiff(tmp_path):
+    """Factory writing a small tiled, pyramidal ome-tiff, returning its path and
+    the t,c,z,y,x data of every level
+    """
+    def write(name="img.ome.tiff",
+              shape=(1, 2, 1, 300, 330),
+              tile=128,
+              levels=2,
+              dtype="uint8",
+              compression=None,
+              predictor=None,
+              interleaved=False,
+              channel_names=None,
+              ):
+        rng = numpy.random.default_rng(0)
+        size_y, size_x = shape[-2:]
+        yy, xx = numpy.mgrid[0:size_y, 0:size_x]
+        # smooth content with a little noise, so lossy codecs stay close
+        base = (numpy.sin(yy / 17.0) + numpy.cos(xx / 11.0) + 2) * 50
+        data = (base + rng.integers(0, 8, shape)).astype(dtype)
+
+        options = dict(tile=(tile, tile), compression=compression, predictor=predictor)
+        if interleaved:
+            options.update(photometric="rgb", planarconfig="contig")
+            axes = "TZYXC"
+        else:
+            options.update(photometric="minisblack")
+            axes = "TCZYX"
+
+        metadata = {"axes": axes}
+        if channel_names is not None:
+            metadata["Channel"] = {"Name": list(channel_names)}
+
+        level_data = [data[..., ::2**level, ::2**level] for level in range(levels)]
+        path = str(tmp_path / name)
+        with tifffile.TiffWriter(path, bigtiff=True, ome=True) as tif:
+            for level, d in enumerate(level_data):
+                if interleaved:
+                    d = numpy.moveaxis(d, 1, -1)
+                if level == 0:
+                    tif.write(d, subifds=levels - 1, metadata=metadata, **options)
+                else:
+                    tif.write(d, subfiletype=1, **options)
+        return path, level_data
+
+    return write
@@ -0,0 +1,79 @@
+import mmap
+
+import numpy
+import pytest
+import zarr
+
+import daskrw.cache
+from daskrw.cache import TileCache
+from daskrw.reader import TiledImageReader
+from daskrw.stats import Stats
+from daskrw.writer import reader_level
+
+
+def test_size_policy_heap_stays_bounded():
+    cache = TileCache(2**20, policy="size")
+    for i in range(10):
+        cache.put(("f", i), numpy.zeros(100, dtype="uint8"))
+    for i in range(10000):
+        cache.get(("f", i % 10))
+    assert len(cache._TileCache__heap) <= 2 * len(cache)
+
+    cache.invalidate("f")
+    for i in range(8):
+        cache.put(("f", i), numpy.zeros(100, dtype="uint8"))
+    assert len(cache._TileCache__heap) <= 2 * len(cache)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+@pytest.mark.parametrize("options", [dict(decode_workers=2), dict(cache_decoded=False), dict()])
+def test_reads_without_store_internals(ome_tiff, monkeypatch, compression, options):
+    # tifffile versions without the private attributes are read through the store
+    monkeypatch.setattr(daskrw.cache, "STORE_INTERNALS", daskrw.cache.STORE_INTERNALS + ("_missing",))
+    path, levels = ome_tiff(compression=compression)
+
+    reader = TiledImageReader(path, cache=TileCache(), **options)
+    try:
+        numpy.testing.assert_array_equal(reader_level(reader, 0).compute(), levels[0])
+    finally:
+        reader.close()
+
+
+def test_mapped_tiles_are_views_released_on_close(ome_tiff):
+    path, levels = ome_tiff(compression=None)
+    stats = Stats()
+    reader = TiledImageReader(path, cache=TileCache(), stats=stats)
+    numpy.testing.assert_array_equal(reader_level(reader, 0).compute(), levels[0])
+
+    # views of the map, counted apart from the tiles read
+    snapshot = stats.snapshot()
+    assert snapshot["tiles_mapped"] > 0
+    assert snapshot["tiles_read"] == snapshot["bytes_read"] == snapshot["tiles_decoded"] == 0
+
+    store = reader._TiledImageReader__cached_store
+    zarray = zarr.open(store, mode="r")["0"]
+    chunk = store[zarray._chunk_key((0,) * zarray.ndim)]
+    base = chunk
+    while isinstance(base, numpy.ndarray):
+        base = base.base
+    assert isinstance(base.obj, mmap.mmap)
+    assert not chunk.flags.writeable
+    del chunk, base, zarray
+
+    reader.close()
+    assert store._CachedTiffStore__mmap is None
+
+
+def test_mapped_tile_outlives_close(ome_tiff):
+    path, levels = ome_tiff(compression=None)
+    reader = TiledImageReader(path, cache=TileCache())
+    reader_level(reader, 0)
+    store = reader._TiledImageReader__cached_store
+    zarray = zarr.open(store, mode="r")["0"]
+    chunk = store[zarray._chunk_key((0,) * zarray.ndim)]
+    mapped = store._CachedTiffStore__mmap
+
+    reader.close()
+    # still referenced, the map stays open until the view is freed
+    assert not mapped.closed
+    numpy.testing.assert_array_equal(chunk.squeeze(), levels[0][0, 0, 0, :128, :128])
@@ -0,0 +1,79 @@
+import os
+
+import numpy
+import pytest
+
+import daskrw.metaindex
+from daskrw.metaindex import MetadataIndex, SIDECAR_SUFFIX
+from daskrw.reader import TiledImageReader
+
+
+def open_indexed(path: str, index: MetadataIndex):
+    """metadata and tile layout of every level, through the index"""
+    reader = TiledImageReader(path, metadata_index=index)
+    try:
+        return reader._meta, [reader.get_tile_layout(level) for level in reader._res]
+    finally:
+        reader.close()
+
+
+def forbid_parsing(monkeypatch):
+    def parse(self):
+        raise AssertionError("the file was parsed")
+
+    monkeypatch.setattr(TiledImageReader, "_TiledImageReader__extract_standard_metadata", parse)
+    monkeypatch.setattr(TiledImageReader, "_TiledImageReader__extract_tile_layout", parse)
+
+
+def assert_same_layouts(layouts, expected):
+    assert len(layouts) == len(expected)
+    for layout, expected_layout in zip(layouts, expected):
+        numpy.testing.assert_array_equal(layout["offsets"], expected_layout["offsets"])
+        numpy.testing.assert_array_equal(layout["bytecounts"], expected_layout["bytecounts"])
+
+
+@pytest.mark.parametrize("in_cache_dir", [False, True])
+def test_reopen_from_index(tmp_path, ome_tiff, monkeypatch, in_cache_dir):
+    path, _ = ome_tiff(compression="zlib")
+    index = MetadataIndex(str(tmp_path / "index") if in_cache_dir else None)
+
+    meta, layouts = open_indexed(path, index)
+    assert os.path.exists(index.path_for(path))
+    assert os.path.exists(path + SIDECAR_SUFFIX) != in_cache_dir
+
+    forbid_parsing(monkeypatch)
+    indexed_meta, indexed_layouts = open_indexed(path, index)
+    assert indexed_meta == meta
+    assert_same_layouts(indexed_layouts, layouts)
+
+
+def test_stale_entries_are_rebuilt(tmp_path, ome_tiff, monkeypatch):
+    path, _ = ome_tiff(compression="zlib")
+    index = MetadataIndex()
+    meta, layouts = open_indexed(path, index)
+    assert index.load(path) is not None
+
+    # a changed image
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert index.load(path) is None
+    rebuilt_meta, rebuilt_layouts = open_indexed(path, index)
+    assert rebuilt_meta == meta
+    assert_same_layouts(rebuilt_layouts, layouts)
+    assert index.load(path) is not None
+
+    # an index written by another version
+    monkeypatch.setattr(daskrw.metaindex, "INDEX_VERSION", daskrw.metaindex.INDEX_VERSION + 1)
+    assert index.load(path) is None
+
+
+def test_corrupt_entries_are_ignored(ome_tiff):
+    path, _ = ome_tiff(compression="zlib")
+    index = MetadataIndex()
+    meta, _ = open_indexed(path, index)
+
+    with open(index.path_for(path), "r+b") as fh:
+        fh.truncate(100)
+    assert index.load(path) is None
+    assert open_indexed(path, index)[0] == meta
+    assert index.load(path) is not None
@@ -0,0 +1,64 @@
+import numpy
+import pytest
+import tifffile
+import zarr
+
+import daskrw.writer
+from daskrw.reader import TiledImageReader
+from daskrw.writer import TiledImageWriter
+from daskrw.tozarr import image_shapes
+
+
+def decoded_levels(path: str, shapes: list[tuple[int, ...]]) -> list[numpy.ndarray]:
+    """Levels of a planar ome-tiff as decoded by tifffile, as t,c,z,y,x"""
+    with tifffile.TiffFile(path) as tif:
+        return [level.asarray().reshape(shape) for level, shape in zip(tif.series[0].levels, shapes)]
+
+
+def write_pyramid(path: str, output: str, monkeypatch, decoded: list):
+    # levels of the source that are decoded are read through `reader_level`
+    reader_level = daskrw.writer.reader_level
+
+    def recording_reader_level(reader, series):
+        decoded.append(series)
+        return reader_level(reader, series)
+
+    monkeypatch.setattr(daskrw.writer, "reader_level", recording_reader_level)
+    reader = TiledImageReader(path)
+    try:
+        writer = TiledImageWriter(output, image_shapes(reader))
+        writer.write_pyramid(reader, passthrough=True)
+        writer.close()
+    finally:
+        reader.close()
+    return zarr.open(output, mode="r")
+
+
+# the 300 x 330 levels don't fill their edge tiles, whose padding zarr crops like tifffile
+@pytest.mark.parametrize("compression", [None, "zlib", "zstd", "lzw", "jpeg"])
+def test_passthrough_copies_tiles(tmp_path, ome_tiff, monkeypatch, compression):
+    if compression in ("lzw", "jpeg"):
+        pytest.importorskip("imagecodecs.numcodecs")
+    path, levels = ome_tiff(compression=compression)
+
+    decoded = []
+    root = write_pyramid(path, str(tmp_path / "out.ome.zarr"), monkeypatch, decoded)
+
+    assert decoded == []
+    for series, expected in enumerate(decoded_levels(path, [d.shape for d in levels])):
+        numpy.testing.assert_array_equal(root[str(series)][:], expected)
+
+
+@pytest.mark.parametrize("options", [
+    dict(compression="zlib", predictor=True),
+    dict(compression="zlib", interleaved=True, shape=(1, 3, 1, 300, 330)),
+])
+def test_passthrough_falls_back_to_decoding(tmp_path, ome_tiff, monkeypatch, options):
+    path, levels = ome_tiff(**options)
+
+    decoded = []
+    root = write_pyramid(path, str(tmp_path / "out.ome.zarr"), monkeypatch, decoded)
+
+    assert decoded == list(range(len(levels)))
+    for series, expected in enumerate(levels):
+        numpy.testing.assert_array_equal(root[str(series)][:], expected)
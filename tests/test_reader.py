@@ -0,0 +1,190 @@
+import time
+import asyncio
+import threading
+
+import numpy
+import pytest
+import tifffile
+
+from daskrw.cache import TileCache
+from daskrw.reader import TiledImageReader
+from daskrw.stats import Stats
+
+
+def source_plane(path: str, level: int = 0) -> numpy.ndarray:
+    """Level of a 2 channel, single z and t ome-tiff as Y, X, C"""
+    return numpy.moveaxis(tifffile.imread(path, level=level), 0, -1)
+
+
+@pytest.fixture
+def reader(ome_tiff):
+    path, _ = ome_tiff(compression="zlib")
+    reader = TiledImageReader(path, cache=TileCache())
+    yield reader
+    reader.close()
+
+
+def test_read_region(reader):
+    plane = source_plane(reader.file_path)
+    numpy.testing.assert_array_equal(reader.read_region(40, 30, 200, 150), plane[30:180, 40:240])
+    numpy.testing.assert_array_equal(reader.read_region(40, 30, 200, 150, c=1), plane[30:180, 40:240, 1])
+
+
+def test_read_region_pads_outside_the_image(reader):
+    plane = source_plane(reader.file_path)
+    region = reader.read_region(-10, 250, 100, 100)
+
+    assert region.shape == (100, 100, 2)
+    numpy.testing.assert_array_equal(region[:50, 10:], plane[250:, :90])
+    assert not region[50:].any()
+    assert not region[:, :10].any()
+    assert not reader.read_region(1000, 1000, 10, 10).any()
+
+
+def test_read_region_target_downsample(reader):
+    assert reader.best_level(1) == 0
+    assert reader.best_level(1.5) == 0
+    assert reader.best_level(2) == 1
+    assert reader.best_level(16) == 1
+
+    level1 = source_plane(reader.file_path, level=1)
+    # level 0 pixels, read at half resolution
+    region = reader.read_region(40, 30, 200, 150, target_downsample=3)
+    numpy.testing.assert_array_equal(region, level1[15:90, 20:120])
+
+
+@pytest.mark.parametrize("order", ["row-major", "hilbert"])
+def test_iter_tiles(reader, order):
+    plane = source_plane(reader.file_path)
+    seen = set()
+    for tile_idx, (x, y, w, h), tile in reader.iter_tiles(order=order, overlap=8):
+        assert tile_idx not in seen
+        seen.add(tile_idx)
+        numpy.testing.assert_array_equal(tile, plane[y:y + h, x:x + w])
+    # 300 x 330 in 128 px tiles
+    assert seen == {(iy, ix) for iy in range(3) for ix in range(3)}
+
+
+def test_iter_tiles_early_break(reader):
+    for _ in reader.iter_tiles(prefetch=2):
+        break
+    # the prefetching thread is released
+    assert not [thread for thread in threading.enumerate() if thread.name == "daskrw-prefetch"]
+
+
+def test_aread_region(reader):
+    plane = source_plane(reader.file_path)
+
+    async def read():
+        return await asyncio.gather(*[reader.aread_region(0, 0, 330, 300) for _ in range(8)])
+
+    for region in asyncio.run(read()):
+        numpy.testing.assert_array_equal(region, plane)
+
+
+def test_aread_region_single_flight(ome_tiff):
+    path, _ = ome_tiff(compression="zlib")
+    stats = Stats()
+    reader = TiledImageReader(path, cache=TileCache(), stats=stats, use_mmap=False)
+
+    async def read():
+        await asyncio.gather(*[reader.aread_region(0, 0, 128, 128) for _ in range(16)])
+
+    try:
+        asyncio.run(read())
+    finally:
+        reader.close()
+    # one tile of each of the 2 channels, decoded once
+    assert stats.snapshot()["tiles_decoded"] == 2
+
+
+@pytest.mark.parametrize("prefetch", [1, 3])
+def test_aiter_tiles_reads_in_flight(reader, prefetch):
+    plane = source_plane(reader.file_path)
+    read_tile = reader._TiledImageReader__read_tile
+    lock = threading.Lock()
+    in_flight = [0]
+    most = [0]
+
+    def counting_read_tile(*args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            most[0] = max(most[0], in_flight[0])
+        time.sleep(0.01)
+        try:
+            return read_tile(*args, **kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    reader._TiledImageReader__read_tile = counting_read_tile
+
+    async def tiles():
+        return [item async for item in reader.aiter_tiles(prefetch=prefetch)]
+
+    items = asyncio.run(tiles())
+    assert len(items) == 9
+    for _, (x, y, w, h), tile in items:
+        numpy.testing.assert_array_equal(tile, plane[y:y + h, x:x + w])
+    assert most[0] == prefetch
+
+
+def test_read_tiled_volumes(ome_tiff):
+    path, levels = ome_tiff(shape=(2, 2, 3, 300, 330), compression="zlib")
+    # T, C, Z, Y, X -> T, Z, Y, X, C
+    volume = levels[0].transpose(0, 2, 3, 4, 1)
+    stats = Stats()
+    reader = TiledImageReader(path, cache=TileCache(), stats=stats)
+    try:
+        # only the tiles of the selected plane are read: 3 x 3 tiles of 128
+        plane = reader.read_tiled(series=0, t=1, z=2, c=0)
+        assert stats.snapshot()["tiles_decoded"] == 0
+        numpy.testing.assert_array_equal(plane, volume[1, 2, :, :, 0])
+        assert stats.snapshot()["tiles_decoded"] == 9
+
+        data = reader.read_tiled(series=0)
+        assert data.shape == (2, 3, 300, 330, 2)
+        numpy.testing.assert_array_equal(data, volume)
+        # ints drop the axis, slices keep it
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, z=1), volume[:, 1])
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, t=1, z=slice(0, 2)), volume[1, 0:2])
+        numpy.testing.assert_array_equal(reader.read_tiled(series=1, t=slice(1, 2), z=2), levels[1].transpose(0, 2, 3, 4, 1)[1:2, 2])
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize("interleaved", [False, True])
+def test_read_tiled_channel_selection(ome_tiff, interleaved):
+    path, levels = ome_tiff(shape=(1, 3, 1, 300, 330), compression="zlib", interleaved=interleaved,
+                            channel_names=None if interleaved else ["DAPI", "GFP", "RFP"])
+    # Y, X, C
+    plane = levels[0][0, :, 0].transpose(1, 2, 0)
+    stats = Stats()
+    reader = TiledImageReader(path, cache=TileCache(), stats=stats)
+    try:
+        data = reader.read_tiled(series=0, c=[2, 0])
+        assert data.shape == (300, 330, 2)
+        numpy.testing.assert_array_equal(data, plane[..., [2, 0]])
+        # each tile decoded once, for all the channels picked from it
+        assert stats.snapshot()["tiles_decoded"] == (9 if interleaved else 18)
+
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, c=slice(1, 3)), plane[..., 1:3])
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, c=1), plane[..., 1])
+    finally:
+        reader.close()
+
+
+def test_read_tiled_channel_names(ome_tiff):
+    path, levels = ome_tiff(shape=(1, 3, 1, 300, 330), channel_names=["DAPI", "GFP", "RFP"])
+    plane = levels[0][0, :, 0].transpose(1, 2, 0)
+    reader = TiledImageReader(path, cache=TileCache())
+    try:
+        names = []
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, c="GFP", channel_names=names), plane[..., 1])
+        assert names == ["DAPI", "GFP", "RFP"]
+        # names and indices mix
+        numpy.testing.assert_array_equal(reader.read_tiled(series=0, c=["RFP", 0]), plane[..., [2, 0]])
+        with pytest.raises(ValueError, match="Unknown channel 'YFP'"):
+            reader.read_tiled(series=0, c=["YFP"])
+    finally:
+        reader.close()
@@ -0,0 +1,73 @@
+import numpy
+import pytest
+import zarr
+import dask.array
+
+import daskrw.writer
+from daskrw.manifest import WriteManifest
+from daskrw.writer import TiledImageWriter
+
+SHAPE = (1, 1, 1, 256, 256)
+CHUNKS = (1, 1, 1, 64, 64)
+
+
+@pytest.fixture
+def data():
+    values = numpy.arange(256 * 256, dtype="uint16").reshape(SHAPE)
+    return dask.array.from_array(values, chunks=CHUNKS)
+
+
+def write(path: str, data, monkeypatch, verify=False) -> list[str]:
+    """Write with a manifest, returning the keys of the blocks written"""
+    written = []
+    write_block = daskrw.writer._write_block
+
+    def recording_write_block(block, zarray, region, manifest, block_key, channel_stats=False, write=True):
+        if write:
+            written.append(block_key)
+        return write_block(block, zarray, region, manifest, block_key, channel_stats, write)
+
+    monkeypatch.setattr(daskrw.writer, "_write_block", recording_write_block)
+    writer = TiledImageWriter(path, [SHAPE], chunks=CHUNKS, resume=True, verify=verify)
+    writer.write_tiled(data)
+    writer.close()
+    return written
+
+
+def manifest_lines(path: str) -> list[str]:
+    with open(WriteManifest.path_for(path)) as fh:
+        return fh.readlines()
+
+
+def test_resume_rewrites_unrecorded_blocks(tmp_path, data, monkeypatch):
+    path = str(tmp_path / "img.ome.zarr")
+    assert len(write(path, data, monkeypatch)) == 16
+
+    # an interrupted run: the last blocks weren't recorded, nor fully stored,
+    # and the last line was cut short
+    lines = manifest_lines(path)
+    kept, dropped = lines[:10], lines[10:]
+    with open(WriteManifest.path_for(path), "w") as fh:
+        fh.writelines(kept)
+        fh.write(dropped[0][:len(dropped[0]) // 2])
+    dropped_keys = {line.split('"')[3] for line in dropped}
+    zarray = zarr.open(path, mode="r+")["0"]
+    for key in dropped_keys:
+        region = tuple(slice(*map(int, r.split(":"))) for r in key.split("/")[1].split(","))
+        zarray[region] = 0
+
+    assert set(write(path, data, monkeypatch)) == dropped_keys
+    numpy.testing.assert_array_equal(zarr.open(path, mode="r")["0"][:], data.compute())
+
+
+def test_verify_rewrites_corrupt_blocks(tmp_path, data, monkeypatch):
+    path = str(tmp_path / "img.ome.zarr")
+    write(path, data, monkeypatch)
+
+    # a recorded block whose chunk no longer holds what was written
+    zarr.open(path, mode="r+")["0"][0, 0, 0, 64:128, 128:192] = 7
+    corrupt = "0/0:1,0:1,0:1,64:128,128:192"
+
+    assert write(path, data, monkeypatch) == []
+    assert write(path, data, monkeypatch, verify=True) == [corrupt]
+    numpy.testing.assert_array_equal(zarr.open(path, mode="r")["0"][:], data.compute())
@@ -0,0 +1,82 @@
+import threading
+
+import numpy
+import pytest
+import dask.array
+
+from daskrw.reader import TiledImageReader
+from daskrw.writer import reader_level
+from daskrw.tiffwriter import TiledTiffWriter
+from daskrw.downsample import downsample
+
+
+def read_levels(path: str) -> list[numpy.ndarray]:
+    reader = TiledImageReader(path)
+    try:
+        return [reader_level(reader, series).compute() for series in range(len(reader.level_downsamples()))]
+    finally:
+        reader.close()
+
+
+def test_round_trip_pyramid(tmp_path, ome_tiff):
+    path, levels = ome_tiff(shape=(2, 2, 3, 300, 330))
+    output = str(tmp_path / "out.ome.tiff")
+
+    reader = TiledImageReader(path)
+    try:
+        writer = TiledTiffWriter(output, [d.shape for d in levels], tile=(64, 64), compression="zlib")
+        writer.write_pyramid(reader)
+        writer.close()
+    finally:
+        reader.close()
+
+    written = read_levels(output)
+    assert len(written) == len(levels)
+    for value, expected in zip(written, levels):
+        numpy.testing.assert_array_equal(value, expected)
+
+
+@pytest.mark.parametrize("method", ["mean", "nearest", "mode"])
+def test_round_trip_downsampled(tmp_path, ome_tiff, method):
+    _, levels = ome_tiff(shape=(1, 2, 2, 300, 330))
+    decoded = []
+    lock = threading.Lock()
+
+    def count(block):
+        with lock:
+            decoded.append(block.shape)
+        return block
+
+    data = dask.array.from_array(levels[0], chunks=(1, 1, 1, 64, 330))
+    data = data.map_blocks(count, meta=numpy.empty((0,) * 5, dtype=data.dtype))
+    output = str(tmp_path / "out.ome.tiff")
+    writer = TiledTiffWriter(output, [levels[0].shape], tile=(32, 32), compression="zstd")
+    writer.write_downsampled(data, 4, method=method)
+    writer.close()
+
+    # each block of level 0 is computed once, the lower levels come from the level above
+    assert len(decoded) == data.npartitions
+
+    expected = [levels[0]]
+    for _ in range(3):
+        expected.append(downsample(dask.array.from_array(expected[-1]), 2, method).compute())
+    written = read_levels(output)
+    assert [w.shape for w in written] == [e.shape for e in expected] == writer.img_shapes
+    for value, level in zip(written, expected):
+        numpy.testing.assert_array_equal(value, level)
+    # no temporary level is left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["img.ome.tiff", "out.ome.tiff"]
+
+
+def test_later_writes_win_over_generated_levels(tmp_path):
+    data = numpy.arange(128 * 128, dtype="uint16").reshape(1, 1, 1, 128, 128)
+    output = str(tmp_path / "out.ome.tiff")
+    writer = TiledTiffWriter(output, [data.shape], tile=(16, 16), compression=None)
+    writer.write_downsampled(dask.array.from_array(data, chunks=32), 3)
+    writer.write_tiled(dask.array.ones((8, 8), dtype="uint16", chunks=8), series=1, c=0, z=0, t=0)
+    writer.close()
+
+    level1 = read_levels(output)[1]
+    expected = downsample(dask.array.from_array(data), 2).compute()
+    expected[..., :8, :8] = 1
+    numpy.testing.assert_array_equal(level1, expected)
@@ -0,0 +1,64 @@
+import os
+
+import numpy
+import pytest
+import zarr
+
+from daskrw.writer import TiledImageWriter
+from daskrw.tozarr import main, find_inputs, output_path, is_complete, conversion_options, COMPLETE_ATTR
+
+
+def test_find_inputs(tmp_path, ome_tiff):
+    a, _ = ome_tiff("a.ome.tiff")
+    b, _ = ome_tiff("b.ome.tif")
+    (tmp_path / "notes.txt").write_text("")
+
+    assert find_inputs([str(tmp_path)]) == [a, b]
+    assert find_inputs([str(tmp_path / "*.ome.tif*"), a]) == [a, b]
+    assert find_inputs([b, str(tmp_path / "missing.ome.tiff")]) == [b]
+
+
+def test_convert_skip_and_options(tmp_path, ome_tiff, capsys):
+    path, levels = ome_tiff("img.ome.tiff")
+    out_dir = str(tmp_path / "out")
+    output = output_path(path, out_dir)
+
+    assert main([path, "-o", out_dir]) == 0
+    # the completion mark is part of the consolidated metadata
+    root = zarr.open_consolidated(output, mode="r")
+    assert COMPLETE_ATTR in root.attrs
+    numpy.testing.assert_array_equal(root["0"][:], levels[0])
+    assert is_complete(path, output, conversion_options())
+    capsys.readouterr()
+
+    assert main([path, "-o", out_dir]) == 0
+    assert f"skipped {path}" in capsys.readouterr().out
+
+    # other options make another output
+    assert main([path, "-o", out_dir, "--dtype", "uint16"]) == 0
+    assert f"skipped {path}" not in capsys.readouterr().out
+    assert zarr.open(output, mode="r")["0"].dtype == numpy.uint16
+    assert not is_complete(path, output, conversion_options())
+
+
+def test_failed_close_is_not_complete(tmp_path, ome_tiff, monkeypatch):
+    path, _ = ome_tiff("img.ome.tiff")
+    out_dir = str(tmp_path / "out")
+
+    def close(self):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(TiledImageWriter, "close", close)
+    assert main([path, "-o", out_dir]) == 1
+    assert not is_complete(path, output_path(path, out_dir), conversion_options())
+
+
+def test_failures_exit_code(tmp_path, ome_tiff):
+    path, _ = ome_tiff("img.ome.tiff")
+    broken = tmp_path / "broken.ome.tiff"
+    broken.write_bytes(b"not a tiff")
+    out_dir = str(tmp_path / "out")
+
+    assert main([path, str(broken), "-o", out_dir]) == 1
+    assert is_complete(path, output_path(path, out_dir), conversion_options())
+    assert not os.path.exists(os.path.join(output_path(str(broken), out_dir), ".zmetadata"))
@@ -0,0 +1,133 @@
+import dask.array
+import numpy
+import pytest
+
+from daskrw import transform as transform_module
+from daskrw.transform import apply_transform, transformed_shape
+
+
+SHAPE0 = (1, 3, 1, 64, 96)
+
+
+@pytest.fixture(params=["numpy", "numexpr"])
+def kernel(request, monkeypatch):
+    if request.param == "numexpr":
+        pytest.importorskip("numexpr")
+    else:
+        monkeypatch.setattr(transform_module, "numexpr", None)
+    return request.param
+
+
+def plain(level0, transform, factor):
+    """The transform of level0[..., ::factor, ::factor], written out step by step in float64"""
+    out = level0[..., ::factor, ::factor].astype(numpy.float64)
+    channels = transform.get("channels", list(range(level0.shape[1])))
+    out = out[:, channels]
+
+    def reference(image, normalize):
+        image = image.astype(numpy.float64)
+        if image.ndim == 2:
+            image = numpy.stack([image] * level0.shape[1])
+        image = image[channels]
+        if normalize:
+            image = image / image.mean(axis=(1, 2), keepdims=True)
+        return image[None, :, None, ::factor, ::factor]
+
+    if "darkfield" in transform:
+        out = out - reference(transform["darkfield"], False)
+    if "flatfield" in transform:
+        out = out / reference(transform["flatfield"], True)
+
+    if "crop" in transform:
+        # crops here are on multiples of the factor, so the level's crop is exact
+        x, y, w, h = transform["crop"]
+        out = out[..., y // factor:(y + h) // factor, x // factor:(x + w) // factor]
+
+    dtype = numpy.dtype(transform.get("dtype", level0.dtype))
+    if dtype == level0.dtype and not {"window", "flatfield", "darkfield"} & transform.keys():
+        return out.astype(dtype)
+    in_lo, in_hi = numpy.iinfo(level0.dtype).min, numpy.iinfo(level0.dtype).max
+    window = transform.get("window", (in_lo, in_hi))
+    windows = window if isinstance(window, list) else [window] * len(channels)
+    out_lo, out_hi = (numpy.iinfo(dtype).min, numpy.iinfo(dtype).max) if dtype.kind in "iu" else (0.0, 1.0)
+    for i, (lo, hi) in enumerate(windows):
+        out[:, i] = (out[:, i] - lo) / (hi - lo) * (out_hi - out_lo) + out_lo
+    out = out.clip(out_lo, out_hi)
+    if dtype.kind in "iu":
+        out = numpy.rint(out)
+    return out.astype(dtype)
+
+
+def transformed(level0, transform, factor):
+    level = dask.array.from_array(level0[..., ::factor, ::factor], chunks=(1, 1, 1, 16, 16))
+    result = apply_transform(level, transform, SHAPE0)
+    assert result.shape == transformed_shape(transform, SHAPE0, level.shape)
+    return result.compute()
+
+
+@pytest.fixture
+def level0():
+    rng = numpy.random.default_rng(0)
+    return rng.integers(100, 4000, size=SHAPE0, dtype=numpy.uint16)
+
+
+@pytest.fixture
+def fields():
+    rng = numpy.random.default_rng(1)
+    flat = rng.uniform(0.5, 1.5, size=SHAPE0[1:2] + SHAPE0[-2:]).astype(numpy.float32)
+    dark = rng.uniform(0, 50, size=SHAPE0[-2:]).astype(numpy.float32)
+    return flat, dark
+
+
+TRANSFORMS = {
+    "crop": {"crop": (20, 10, 40, 30)},
+    "channels": {"channels": [2, 0]},
+    "window": {"window": (200, 3000), "dtype": "uint8"},
+    "per channel window": {"channels": [1, 2], "window": [(100, 2000), (500, 4000)], "dtype": "uint8"},
+    "dtype": {"dtype": "uint8"},
+    "float": {"dtype": "float32", "window": (0, 4000)},
+    "crop and channels": {"crop": (32, 16, 48, 32), "channels": [1], "window": (0, 4095)},
+}
+
+
+@pytest.mark.parametrize("factor", [1, 2, 4])
+@pytest.mark.parametrize("name", TRANSFORMS)
+def test_matches_plain_numpy(kernel, level0, name, factor):
+    transform = TRANSFORMS[name]
+    expected = plain(level0, transform, factor)
+    result = transformed(level0, transform, factor)
+    assert result.dtype == expected.dtype
+    if result.dtype.kind == "f":
+        numpy.testing.assert_allclose(result, expected, atol=1e-5)
+    else:
+        # float32 against float64 can round the other way at .5
+        assert numpy.abs(result.astype(numpy.int64) - expected).max() <= 1
+
+
+@pytest.mark.parametrize("factor", [1, 2])
+def test_flat_and_dark_field(kernel, level0, fields, factor):
+    flat, dark = fields
+    transform = {
+        "crop": (8, 4, 64, 48),
+        "channels": [2, 1],
+        "flatfield": flat,
+        "darkfield": dark,
+        "window": (0, 6000),
+        "dtype": "uint8",
+    }
+    expected = plain(level0, transform, factor)
+    result = transformed(level0, transform, factor)
+    assert numpy.abs(result.astype(numpy.int64) - expected).max() <= 1
+
+
+def test_crop_offsets_on_levels(level0):
+    transform = {"crop": (20, 10, 40, 30)}
+    assert (transformed(level0, transform, 2) == level0[..., 10:40:2, 20:60:2]).all()
+    assert (transformed(level0, transform, 4) == level0[..., 8:40:4, 20:60:4]).all()
+    # a crop smaller than a pixel of the level still keeps one
+    assert transformed(level0, {"crop": (21, 11, 1, 1)}, 4).shape == (1, 3, 1, 1, 1)
+
+
+def test_no_op_returns_the_slice(level0):
+    level = dask.array.from_array(level0, chunks=(1, 1, 1, 16, 16))
+    assert apply_transform(level, {}) is level
@@ -0,0 +1,182 @@
+import time
+import threading
+
+import numpy
+import pytest
+import zarr
+import dask
+import dask.array
+from dask.delayed import Delayed
+
+from daskrw.writer import TiledImageWriter, _run_in_order
+
+
+def test_zip_container_sparse(tmp_path):
+    # chunks of only the fill value must not make the zip store delete keys
+    img = numpy.zeros((512, 512), dtype="uint8")
+    img[:256, :256] = 7
+    path = str(tmp_path / "sparse.ome.zarr.zip")
+
+    writer = TiledImageWriter(path, [(1, 1, 1, 512, 512)], container="zip", chunks=(1, 1, 1, 256, 256))
+    writer.write_tiled(dask.array.from_array(img, chunks=256))
+    writer.close()
+
+    store = zarr.ZipStore(path, mode="r")
+    try:
+        root = zarr.open_consolidated(store)
+        numpy.testing.assert_array_equal(root["0"][0, 0, 0], img)
+    finally:
+        store.close()
+
+
+def test_channel_stats_wide_and_float(tmp_path):
+    # percentiles are binned over the values seen, not the dtype's range
+    rng = numpy.random.default_rng(0)
+    for values in (
+        rng.integers(0, 5001, (1, 1, 1, 512, 512)).astype("uint32"),
+        (rng.random((1, 1, 1, 512, 512)) * 300).astype("float32"),
+    ):
+        writer = TiledImageWriter(str(tmp_path / f"{values.dtype}.ome.zarr"), [values.shape], channel_stats=True)
+        writer.write_tiled(dask.array.from_array(values, chunks=(1, 1, 1, 256, 256)))
+        stats = writer.channel_statistics[0]
+        writer.close()
+
+        span = float(values.max()) - float(values.min())
+        for p in ("0.1", "50", "99.9"):
+            expected = numpy.percentile(values, float(p))
+            assert abs(stats["percentiles"][p] - expected) < span / 500
+
+
+def test_downsampled_scales(tmp_path):
+    # the factors used are recorded, not guessed from the floored level sizes
+    path = str(tmp_path / "levels.ome.zarr")
+    writer = TiledImageWriter(path, None)
+    writer.write_downsampled(dask.array.zeros((1, 1, 1, 1001, 1001), dtype="uint8", chunks=256), 7)
+    writer.close()
+
+    datasets = zarr.open(path).attrs["multiscales"][0]["datasets"]
+    scales = [d["coordinateTransformations"][0]["scale"][-1] for d in datasets]
+    assert scales == [float(2**i) for i in range(7)]
+
+
+def test_memory_limit_delayed_levels(tmp_path):
+    # bands and levels are chained in the returned graph, run by the caller's scheduler
+    data = dask.array.from_array(numpy.arange(512 * 512, dtype="uint32").reshape(1, 1, 1, 512, 512), chunks=64)
+    path = str(tmp_path / "bands.ome.zarr")
+    writer = TiledImageWriter(path, None, memory_limit="64KB", chunks=(1, 1, 1, 64, 64))
+    store = writer.write_downsampled(data, 3, method="nearest", compute=False)
+    dask.compute(store, scheduler="sync")
+    writer.close()
+
+    root = zarr.open(path)
+    numpy.testing.assert_array_equal(root["0"][:], data.compute())
+    numpy.testing.assert_array_equal(root["2"][:], data[..., ::4, ::4].compute())
+
+
+def record(events: list, lock: threading.Lock, event):
+    with lock:
+        events.append(event)
+    # gives the other workers time to start tasks they shouldn't
+    time.sleep(0.002)
+
+
+@pytest.mark.parametrize("compute", [True, False])
+def test_memory_limit_bands_in_order(tmp_path, monkeypatch, compute):
+    # (level, band) of every chunk read and written, one row of chunks per band
+    events = []
+    lock = threading.Lock()
+
+    def read_source(block, block_info=None):
+        record(events, lock, (0, block_info[0]["chunk-location"][-2]))
+        return block
+
+    def chunk_event(key: str, written: bool):
+        # level/t/c/z/y/x
+        parts = key.split("/")
+        level, row = int(parts[-6]), int(parts[-2])
+        # level L-1 rows 2b and 2b + 1 are read for band b of level L
+        return (level, row) if written else (level + 1, row // 2)
+
+    def is_chunk(key: str) -> bool:
+        return not key.rsplit("/", 1)[-1].startswith(".")
+
+    getitems = zarr.storage.FSStore.getitems
+    setitems = zarr.storage.FSStore.setitems
+
+    def recording_getitems(store, keys, **kwargs):
+        for key in filter(is_chunk, keys):
+            record(events, lock, chunk_event(key, written=False))
+        return getitems(store, keys, **kwargs)
+
+    def recording_setitems(store, values):
+        for key in filter(is_chunk, values):
+            record(events, lock, chunk_event(key, written=True))
+        return setitems(store, values)
+
+    monkeypatch.setattr(zarr.storage.FSStore, "getitems", recording_getitems)
+    monkeypatch.setattr(zarr.storage.FSStore, "setitems", recording_setitems)
+
+    data = dask.array.from_array(numpy.arange(512 * 512, dtype="uint8").reshape(1, 1, 1, 512, 512), chunks=64)
+    data = data.map_blocks(read_source, dtype=data.dtype)
+    path = str(tmp_path / "bands.ome.zarr")
+    # half the limit is less than a row of chunks of any level, so each band is one row
+    writer = TiledImageWriter(path, None, memory_limit="8KB", chunks=(1, 1, 1, 64, 64))
+    with dask.config.set(scheduler="threads", num_workers=4):
+        store = writer.write_downsampled(data, 3, method="nearest", compute=compute)
+        if not compute:
+            dask.compute(store)
+    writer.close()
+
+    assert events == sorted(events)
+    assert set(events) == {(level, band) for level, bands in enumerate((8, 4, 2)) for band in range(bands)}
+
+
+def test_run_in_order_legacy_graphs():
+    # graphs of tuple tasks, as dask before 2024.12 builds them for arrays too
+    events = []
+    lock = threading.Lock()
+
+    def read(store: int, block: int):
+        record(events, lock, (store, "read", block))
+        return block
+
+    def write(store: int, value: int):
+        record(events, lock, (store, "write", value))
+        # reads of the next store, if not held back, would run meanwhile
+        time.sleep(0.02)
+
+    stores = []
+    for i in range(3):
+        dsk = {}
+        for block in range(4):
+            dsk[(f"read-{i}", block)] = (read, i, block)
+            dsk[(f"write-{i}", block)] = (write, i, (f"read-{i}", block))
+        dsk[f"store-{i}"] = (list, [(f"write-{i}", block) for block in range(4)])
+        stores.append(Delayed(f"store-{i}", dsk))
+
+    dask.compute(_run_in_order(stores, compute=False), scheduler="threads", num_workers=8)
+    assert [store for store, _, _ in events] == sorted(store for store, _, _ in events)
+    assert len(events) == 24
+
+
+def test_write_tiled_volumes(tmp_path):
+    rng = numpy.random.default_rng(0)
+    shape = (2, 2, 3, 64, 80)
+    volume = rng.integers(0, 255, shape, dtype="uint8")
+    path = str(tmp_path / "volume.ome.zarr")
+
+    writer = TiledImageWriter(path, [shape], chunks=(1, 1, 1, 32, 32))
+    # T, Z, Y, X of channel 0 in one write
+    writer.write_tiled(dask.array.from_array(volume[:, 0], chunks=(1, 1, 32, 32)), c=0)
+    # Z, Y, X stack of channel 1, frame 0
+    writer.write_tiled(dask.array.from_array(volume[0, 1], chunks=(1, 32, 32)), c=1, t=0)
+    # planes 1 and 2 of channel 1, frame 1, and then plane 0
+    writer.write_tiled(dask.array.from_array(volume[1:2, 1:2, 1:3], chunks=(1, 1, 1, 32, 32)), c=1, t=1, z=slice(1, 3))
+    writer.write_tiled(dask.array.from_array(volume[1, 1, 0], chunks=32), c=1, t=1, z=0)
+    writer.close()
+
+    numpy.testing.assert_array_equal(zarr.open(path, mode="r")["0"][:], volume)
+
+    writer = TiledImageWriter(str(tmp_path / "short.ome.zarr"), [shape])
+    with pytest.raises(ValueError):
+        writer.write_tiled(dask.array.from_array(volume[0, 0, :2]), c=0, t=0, z=slice(0, 3))